@@ -0,0 +1,55 @@
+'''
+Compares the event throughput of PyMouse on X11 with one sync per event (the
+default) and with events grouped by PyMouse.batch().
+
+Runs against a virtual display, install:  Xvfb, PyVirtualDisplay
+
+to start:
+
+    python benchmarks/x11_batch.py [events]
+'''
+
+from pymouse import PyMouse
+from pyvirtualdisplay import Display
+import sys
+import time
+
+SIZE = (1024, 768)
+
+
+def points(n):
+    '''A zig-zag of n distinct points, so no move is skipped as redundant.'''
+    return [(i % SIZE[0], (i // SIZE[0]) % SIZE[1] + i % 2) for i in range(n)]
+
+
+def unbatched(mouse, path):
+    for x, y in path:
+        mouse.move(x, y)
+
+
+def batched(mouse, path):
+    with mouse.batch():
+        for x, y in path:
+            mouse.move(x, y)
+
+
+def run(func, mouse, path):
+    mouse.move(SIZE[0] - 1, SIZE[1] - 1)
+    start = time.time()
+    func(mouse, path)
+    return len(path) / (time.time() - start)
+
+
+def main(n):
+    with Display(visible=0, size=SIZE):
+        mouse = PyMouse()
+        path = points(n)
+        one = run(unbatched, mouse, path)
+        many = run(batched, mouse, path)
+        print('events:              {0}'.format(n))
+        print('sync per event:      {0:.0f} events/sec'.format(one))
+        print('batch, single sync:  {0:.0f} events/sec'.format(many))
+        print('speedup:             {0:.1f}x'.format(many / one))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,59 @@
+'''
+Compares decoding synthetic RECORD reply buffers with python-xlib's EventField,
+one event at a time as the listeners used to, and with
+pymouse.x11_record.decode_events. No display is needed.
+
+to start:
+
+    python benchmarks/x11_record_decode.py [events per reply]
+'''
+
+from pymouse.x11_record import decode_events, _core
+from Xlib.protocol import event, rq
+from Xlib import X
+import sys
+import timeit
+
+
+class ProtocolDisplay(object):
+    '''Just enough of a protocol display for python-xlib to parse events.'''
+    event_classes = event.event_class
+
+    def get_resource_class(self, class_name, default=None):
+        return default
+
+
+def reply_data(n):
+    types = [X.MotionNotify, X.ButtonPress, X.ButtonRelease, X.KeyPress,
+             X.KeyRelease]
+    return b''.join(_core.pack(types[i % 5], 1, i & 0xffff, i, 0x100, 0x100,
+                               0, i % 800, i % 600, i % 800, i % 600, 0, 1)
+                    for i in range(n))
+
+
+def eventfield(data, display):
+    events = []
+    while len(data):
+        ev, data = rq.EventField(None).parse_binary_value(data, display,
+                                                          None, None)
+        events.append(ev)
+    return events
+
+
+def main(n):
+    display = ProtocolDisplay()
+    data = reply_data(n)
+    assert ([e.root_x for e in eventfield(data, display)] ==
+            [e.root_x for e in decode_events(data, display)])
+    repeat = max(1, 20000 // n)
+    old = min(timeit.repeat(lambda: eventfield(data, display),
+                            number=repeat, repeat=3)) / (repeat * n)
+    new = min(timeit.repeat(lambda: decode_events(data, display),
+                            number=repeat, repeat=3)) / (repeat * n)
+    print('events per reply:  {0}'.format(n))
+    print('EventField:        {0:.2f} us/event'.format(old * 1e6))
+    print('decode_events:     {0:.2f} us/event'.format(new * 1e6))
+    print('speedup:           {0:.1f}x'.format(old / new))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 64)
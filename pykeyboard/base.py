@@ -19,8 +19,12 @@ framework to be extended by each platform.
 """
 
 import time
+from collections.abc import Mapping
+from contextlib import contextmanager
 from threading import Thread
 
+from .hotkeys import Hotkeys
+
 class PyKeyboardMeta(object):
     """
     The base class for PyKeyboard. Represents basic operational model.
@@ -34,6 +38,19 @@ class PyKeyboardMeta(object):
         """Release a given character key."""
         raise NotImplementedError
 
+    @contextmanager
+    def batch(self, sync=True):
+        """
+        A context manager for grouping key events. Platforms which can queue
+        events (such as X11) will defer sending the events of press_key and
+        release_key within the block until it exits, and will then flush them
+        all at once. If sync is True, the exit will also wait for the events
+        to be processed.
+
+        This base implementation does no batching, events are sent as usual.
+        """
+        yield self
+
     def tap_key(self, character='', n=1, interval=0):
         """Press and release a given character key n times."""
         for i in range(n):
@@ -97,6 +114,25 @@ class PyKeyboardMeta(object):
             return True
         return False
 
+class ModifierView(Mapping):
+    """
+    The modifiers of a PyKeyboardEvent as a mapping from their names to
+    True or False, read from its modifier_state bit mask.
+    """
+    def __init__(self, listener):
+        self._listener = listener
+
+    def __getitem__(self, name):
+        listener = self._listener
+        return bool(listener.modifier_state & listener.modifier_bits[name])
+
+    def __iter__(self):
+        return iter(self._listener.modifier_bits)
+
+    def __len__(self):
+        return len(self._listener.modifier_bits)
+
+
 class PyKeyboardEventMeta(Thread):
     """
     The base class for PyKeyboard. Represents basic operational model.
@@ -141,18 +177,33 @@ class PyKeyboardEventMeta(Thread):
                      'Super': 0,  # X11 key, sometimes equivalent to Windows
                      'Windows': 0}  # Windows key, sometimes equivalent to Super
 
-    #Make the modifiers dictionary for individual states, setting all to off
-    modifiers = {}
-    for key in modifier_bits.keys():
-        modifiers[key] = False
+    #The Hotkeys registry fed by _tap, created by add_hotkey
+    hotkeys = None
+
+    #If True, tap() is given a single pymouse.base.InputEvent instead of its
+    #positional arguments (X11 only)
+    records = False
 
     def __init__(self, capture=False):
         Thread.__init__(self)
         self.daemon = True
         self.capture = capture
         self.state = True
+        #Each listener has its own copy of the bit masks, which
+        #configure_keys may assign, and its own modifier state
+        self.modifier_bits = dict(type(self).modifier_bits)
+        self.modifier_state = 0
+        self.modifier_keycodes = {}
         self.configure_keys()
 
+    @property
+    def modifiers(self):
+        """
+        A read-only view of the modifier state by name, computed when read:
+            self.modifiers['Shift']  # True if Shift is on
+        """
+        return ModifierView(self)
+
     def run(self):
         self.state = True
 
@@ -172,6 +223,43 @@ class PyKeyboardEventMeta(Thread):
         """
         pass
 
+    def tap_batch(self, events):
+        """
+        Subclass this method to receive, on X11, all the key events read at
+        once, after tap() has been called for each of them: a NumPy structured
+        array with the fields of pymouse.x11_record.XEvent if NumPy is
+        available, otherwise a list of XEvent tuples. The keycodes are in the
+        'detail' field and the modifier states in 'state'.
+        """
+        pass
+
+    def add_hotkey(self, hotkey, callback):
+        """
+        Call callback() whenever hotkey is typed, such as 'ctrl+shift+k' or the
+        sequence 'ctrl+x ctrl+s'; see pykeyboard.hotkeys.
+        """
+        if self.hotkeys is None:
+            self.hotkeys = Hotkeys(self)
+        self.hotkeys.add(hotkey, callback)
+
+    def remove_hotkey(self, hotkey, callback=None):
+        """Remove the bindings of hotkey, or only those to callback."""
+        if self.hotkeys is not None:
+            self.hotkeys.remove(hotkey, callback)
+
+    def _track_modifier(self, keycode, press):
+        """
+        Update modifier_state with a key event, on the platforms whose events
+        do not carry the state of the modifiers. The keycodes of the modifier
+        keys are in self.modifier_keycodes, by modifier name.
+        """
+        for name, keycodes in self.modifier_keycodes.items():
+            if keycode in keycodes:
+                if press:
+                    self.modifier_state |= self.modifier_bits[name]
+                else:
+                    self.modifier_state &= ~self.modifier_bits[name]
+
     def escape(self, event):
         """
         A function that defines when to stop listening; subclass this with your
@@ -181,9 +269,7 @@ class PyKeyboardEventMeta(Thread):
 
         The default behavior is to stop when the 'Esc' key is pressed.
 
-        If one wishes to use key combinations, or key series, one might be
-        interested in reading about Finite State Machines.
-        http://en.wikipedia.org/wiki/Deterministic_finite_automaton
+        For key combinations, or key series, see add_hotkey.
         """
         condition = None
         return event == condition
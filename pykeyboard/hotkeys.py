@@ -0,0 +1,247 @@
+#Copyright 2013 Paul Barton
+#
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Matching of hotkeys and key sequences for the keyboard listeners. A hotkey is
+written as steps separated by spaces, each step being a key with any modifiers
+joined by '+':
+    'ctrl+shift+k'  # a chord
+    'g g'  # a sequence
+    'ctrl+x ctrl+s'  # a sequence of chords
+
+All the bindings are compiled into a single trie over (keycode, modifier
+mask) steps, so each key press is matched with one dictionary lookup however
+many bindings there are.
+
+Bindings may be added and removed from any thread while the listener's thread
+feeds the key events: the compiled trie is replaced as a whole, never changed
+in place, so a key event is matched against either the old bindings or the new
+ones.
+"""
+
+import threading
+import time
+
+#Names accepted for the modifiers, besides the names in modifier_bits
+MODIFIER_ALIASES = {'ctrl': 'Control',
+                    'control': 'Control',
+                    'shift': 'Shift',
+                    'alt': 'Alt',
+                    'altgr': 'AltGr',
+                    'super': 'Super',
+                    'win': 'Windows',
+                    'windows': 'Windows',
+                    'cmd': 'Command',
+                    'command': 'Command',
+                    'meta': 'Meta',
+                    'hyper': 'Hyper'}
+
+
+class _Node(object):
+    __slots__ = ('children', 'callbacks')
+
+    def __init__(self):
+        self.children = {}
+        self.callbacks = []
+
+
+class Hotkeys(object):
+    """
+    A registry of hotkeys for a keyboard listener, which feeds it every key
+    event. Key names are resolved to keycodes by the listener's
+    lookup_character_keycode, if it has one; a number of two or more digits
+    is taken as a keycode. Modifier names are resolved by its modifier_bits.
+
+    The modifiers of a key event must be exactly those of the step, except
+    for the lock modifiers (Lock, Num_Lock and Scroll_Lock), which are
+    ignored.
+
+    A binding which is the beginning of a longer one fires as soon as it is
+    completed, and the longer one may still follow. If timeout is given, the
+    steps of a sequence must follow each other within timeout seconds.
+    """
+    def __init__(self, listener, timeout=None):
+        self.listener = listener
+        self.timeout = timeout
+        #Tuple of (hotkey, callback), replaced as a whole
+        self._bindings = ()
+        #(root node, compared modifier mask, modifier keycodes), replaced as a
+        #whole; None until compiled
+        self._trie = None
+        #The node reached by the key events so far, in the trie of root
+        self._root = None
+        self._node = None
+        self._last = 0
+        #Whether the last key fed was a step of some binding; None for a
+        #release or a modifier key, which neither advance nor abandon one
+        self.matched = None
+        #Held while changing the bindings, and while compiling them so that
+        #a change is not lost under a trie compiled from the bindings before
+        self._lock = threading.Lock()
+
+    def add(self, hotkey, callback):
+        """Call callback() each time hotkey is typed."""
+        with self._lock:
+            self._bindings += ((hotkey, callback),)
+            self._trie = None
+
+    def remove(self, hotkey, callback=None):
+        """Remove the bindings of hotkey, or only those to callback."""
+        with self._lock:
+            self._bindings = tuple(
+                (h, c) for h, c in self._bindings
+                if not (h == hotkey and callback in (None, c)))
+            self._trie = None
+
+    def invalidate(self):
+        """
+        Forget the compiled bindings, for instance because the keyboard
+        mapping has changed. They are compiled again at the next key event.
+        """
+        with self._lock:
+            self._trie = None
+
+    def compile(self):
+        """
+        Compile the bindings into the trie of steps, which is returned as
+        (root node, compared modifier mask, modifier keycodes).
+        """
+        listener = self.listener
+        with self._lock:
+            root = _Node()
+            for hotkey, callback in self._bindings:
+                node = root
+                for step in self.parse(hotkey):
+                    node = node.children.setdefault(step, _Node())
+                node.callbacks.append(callback)
+            #The eight modifiers of the state, but for the locks; the higher
+            #bits are the pointer buttons
+            bits = getattr(listener, 'modifier_bits', {})
+            locks = 0
+            for name in ('Lock', 'Num_Lock', 'Scroll_Lock'):
+                locks |= bits.get(name, 0)
+            mask = 0xff & ~locks
+            keycodes = set()
+            for codes in getattr(listener, 'modifier_keycodes', {}).values():
+                keycodes.update(codes)
+            trie = self._trie = (root, mask, frozenset(keycodes))
+        return trie
+
+    def _compiled(self):
+        trie = self._trie
+        if trie is None:
+            trie = self.compile()
+        return trie
+
+    def parse(self, hotkey):
+        """Returns the list of (keycode, modifier mask) steps of hotkey."""
+        steps = []
+        for step in hotkey.split():
+            names = step.split('+')
+            #A trailing empty name is the '+' key itself
+            if names[-1] == '' and len(names) > 1:
+                names = names[:-2] + ['+']
+            mask = 0
+            for name in names[:-1]:
+                mask |= self._modifier_mask(name)
+            steps.append((self._keycode(names[-1]), mask))
+        if not steps:
+            raise ValueError('empty hotkey: {0!r}'.format(hotkey))
+        return steps
+
+    def _modifier_mask(self, name):
+        bits = self.listener.modifier_bits
+        name = MODIFIER_ALIASES.get(name.lower(), name)
+        if not bits.get(name):
+            raise ValueError('unknown modifier: {0!r}'.format(name))
+        return bits[name]
+
+    def _keycode(self, name):
+        if name.isdigit() and len(name) > 1:
+            return int(name)
+        lookup = getattr(self.listener, 'lookup_character_keycode', None)
+        if lookup is None:
+            raise ValueError('key names cannot be resolved, use keycodes')
+        try:
+            keycode = lookup(name)
+        except KeyError:
+            keycode = 0
+        if not keycode:
+            raise ValueError('key not on the keyboard: {0!r}'.format(name))
+        return keycode
+
+    def first_steps(self):
+        """
+        Returns the (keycode, modifier mask) steps which begin the bindings,
+        the only ones which can complete or advance a binding from the start.
+        """
+        return list(self._compiled()[0].children)
+
+    @property
+    def pending(self):
+        """True while a sequence has been begun and may still be completed."""
+        trie = self._trie
+        if (trie is None or self._root is not trie[0] or
+                self._node is self._root):
+            return False
+        return (self.timeout is None or
+                time.monotonic() - self._last <= self.timeout)
+
+    @property
+    def deadline(self):
+        """
+        The time.monotonic() time at which the sequence under way will be
+        abandoned, or None if none is under way or it has no time limit.
+        """
+        if self.timeout is None or not self.pending:
+            return None
+        return self._last + self.timeout
+
+    def feed(self, keycode, state, press):
+        """
+        Advance the matching with a key event, calling the callbacks of the
+        bindings it completes. Sets matched.
+        """
+        self.matched = None
+        if not press:
+            return
+        root, mask, modifier_keycodes = self._compiled()
+        if keycode in modifier_keycodes:
+            return
+        if self._root is not root:
+            #The bindings have changed, start again from the new trie
+            self._root = self._node = root
+        step = (keycode, state & mask)
+        node = None
+        if self._node is not root:
+            if self.timeout is not None:
+                now = time.monotonic()
+                if now - self._last <= self.timeout:
+                    node = self._node.children.get(step)
+            else:
+                node = self._node.children.get(step)
+        if node is None:
+            #Not a continuation, but it may begin another binding
+            node = root.children.get(step)
+            if node is None:
+                self._node = root
+                self.matched = False
+                return
+        self.matched = True
+        if self.timeout is not None:
+            self._last = time.monotonic()
+        for callback in node.callbacks:
+            callback()
+        self._node = node if node.children else root
@@ -209,8 +209,27 @@ class PyKeyboardEvent(PyKeyboardEventMeta):
         while self.state:
             Quartz.CFRunLoopRunInMode(Quartz.kCFRunLoopDefaultMode, 5, False)
 
+    def configure_keys(self):
+        """
+        Assigns bit masks to the modifiers which have none in the base class,
+        for modifier_state.
+        """
+        self.modifier_bits['Alt'] = self.modifier_bits['Mod1']
+        self.modifier_bits['Command'] = self.modifier_bits['Mod4']
+
     def handler(self, proxy, type, event, refcon):
         key = Quartz.CGEventGetIntegerValueField(event, Quartz.kCGKeyboardEventKeycode)
+        flags = Quartz.CGEventGetFlags(event)
+        state = 0
+        for name, mask in (('Shift', Quartz.kCGEventFlagMaskShift),
+                           ('Control', Quartz.kCGEventFlagMaskControl),
+                           ('Alt', Quartz.kCGEventFlagMaskAlternate),
+                           ('Command', Quartz.kCGEventFlagMaskCommand)):
+            if flags & mask:
+                state |= self.modifier_bits[name]
+        self.modifier_state = state
+        if self.hotkeys is not None:
+            self.hotkeys.feed(key, state, type == Quartz.kCGEventKeyDown)
         if type == Quartz.kCGEventKeyDown:
             self.key_press(key)
         elif type == Quartz.kCGEventKeyUp:
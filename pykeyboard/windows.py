@@ -283,6 +283,12 @@ class PyKeyboardEvent(PyKeyboardEventMeta):
 
         #TODO: Need to universalize keys between platforms. ie. 'Menu' -> 'Alt'
 
+        #The hook's events do not carry the modifier state
+        state = self.modifier_state
+        self._track_modifier(keycode, press_bool)
+        if self.hotkeys is not None:
+            self.hotkeys.feed(keycode, state, press_bool)
+
         self.tap(keycode, character, press_bool)
 
     def _diagnostic(self, event):
@@ -326,4 +332,21 @@ class PyKeyboardEvent(PyKeyboardEventMeta):
         This does initial configuration for keyboard modifier state tracking
         including alias setting and keycode list construction.
         """
-        pass
+        self.modifier_keycodes = {
+            'Shift': [VK_SHIFT, VK_LSHIFT, VK_RSHIFT],
+            'Control': [VK_CONTROL, VK_LCONTROL, VK_RCONTROL],
+            'Alt': [VK_MENU, VK_LMENU, VK_RMENU],
+            'Windows': [VK_LWIN, VK_RWIN]}
+        self.modifier_bits['Alt'] = self.modifier_bits['Mod1']
+        self.modifier_bits['Windows'] = self.modifier_bits['Mod4']
+        self.modifier_bits['Super'] = self.modifier_bits['Mod4']
+
+    def lookup_character_keycode(self, character):
+        """
+        Returns the virtual key code of a letter or digit, or of a key named
+        as in its VK_ constant without the prefix, such as 'F5' or 'RETURN'.
+        Returns 0 for an unknown key.
+        """
+        if len(character) == 1 and character.isalnum():
+            return ord(character.upper())
+        return globals().get('VK_' + character.upper(), 0)
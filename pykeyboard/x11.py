@@ -13,239 +13,396 @@
 #You should have received a copy of the GNU General Public License
 #along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from Xlib.display import Display
+from contextlib import contextmanager
+
 from Xlib import X
 from Xlib.ext.xtest import fake_input
 from Xlib.ext import record
-from Xlib.protocol import rq
+import Xlib.error
 import Xlib.XK
 
-from .base import PyKeyboardMeta, PyKeyboardEventMeta
+from pymouse.x11_async import AsyncRecordListener
+from pymouse.pacing import paced
+from pymouse.x11_display import (get_display, release_display,
+                                 add_event_handler, process_events)
+from pymouse.x11_capture import CaptureProcess
+from pymouse.x11_hub import record_hub
+from pymouse.base import InputEvent
+from pymouse.session import KEY_PRESS, KEY_RELEASE
+from pymouse.x11_record import decode_events, event_batch
 
+from .base import PyKeyboardMeta, PyKeyboardEventMeta
+from .hotkeys import Hotkeys
+from .x11_keymap import keymap
+from .x11_keysyms import KEYSYM_GROUPS, special_X_keysyms, translation_dicts
+
+import itertools
+import os
+import select
+import threading
 import time
 import string
+import weakref
+
+
+#The names of the keypad keys, after 'KP_'
+_keypad = ['Space', 'Tab', 'Enter', 'F1', 'F2', 'F3', 'F4', 'Home',
+           'Left', 'Up', 'Right', 'Down', 'Prior', 'Page_Up', 'Next',
+           'Page_Down', 'End', 'Begin', 'Insert', 'Delete', 'Equal',
+           'Multiply', 'Add', 'Separator', 'Subtract', 'Decimal',
+           'Divide', 0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+
+
+class _Key(object):
+    """
+    A special key attribute of PyKeyboard, whose keycode is looked up by its
+    keysym name each time it is read. Assigning to it on an instance replaces
+    it for that instance.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance.lookup_character_keycode(self.name)
+
+
+class _Keys(object):
+    """
+    A collection of special keys of PyKeyboard, built by build(instance) when
+    first read and then kept by the instance as attribute.
+    """
+    def __init__(self, attribute, build):
+        self.attribute = attribute
+        self.build = build
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        try:
+            return instance.__dict__[self.attribute]
+        except KeyError:
+            keys = instance.__dict__[self.attribute] = self.build(instance)
+            return keys
+
+
+#The modifiers which change the character typed by a key; a set bit of a
+#state class means one of the modifiers in its group is on
+_STATE_CLASS_MODIFIERS = (('Shift', 'Shift_Lock'), ('Caps_Lock',),
+                          ('Num_Lock',), ('Mode_switch',))
+
+
+def _release(keymap, display):
+    keymap.release()
+    release_display(display)
+
+
+def _close_pipe(*fds):
+    for fd in fds:
+        os.close(fd)
 
-special_X_keysyms = {
-    ' ': "space",
-    '\t': "Tab",
-    '\n': "Return",  # for some reason this needs to be cr, not lf
-    '\r': "Return",
-    '\e': "Escape",
-    '!': "exclam",
-    '#': "numbersign",
-    '%': "percent",
-    '$': "dollar",
-    '&': "ampersand",
-    '"': "quotedbl",
-    '\'': "apostrophe",
-    '(': "parenleft",
-    ')': "parenright",
-    '*': "asterisk",
-    '=': "equal",
-    '+': "plus",
-    ',': "comma",
-    '-': "minus",
-    '.': "period",
-    '/': "slash",
-    ':': "colon",
-    ';': "semicolon",
-    '<': "less",
-    '>': "greater",
-    '?': "question",
-    '@': "at",
-    '[': "bracketleft",
-    ']': "bracketright",
-    '\\': "backslash",
-    '^': "asciicircum",
-    '_': "underscore",
-    '`': "grave",
-    '{': "braceleft",
-    '|': "bar",
-    '}': "braceright",
-    '~': "asciitilde"
-    }
 
 class PyKeyboard(PyKeyboardMeta):
     """
     The PyKeyboard implementation for X11 systems (mostly linux). This
     allows one to simulate keyboard input.
     """
+    #The keycodes for common special keys on the keyboard. These are integer
+    #values and can be passed to the other key methods. Generally speaking,
+    #these are non-printable codes. Each is looked up in the shared Keymap
+    #when it is read, so creating a PyKeyboard costs nothing for the keys
+    #which are never used.
+    #This set of keys compiled using the X11 keysymdef.h file as reference
+    #They comprise a relatively universal set of keys, though there may be
+    #exceptions which may come up for other OSes and vendors. Countless
+    #special cases exist which are not handled here, but may be extended.
+    #TTY Function Keys
+    backspace_key = _Key('BackSpace')
+    tab_key = _Key('Tab')
+    linefeed_key = _Key('Linefeed')
+    clear_key = _Key('Clear')
+    return_key = _Key('Return')
+    enter_key = return_key  # Because many keyboards call it "Enter"
+    pause_key = _Key('Pause')
+    scroll_lock_key = _Key('Scroll_Lock')
+    sys_req_key = _Key('Sys_Req')
+    escape_key = _Key('Escape')
+    delete_key = _Key('Delete')
+    #Modifier Keys
+    shift_l_key = _Key('Shift_L')
+    shift_r_key = _Key('Shift_R')
+    shift_key = shift_l_key  # Default Shift is left Shift
+    alt_l_key = _Key('Alt_L')
+    alt_r_key = _Key('Alt_R')
+    alt_key = alt_l_key  # Default Alt is left Alt
+    control_l_key = _Key('Control_L')
+    control_r_key = _Key('Control_R')
+    control_key = control_l_key  # Default Ctrl is left Ctrl
+    caps_lock_key = _Key('Caps_Lock')
+    capital_key = caps_lock_key  # Some may know it as Capital
+    shift_lock_key = _Key('Shift_Lock')
+    meta_l_key = _Key('Meta_L')
+    meta_r_key = _Key('Meta_R')
+    super_l_key = _Key('Super_L')
+    windows_l_key = super_l_key  # Cross-support; also it's printed there
+    super_r_key = _Key('Super_R')
+    windows_r_key = super_r_key  # Cross-support; also it's printed there
+    hyper_l_key = _Key('Hyper_L')
+    hyper_r_key = _Key('Hyper_R')
+    #Cursor Control and Motion
+    home_key = _Key('Home')
+    up_key = _Key('Up')
+    down_key = _Key('Down')
+    left_key = _Key('Left')
+    right_key = _Key('Right')
+    end_key = _Key('End')
+    begin_key = _Key('Begin')
+    page_up_key = _Key('Page_Up')
+    page_down_key = _Key('Page_Down')
+    prior_key = _Key('Prior')
+    next_key = _Key('Next')
+    #Misc Functions
+    select_key = _Key('Select')
+    print_key = _Key('Print')
+    print_screen_key = print_key  # Seems to be the same thing
+    snapshot_key = print_key  # Another name for printscreen
+    execute_key = _Key('Execute')
+    insert_key = _Key('Insert')
+    undo_key = _Key('Undo')
+    redo_key = _Key('Redo')
+    menu_key = _Key('Menu')
+    apps_key = menu_key  # Windows...
+    find_key = _Key('Find')
+    cancel_key = _Key('Cancel')
+    help_key = _Key('Help')
+    break_key = _Key('Break')
+    mode_switch_key = _Key('Mode_switch')
+    script_switch_key = _Key('script_switch')
+    num_lock_key = _Key('Num_Lock')
+    #Keypad Keys: Dictionary structure
+    keypad_keys = _Keys('keypad_keys', lambda self: dict(
+        (k, self.lookup_character_keycode('KP_' + str(k))) for k in _keypad))
+    numpad_keys = keypad_keys
+    #Function Keys/ Auxilliary Keys
+    #FKeys
+    function_keys = _Keys('function_keys', lambda self: [None] + [
+        self.lookup_character_keycode('F' + str(i)) for i in range(1, 36)])
+    #LKeys
+    l_keys = _Keys('l_keys', lambda self: [None] + [
+        self.lookup_character_keycode('L' + str(i)) for i in range(1, 11)])
+    #RKeys
+    r_keys = _Keys('r_keys', lambda self: [None] + [
+        self.lookup_character_keycode('R' + str(i)) for i in range(1, 16)])
+
+    #Unsupported keys from windows
+    kana_key = None
+    hangeul_key = None # old name - should be here for compatibility
+    hangul_key = None
+    junjua_key = None
+    final_key = None
+    hanja_key = None
+    kanji_key = None
+    convert_key = None
+    nonconvert_key = None
+    accept_key = None
+    modechange_key = None
+    sleep_key = None
+
     def __init__(self, display=None):
         PyKeyboardMeta.__init__(self)
-        self.display = Display(display)
-        self.display2 = Display(display)
-        self.special_key_assignment()
+        self.display = get_display(display)
+        #Shared with the other users of the connection
+        self.keymap = keymap(self.display)
+        self.keymap.acquire()
+        weakref.finalize(self, _release, self.keymap, self.display)
+        #Depth of nested batch() blocks; events are only synced at depth 0
+        self._batch_depth = 0
 
     def press_key(self, character=''):
         """
         Press a given character key. Also works with character keycodes as
         integers, but not keysyms.
         """
-        try:  # Detect uppercase or shifted character
-            shifted = self.is_char_shifted(character)
-        except AttributeError:  # Handle the case of integer keycode argument
-            fake_input(self.display, X.KeyPress, character)
-            self.display.sync()
-        else:
-            if shifted:
-                fake_input(self.display, X.KeyPress, self.shift_key)
-            keycode = self.lookup_character_keycode(character)
-            fake_input(self.display, X.KeyPress, keycode)
-            self.display.sync()
+        plan = self.keymap.plan(character)
+        for modifier in plan.modifiers:
+            fake_input(self.display, X.KeyPress, modifier)
+        fake_input(self.display, X.KeyPress, plan.keycode)
+        self._commit()
 
     def release_key(self, character=''):
         """
         Release a given character key. Also works with character keycodes as
         integers, but not keysyms.
         """
-        try:  # Detect uppercase or shifted character
-            shifted = self.is_char_shifted(character)
-        except AttributeError:  # Handle the case of integer keycode argument
-            fake_input(self.display, X.KeyRelease, character)
-            self.display.sync()
-        else:
-            if shifted:
-                fake_input(self.display, X.KeyRelease, self.shift_key)
-            keycode = self.lookup_character_keycode(character)
-            fake_input(self.display, X.KeyRelease, keycode)
+        plan = self.keymap.plan(character)
+        fake_input(self.display, X.KeyRelease, plan.keycode)
+        for modifier in reversed(plan.modifiers):
+            fake_input(self.display, X.KeyRelease, modifier)
+        self._commit()
+
+    @contextmanager
+    def batch(self, sync=True):
+        """
+        Queue the key events of press_key and release_key within the block and
+        send them to the X server in a single flush when the outermost block
+        exits. If sync is True, a single sync is then made so that the events
+        have been processed by the time the block returns. Blocks may be
+        nested.
+
+        As with PyMouse.batch, batching is per display connection: any other
+        user of the connection syncing or flushing it within the block sends
+        the requests queued so far.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                if sync:
+                    self.display.sync()
+                else:
+                    self.display.flush()
+
+    def _commit(self):
+        """
+        Sync the queued requests with the X server, unless a batch is open in
+        which case they stay queued until it closes.
+        """
+        if not self._batch_depth:
             self.display.sync()
 
+    def type_string(self, char_string, interval=0, window=256,
+                    window_time=0.05, progress=None):
+        """
+        A convenience method for typing longer strings of characters. Modifier
+        keys are pressed and released only when the next character needs
+        different ones.
+
+        Characters which are not on the keyboard, such as CJK or emoji, are
+        typed by binding them to spare keycodes, once for each string; if there
+        are too few spare keycodes, again whenever they run out.
+
+        char_string may also be any iterable of strings, such as a file or a
+        generator, which is typed as it is read. The key events are sent
+        without waiting on the server in between, which waits for the server
+        once window events have been sent or window_time seconds have passed
+        since it last did. If interval is given, the characters are typed
+        interval seconds apart on a fixed schedule.
+
+        If progress is given, it is called as progress(characters, seconds)
+        with the number of characters typed so far and the time taken, each
+        time the server has caught up.
+        """
+        keymap = self.keymap
+        display = self.display
+        if isinstance(char_string, str):
+            char_string = (char_string,)
+
+        def planned():
+            for text in char_string:
+                rest = text
+                while rest:
+                    #Bind the missing characters of the rest of the chunk at
+                    #once, and type up to the first which did not fit
+                    keymap.bind(rest)
+                    plans = keymap.plans()
+                    count = 0
+                    for char in rest:
+                        plan = plans.get(char)
+                        if plan is None:
+                            break
+                        yield plan
+                        count += 1
+                    if not count:  # Bound alone, or keycode 0 if it cannot be
+                        yield keymap.plan(rest[0])
+                        count = 1
+                    rest = rest[count:]
+
+        chars = planned()
+        held = ()
+        typed = pending = 0
+        start = synced = time.monotonic()
+        for first, due in paced(None, interval):
+            wanted = None if due is None else due - first
+            for plan in itertools.islice(chars, wanted):
+                if plan.modifiers != held:
+                    for modifier in reversed(held):
+                        fake_input(display, X.KeyRelease, modifier)
+                    for modifier in plan.modifiers:
+                        fake_input(display, X.KeyPress, modifier)
+                    pending += len(held) + len(plan.modifiers)
+                    held = plan.modifiers
+                fake_input(display, X.KeyPress, plan.keycode)
+                fake_input(display, X.KeyRelease, plan.keycode)
+                typed += 1
+                pending += 2
+                if (pending >= window or
+                        time.monotonic() - synced >= window_time):
+                    display.sync()
+                    pending = 0
+                    synced = time.monotonic()
+                    if progress is not None:
+                        progress(typed, synced - start)
+                if wanted is not None:
+                    wanted -= 1
+            if wanted != 0:  # The characters ran out
+                break
+            display.flush()
+        for modifier in reversed(held):
+            fake_input(display, X.KeyRelease, modifier)
+        display.sync()
+        if progress is not None:
+            progress(typed, time.monotonic() - start)
+
     def special_key_assignment(self):
         """
-        Determines the keycodes for common special keys on the keyboard. These
-        are integer values and can be passed to the other key methods.
-        Generally speaking, these are non-printable codes.
-        """
-        #This set of keys compiled using the X11 keysymdef.h file as reference
-        #They comprise a relatively universal set of keys, though there may be
-        #exceptions which may come up for other OSes and vendors. Countless
-        #special cases exist which are not handled here, but may be extended.
-        #TTY Function Keys
-        self.backspace_key = self.lookup_character_keycode('BackSpace')
-        self.tab_key = self.lookup_character_keycode('Tab')
-        self.linefeed_key = self.lookup_character_keycode('Linefeed')
-        self.clear_key = self.lookup_character_keycode('Clear')
-        self.return_key = self.lookup_character_keycode('Return')
-        self.enter_key = self.return_key  # Because many keyboards call it "Enter"
-        self.pause_key = self.lookup_character_keycode('Pause')
-        self.scroll_lock_key = self.lookup_character_keycode('Scroll_Lock')
-        self.sys_req_key = self.lookup_character_keycode('Sys_Req')
-        self.escape_key = self.lookup_character_keycode('Escape')
-        self.delete_key = self.lookup_character_keycode('Delete')
-        #Modifier Keys
-        self.shift_l_key = self.lookup_character_keycode('Shift_L')
-        self.shift_r_key = self.lookup_character_keycode('Shift_R')
-        self.shift_key = self.shift_l_key  # Default Shift is left Shift
-        self.alt_l_key = self.lookup_character_keycode('Alt_L')
-        self.alt_r_key = self.lookup_character_keycode('Alt_R')
-        self.alt_key = self.alt_l_key  # Default Alt is left Alt
-        self.control_l_key = self.lookup_character_keycode('Control_L')
-        self.control_r_key = self.lookup_character_keycode('Control_R')
-        self.control_key = self.control_l_key  # Default Ctrl is left Ctrl
-        self.caps_lock_key = self.lookup_character_keycode('Caps_Lock')
-        self.capital_key = self.caps_lock_key  # Some may know it as Capital
-        self.shift_lock_key = self.lookup_character_keycode('Shift_Lock')
-        self.meta_l_key = self.lookup_character_keycode('Meta_L')
-        self.meta_r_key = self.lookup_character_keycode('Meta_R')
-        self.super_l_key = self.lookup_character_keycode('Super_L')
-        self.windows_l_key = self.super_l_key  # Cross-support; also it's printed there
-        self.super_r_key = self.lookup_character_keycode('Super_R')
-        self.windows_r_key = self.super_r_key  # Cross-support; also it's printed there
-        self.hyper_l_key = self.lookup_character_keycode('Hyper_L')
-        self.hyper_r_key = self.lookup_character_keycode('Hyper_R')
-        #Cursor Control and Motion
-        self.home_key = self.lookup_character_keycode('Home')
-        self.up_key = self.lookup_character_keycode('Up')
-        self.down_key = self.lookup_character_keycode('Down')
-        self.left_key = self.lookup_character_keycode('Left')
-        self.right_key = self.lookup_character_keycode('Right')
-        self.end_key = self.lookup_character_keycode('End')
-        self.begin_key = self.lookup_character_keycode('Begin')
-        self.page_up_key = self.lookup_character_keycode('Page_Up')
-        self.page_down_key = self.lookup_character_keycode('Page_Down')
-        self.prior_key = self.lookup_character_keycode('Prior')
-        self.next_key = self.lookup_character_keycode('Next')
-        #Misc Functions
-        self.select_key = self.lookup_character_keycode('Select')
-        self.print_key = self.lookup_character_keycode('Print')
-        self.print_screen_key = self.print_key  # Seems to be the same thing
-        self.snapshot_key = self.print_key  # Another name for printscreen
-        self.execute_key = self.lookup_character_keycode('Execute')
-        self.insert_key = self.lookup_character_keycode('Insert')
-        self.undo_key = self.lookup_character_keycode('Undo')
-        self.redo_key = self.lookup_character_keycode('Redo')
-        self.menu_key = self.lookup_character_keycode('Menu')
-        self.apps_key = self.menu_key  # Windows...
-        self.find_key = self.lookup_character_keycode('Find')
-        self.cancel_key = self.lookup_character_keycode('Cancel')
-        self.help_key = self.lookup_character_keycode('Help')
-        self.break_key = self.lookup_character_keycode('Break')
-        self.mode_switch_key = self.lookup_character_keycode('Mode_switch')
-        self.script_switch_key = self.lookup_character_keycode('script_switch')
-        self.num_lock_key = self.lookup_character_keycode('Num_Lock')
-        #Keypad Keys: Dictionary structure
-        keypad = ['Space', 'Tab', 'Enter', 'F1', 'F2', 'F3', 'F4', 'Home',
-                  'Left', 'Up', 'Right', 'Down', 'Prior', 'Page_Up', 'Next',
-                  'Page_Down', 'End', 'Begin', 'Insert', 'Delete', 'Equal',
-                  'Multiply', 'Add', 'Separator', 'Subtract', 'Decimal',
-                  'Divide', 0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
-        self.keypad_keys = {k: self.lookup_character_keycode('KP_'+str(k)) for k in keypad}
-        self.numpad_keys = self.keypad_keys
-        #Function Keys/ Auxilliary Keys
-        #FKeys
-        self.function_keys = [None] + [self.lookup_character_keycode('F'+str(i)) for i in range(1,36)]
-        #LKeys
-        self.l_keys = [None] + [self.lookup_character_keycode('L'+str(i)) for i in range(1,11)]
-        #RKeys
-        self.r_keys = [None] + [self.lookup_character_keycode('R'+str(i)) for i in range(1,16)]
-
-        #Unsupported keys from windows
-        self.kana_key = None
-        self.hangeul_key = None # old name - should be here for compatibility
-        self.hangul_key = None
-        self.junjua_key = None
-        self.final_key = None
-        self.hanja_key = None
-        self.kanji_key = None
-        self.convert_key = None
-        self.nonconvert_key = None
-        self.accept_key = None
-        self.modechange_key = None
-        self.sleep_key = None
+        The special keys are class attributes of PyKeyboard, looked up when
+        they are read; there is nothing to assign.
+        """
+        pass
 
     def lookup_character_keycode(self, character):
         """
         Looks up the keysym for the character then returns the keycode mapping
         for that keysym.
         """
-        keysym = Xlib.XK.string_to_keysym(character)
-        if keysym == 0:
-            keysym = Xlib.XK.string_to_keysym(special_X_keysyms[character])
-        return self.display.keysym_to_keycode(keysym)
+        return self.keymap.plan(character).keycode
 
 
 class PyKeyboardEvent(PyKeyboardEventMeta):
     """
     The PyKeyboardEvent implementation for X11 systems (mostly linux). This
     allows one to listen for keyboard input.
+
+    Characters are translated with the keysym groups in keysym_groups; a
+    subclass may add others, e.g. KEYSYM_GROUPS + ('cyrillic', 'hebrew').
+
+    If hub is True, the events are received from the display's shared
+    RecordHub, on its thread, instead of from a RECORD context of the
+    listener's own. If process is True, they are recorded by a
+    pymouse.x11_capture.CaptureProcess instead, so that they are read from
+    the server on time even while this process is busy.
     """
-    def __init__(self, display=None):
-        self.display = Display(display)
-        self.display2 = Display(display)
-        self.ctx = self.display2.record_create_context(
-            0,
-            [record.AllClients],
-            [{
-                    'core_requests': (0, 0),
-                    'core_replies': (0, 0),
-                    'ext_requests': (0, 0, 0, 0),
-                    'ext_replies': (0, 0, 0, 0),
-                    'delivered_events': (0, 0),
-                    'device_events': (X.KeyPress, X.KeyRelease),
-                    'errors': (0, 0),
-                    'client_started': False,
-                    'client_died': False,
-            }])
+    keysym_groups = KEYSYM_GROUPS
+
+    def __init__(self, display=None, hub=False, process=False):
+        if hub and process:
+            raise ValueError('hub and process cannot both be used')
+        self.display = get_display(display)
+        weakref.finalize(self, release_display, self.display)
+        self.hub = None
+        self.capture_process = None
+        if process:
+            self.capture_process = CaptureProcess(display)
+        elif hub:
+            self.hub = record_hub(display)
+            self._stopped = threading.Event()
+        else:
+            #The RECORD context blocks its connection, so it needs its own
+            self.display2 = get_display(display, shared=False)
+            self.ctx = self._create_context()
 
         self.lock_meaning = None
 
@@ -258,6 +415,18 @@ class PyKeyboardEvent(PyKeyboardEventMeta):
         self.keypad_keycodes = []
         #self.configure_keys()
 
+        #Only build batches for a tap_batch of the subclass
+        self._batched = (getattr(self.tap_batch, '__func__', None) is not
+                         PyKeyboardEventMeta.tap_batch)
+
+        #Keycode and modifier state class -> character, see configure_keys
+        self._chars = None
+        self._state_offsets = None
+        #Rebuilt when the keyboard mapping changes; the shared keymap keeps
+        #the display's keysym cache up to date
+        keymap(self.display)
+        add_event_handler(self.display, X.MappingNotify, self._mapping_changed)
+
         #Direct access to the display's keycode-to-keysym array
         #print('Keycode to Keysym map')
         #for i in range(len(self.display._keymap_codes)):
@@ -265,9 +434,41 @@ class PyKeyboardEvent(PyKeyboardEventMeta):
 
         PyKeyboardEventMeta.__init__(self)
 
+    def _create_context(self):
+        """Returns the RECORD context for the key events on display2."""
+        return self.display2.record_create_context(
+            0,
+            [record.AllClients],
+            [{
+                    'core_requests': (0, 0),
+                    'core_replies': (0, 0),
+                    'ext_requests': (0, 0, 0, 0),
+                    'ext_replies': (0, 0, 0, 0),
+                    'delivered_events': (0, 0),
+                    'device_events': (X.KeyPress, X.KeyRelease),
+                    'errors': (0, 0),
+                    'client_started': False,
+                    'client_died': False,
+            }])
+
     def run(self):
         """Begin listening for keyboard input events."""
         self.state = True
+        if self.capture_process is not None:
+            if self.capture:
+                self.display.screen().root.grab_keyboard(True, X.GrabModeAsync, X.GrabModeAsync, X.CurrentTime)
+            self.capture_process.start((X.KeyPress, X.KeyRelease))
+            for data, times in self.capture_process.chunks():
+                process_events(self.display)
+                self._handle(data, decode_events(data), times)
+            return
+        if self.hub is not None:
+            if self.capture:
+                self.display.screen().root.grab_keyboard(True, X.GrabModeAsync, X.GrabModeAsync, X.CurrentTime)
+            self.hub.subscribe(self._record_event, (X.KeyPress, X.KeyRelease))
+            self._stopped.wait()
+            self.hub.unsubscribe(self._record_event)
+            return
         if self.capture:
             self.display2.screen().root.grab_keyboard(True, X.KeyPressMask | X.KeyReleaseMask, X.GrabModeAsync, X.GrabModeAsync, 0, 0, X.CurrentTime)
 
@@ -277,6 +478,16 @@ class PyKeyboardEvent(PyKeyboardEventMeta):
     def stop(self):
         """Stop listening for keyboard input events."""
         self.state = False
+        if self.capture_process is not None:
+            self.display.ungrab_keyboard(X.CurrentTime)
+            self.display.flush()
+            self.capture_process.stop()
+            return
+        if self.hub is not None:
+            self.display.ungrab_keyboard(X.CurrentTime)
+            self.display.flush()
+            self._stopped.set()
+            return
         self.display.record_disable_context(self.ctx)
         self.display.ungrab_keyboard(X.CurrentTime)
         self.display.flush()
@@ -286,37 +497,107 @@ class PyKeyboardEvent(PyKeyboardEventMeta):
 
     def handler(self, reply):
         """Upper level handler of keyboard events."""
-        data = reply.data
-        while len(data):
-            event, data = rq.EventField(None).parse_binary_value(data, self.display.display, None, None)
-            if self.escape(event):  # Quit if this returns True
-                self.stop()
-            else:
-                self._tap(event)
+        received = time.monotonic()
+        #Notice any change of the keyboard mapping before decoding the keys
+        process_events(self.display)
+        events = decode_events(reply.data, self.display.display)
+        self._handle(reply.data, events, [received] * len(events))
+
+    def _handle(self, data, events, times):
+        #times holds the receive time of each event
+        for event, received in zip(events, times):
+            self._record_event(event, received)
+        if self._batched:
+            self.tap_batch(event_batch(data, events))
+
+    def _record_event(self, event, received):
+        if self.escape(event):  # Quit if this returns True
+            self.stop()
+        else:
+            self._tap(event, received)
 
-    def _tap(self, event):
+    def _tap(self, event, received=None):
+        #received is the time.monotonic() time at which the event was read,
+        #now if it is not given
         keycode = event.detail
         press_bool = (event.type == X.KeyPress)
 
-        #Detect modifier states from event.state
-        for mod, bit in self.modifier_bits.items():
-            self.modifiers[mod] = event.state & bit
+        #The modifier states are those of event.state
+        state = self.modifier_state = event.state
 
-        if keycode in self.all_mod_keycodes:
-            keysym = self.display.keycode_to_keysym(keycode, 0)
-            character = self.keysym_to_string[keysym]
-        else:
-            character = self.lookup_char_from_keycode(keycode)
+        if self._chars is None:
+            self.configure_keys()
+        character = self._chars[self._state_offsets[state & 0xff] + keycode]
+
+        if self.hotkeys is not None:
+            self.hotkeys.feed(keycode, state, press_bool)
 
         #All key events get passed to self.tap()
-        self.tap(keycode,
-                 character,
-                 press=press_bool)
+        if self.records:
+            if received is None:
+                received = time.monotonic()
+            self.tap(InputEvent(event.time, received,
+                                KEY_PRESS if press_bool else KEY_RELEASE,
+                                event.root_x, event.root_y, keycode, state,
+                                character, event.root))
+        else:
+            self.tap(keycode, character, press_bool)
 
     def lookup_char_from_keycode(self, keycode):
         """
         This will conduct a lookup of the character or string associated with a
-        given keycode.
+        given keycode, in the current state of the modifiers.
+        """
+        if self._chars is None:
+            self.configure_keys()
+        return self._chars[self._state_offsets[self.modifier_state & 0xff] +
+                           keycode]
+
+    def _mapping_changed(self, event):
+        #The decode table is rebuilt, with the modifiers, at the next event
+        self._chars = None
+
+    def _build_decode_table(self):
+        """
+        Decodes every keycode in every class of modifier state, so that an
+        event is decoded with a table lookup: the character for keycode in
+        state (the state of the event) is
+            self._chars[self._state_offsets[state & 0xff] + keycode]
+        """
+        chars = [None] * (256 * (1 << len(_STATE_CLASS_MODIFIERS)))
+        info = self.display.display.info
+        for keycode in range(info.min_keycode, info.max_keycode + 1):
+            if keycode in self.all_mod_keycodes:
+                keysym = self.display.keycode_to_keysym(keycode, 0)
+                character = self.keysym_to_string.get(keysym)
+                for state_class in range(1 << len(_STATE_CLASS_MODIFIERS)):
+                    chars[state_class * 256 + keycode] = character
+                continue
+            for state_class in range(1 << len(_STATE_CLASS_MODIFIERS)):
+                chars[state_class * 256 + keycode] = self._decode(
+                    keycode, *[bool(state_class & (1 << bit)) for bit
+                               in range(len(_STATE_CLASS_MODIFIERS))])
+
+        #The class of each state of the core modifiers, as an offset
+        masks = [0] * len(_STATE_CLASS_MODIFIERS)
+        for bit, names in enumerate(_STATE_CLASS_MODIFIERS):
+            for name in names:
+                masks[bit] |= self.modifier_bits[name]
+        offsets = []
+        for state in range(256):
+            state_class = 0
+            for bit, mask in enumerate(masks):
+                if state & mask:
+                    state_class |= 1 << bit
+            offsets.append(state_class * 256)
+
+        self._state_offsets = offsets
+        self._chars = chars
+
+    def _decode(self, keycode, shift, caps_lock, num_lock, mode_switch):
+        """
+        Returns the character or string associated with a keycode in the given
+        state of the modifiers, or None.
         """
 
         #TODO: Logic should be strictly adapted from X11's src/KeyBind.c
@@ -327,13 +608,13 @@ class PyKeyboardEvent(PyKeyboardEventMeta):
         keysym_index = 0
         #TODO: Display's Keysyms per keycode count? Do I need this?
         #If the Num_Lock is on, and the keycode corresponds to the keypad
-        if self.modifiers['Num_Lock'] and keycode in self.keypad_keycodes:
-            if self.modifiers['Shift'] or self.modifiers['Shift_Lock']:
+        if num_lock and keycode in self.keypad_keycodes:
+            if shift:
                 keysym_index = 0
             else:
                 keysym_index = 1
 
-        elif not self.modifiers['Shift'] and self.modifiers['Caps_Lock']:
+        elif not shift and caps_lock:
             #Use the first keysym if uppercase or uncased
             #Use the uppercase keysym if the first is lowercase (second)
             keysym_index = 0
@@ -342,17 +623,17 @@ class PyKeyboardEvent(PyKeyboardEventMeta):
             if keysym & 0x7f == keysym and chr(keysym) in 'abcdefghijklmnopqrstuvwxyz':
                 keysym_index = 1
 
-        elif self.modifiers['Shift'] and self.modifiers['Caps_Lock']:
+        elif shift and caps_lock:
             keysym_index = 1
             keysym = self.display.keycode_to_keysym(keycode, keysym_index)
             #TODO: Support Unicode, Greek, and special latin characters
             if keysym & 0x7f == keysym and chr(keysym) in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ':
                 keysym_index = 0
 
-        elif self.modifiers['Shift'] or self.modifiers['Shift_Lock']:
+        elif shift:
             keysym_index = 1
 
-        if self.modifiers['Mode_switch']:
+        if mode_switch:
             keysym_index += 2
 
         #Finally! Get the keysym
@@ -362,15 +643,12 @@ class PyKeyboardEvent(PyKeyboardEventMeta):
         if keysym & 0x7f == keysym and self.ascii_printable(keysym):
             return chr(keysym)
 
+        #Unicode keysyms carry their code point
+        if keysym & 0xff000000 == 0x01000000:
+            return chr(keysym & 0xffffff)
+
         #If the character was not printable, look for its name
-        try:
-            char = self.keysym_to_string[keysym]
-        except KeyError:
-            print('Unable to determine character.')
-            print('Keycode: {0} KeySym {1}'.format(keycode, keysym))
-            return None
-        else:
-            return char
+        return self.keysym_to_string.get(keysym)
 
     def escape(self, event):
         if event.detail == self.lookup_character_keycode('Escape'):
@@ -393,8 +671,10 @@ class PyKeyboardEvent(PyKeyboardEventMeta):
         should generally allow the user to do the following lookups on any
         system:
             self.modifier_keycodes['Alt']  # All keycodes for Alt Masking
-            self.modifiers['Alt']  # State of Alt mask, non-zero if "ON"
+            self.modifiers['Alt']  # State of Alt mask, True if "ON"
         """
+        #Start again from the defaults, the dynamic assignments may move
+        self.modifier_bits = dict(type(self).modifier_bits)
         modifier_mapping = self.display.get_modifier_mapping()
         all_mod_keycodes = []
         mod_keycodes = {}
@@ -466,15 +746,17 @@ class PyKeyboardEvent(PyKeyboardEventMeta):
 
         #Acquire the full list of keypad keycodes
         self.keypad_keycodes = []
-        keypad = ['Space', 'Tab', 'Enter', 'F1', 'F2', 'F3', 'F4', 'Home',
-                  'Left', 'Up', 'Right', 'Down', 'Prior', 'Page_Up', 'Next',
-                  'Page_Down', 'End', 'Begin', 'Insert', 'Delete', 'Equal',
-                  'Multiply', 'Add', 'Separator', 'Subtract', 'Decimal',
-                  'Divide', '0', '1', '2', '3', '4', '5', '6', '7', '8', '9']
-        for keyname in keypad:
-            keypad_keycode = self.lookup_character_keycode('KP_' + keyname)
+        for keyname in _keypad:
+            keypad_keycode = self.lookup_character_keycode(
+                'KP_' + str(keyname))
             self.keypad_keycodes.append(keypad_keycode)
 
+        #Decode every key in every state of the modifiers ahead of the events
+        self._build_decode_table()
+        #The keycodes of the hotkeys may have moved too
+        if self.hotkeys is not None:
+            self.hotkeys.invalidate()
+
     def lookup_character_keycode(self, character):
         """
         Looks up the keysym for the character then returns the keycode mapping
@@ -487,23 +769,12 @@ class PyKeyboardEvent(PyKeyboardEventMeta):
 
     def get_translation_dicts(self):
         """
-        Returns dictionaries for the translation of keysyms to strings and from
-        strings to keysyms.
+        Returns read-only mappings for the translation of keysyms to strings
+        and from strings to keysyms, for the keysym groups named by the class
+        attribute keysym_groups. These are shared by all the instances using
+        the same groups.
         """
-        keysym_to_string_dict = {}
-        string_to_keysym_dict = {}
-        #XK loads latin1 and miscellany on its own; load latin2-4 and greek
-        Xlib.XK.load_keysym_group('latin2')
-        Xlib.XK.load_keysym_group('latin3')
-        Xlib.XK.load_keysym_group('latin4')
-        Xlib.XK.load_keysym_group('greek')
-
-        #Make a standard dict and the inverted dict
-        for string, keysym in Xlib.XK.__dict__.items():
-            if string.startswith('XK_'):
-                string_to_keysym_dict[string[3:]] = keysym
-                keysym_to_string_dict[keysym] = string[3:]
-        return keysym_to_string_dict, string_to_keysym_dict
+        return translation_dicts(self.keysym_groups)
 
     def ascii_printable(self, keysym):
         """
@@ -521,3 +792,188 @@ class PyKeyboardEvent(PyKeyboardEventMeta):
             return False
         else:
             return True
+
+
+class AsyncPyKeyboardEvent(AsyncRecordListener, PyKeyboardEvent):
+    """
+    A PyKeyboardEvent for asyncio applications. Rather than running in a thread
+    and calling tap(), it listens on the running event loop and its events are
+    read by asynchronous iteration, as ('tap', (keycode, character, press))
+    pairs, or ('tap', (event,)) pairs of pymouse.base.InputEvent tuples if
+    records is True:
+        async with AsyncPyKeyboardEvent() as key_events:
+            async for name, (keycode, character, press) in key_events:
+                ...
+    As with PyKeyboardEvent, the listener stops when escape() returns True.
+    """
+    def __init__(self, display=None, maxsize=0):
+        PyKeyboardEvent.__init__(self, display=display)
+        self._async_init(maxsize)
+
+    def tap(self, *args):
+        self._put(('tap', args))
+
+    async def next_key(self, character=None, press=True):
+        """
+        Wait for the next press (or release, if press is False) of the key for
+        character, or of any key if it is None. Returns (keycode, character,
+        press), or (event,) if records is True.
+        """
+        if self.records:
+            return await self.next_event(
+                'tap', lambda event: (event.press == press and
+                                      character in (None, event.character)))
+        return await self.next_event(
+            'tap', lambda k, c, p: p == press and character in (None, c))
+
+
+class PyKeyboardHotkeyEvent(PyKeyboardEvent):
+    """
+    A PyKeyboardEvent which receives only the key presses of its hotkeys (see
+    add_hotkey), for listening on a busy desktop at almost no cost. Instead
+    of recording every key event, it asks the X server for passive grabs of
+    the keys which begin each hotkey, on the root window and in every state
+    of Caps Lock and Num Lock, so the other key events never reach it. The
+    grabbed keys are no longer seen by the other applications.
+
+    While a sequence such as 'ctrl+x ctrl+s' is under way, the whole keyboard
+    is grabbed until the sequence is completed or abandoned, waiting at most
+    sequence_timeout seconds for each step. The grab is synchronous: the
+    server holds each key event back until the listener has matched it. A
+    key press which continues no hotkey ends the grab and is replayed to the
+    focused window, so that no typing is lost; the grab also ends when the
+    time is up. The key events taken as steps, and the modifier keys pressed
+    during the sequence, are not seen by the other applications.
+
+    tap() is called for the grabbed key events only. The (keycode, modifier
+    mask) steps which another application had already grabbed are listed in
+    failed_grabs.
+    """
+    def __init__(self, display=None, sequence_timeout=1.0):
+        PyKeyboardEvent.__init__(self, display=display)
+        self.hotkeys = Hotkeys(self, timeout=sequence_timeout)
+        self.failed_grabs = []
+        self._grabs_changed = True
+        self._keyboard_grabbed = False
+        #Wakes run() up for stop() and for a change of the hotkeys, so that
+        #it can wait on the connection without polling
+        self._wake, self._waker = os.pipe()
+        os.set_blocking(self._waker, False)
+        weakref.finalize(self, _close_pipe, self._wake, self._waker)
+
+    def _create_context(self):
+        #No RECORD context, the server sends only the grabbed keys
+        return None
+
+    def add_hotkey(self, hotkey, callback):
+        PyKeyboardEvent.add_hotkey(self, hotkey, callback)
+        self._grabs_changed = True
+        self._wake_up()
+
+    def remove_hotkey(self, hotkey, callback=None):
+        PyKeyboardEvent.remove_hotkey(self, hotkey, callback)
+        self._grabs_changed = True
+        self._wake_up()
+
+    def run(self):
+        """Begin listening for the hotkeys."""
+        self.state = True
+        display = self.display2
+        root = display.screen().root
+        try:
+            while self.state:
+                if self._grabs_changed:
+                    self._grab_keys(root)
+                #Events may have been read along with a reply already
+                if not display.pending_events():
+                    timeout = None
+                    deadline = self.hotkeys.deadline
+                    if deadline is not None:
+                        timeout = max(0, deadline - time.monotonic())
+                    if self._wake in select.select([display, self._wake], [],
+                                                   [], timeout)[0]:
+                        os.read(self._wake, 4096)
+                for i in range(display.pending_events()):
+                    event = display.next_event()
+                    if event.type in (X.KeyPress, X.KeyRelease):
+                        self._tap(event)
+                        self._hold_keyboard(root, event)
+                    elif event.type == X.MappingNotify:
+                        #Let the shared connection's handlers see it too, the
+                        #keycodes to grab may have changed
+                        process_events(self.display)
+                        self._chars = None
+                        self._grabs_changed = True
+                #The sequence may have run out of time
+                self._hold_keyboard(root)
+        finally:
+            root.ungrab_key(X.AnyKey, X.AnyModifier)
+            if self._keyboard_grabbed:
+                display.ungrab_keyboard(X.CurrentTime)
+                self._keyboard_grabbed = False
+            display.sync()
+            #The private connection is not used again
+            display.close()
+
+    def stop(self):
+        """Stop listening for the hotkeys."""
+        self.state = False
+        self._wake_up()
+
+    def _wake_up(self):
+        try:
+            os.write(self._waker, b'\0')
+        except BlockingIOError:  # Already woken up
+            pass
+
+    def _hold_keyboard(self, root, event=None):
+        """
+        Grab the keyboard only while a sequence is under way, and release the
+        key events it holds back, after event if one has just been matched.
+        """
+        display = self.display2
+        pending = self.hotkeys.pending
+        if self._keyboard_grabbed:
+            if event is not None and self.hotkeys.matched is False:
+                #Abandons the sequence: the grab ends and the server delivers
+                #the key press as if it had never been grabbed
+                display.allow_events(X.ReplayKeyboard, X.CurrentTime)
+                self._keyboard_grabbed = False
+            elif not pending:
+                display.ungrab_keyboard(X.CurrentTime)
+                self._keyboard_grabbed = False
+            elif event is not None:
+                #Taken as a step, or a release; on to the next key event
+                display.allow_events(X.SyncKeyboard, X.CurrentTime)
+            else:
+                return
+        elif pending:
+            #Frozen until the first key event is let through
+            root.grab_keyboard(True, X.GrabModeAsync, X.GrabModeSync,
+                               X.CurrentTime)
+            display.allow_events(X.SyncKeyboard, X.CurrentTime)
+            self._keyboard_grabbed = True
+        else:
+            return
+        display.flush()
+
+    def _grab_keys(self, root):
+        """Replace the passive grabs with those of the current hotkeys."""
+        self._grabs_changed = False
+        if self._chars is None:
+            self.configure_keys()
+        root.ungrab_key(X.AnyKey, X.AnyModifier)
+        locks = [0, X.LockMask]
+        if self.modifier_bits['Num_Lock']:
+            locks += [lock | self.modifier_bits['Num_Lock'] for lock in locks]
+        catchers = []
+        for keycode, mask in self.hotkeys.first_steps():
+            catcher = Xlib.error.CatchError(Xlib.error.BadAccess)
+            for lock in locks:
+                root.grab_key(keycode, mask | lock, True, X.GrabModeAsync,
+                              X.GrabModeAsync, onerror=catcher)
+            catchers.append(((keycode, mask), catcher))
+        #Wait for any errors
+        self.display2.sync()
+        self.failed_grabs = [step for step, catcher in catchers
+                             if catcher.get_error()]
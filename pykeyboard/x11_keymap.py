@@ -0,0 +1,308 @@
+#Copyright 2013 Paul Barton
+#
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+The plans for typing characters on an X display: for each character (or keysym
+name) the keycode to press, the modifier keys to hold down while pressing it,
+and the level of the keysym on the key. The plans are built from the server's
+keyboard mapping in one request and kept until a MappingNotify event says the
+mapping has changed.
+
+Characters which are not on the keyboard are typed by binding their keysyms to
+spare keycodes, those without any keysym. The spare keycodes are reused for
+the least recently typed characters when they run out, and given back their
+empty mapping once no PyKeyboard uses the Keymap.
+"""
+
+from collections import namedtuple, Counter, OrderedDict
+import threading
+import weakref
+
+from Xlib import X, XK
+
+from pymouse.x11_display import add_event_handler, process_events
+
+from .x11_keysyms import special_X_keysyms, translation_dicts
+
+#ISO_Level3_Shift is in the xkb group, which Xlib does not load by default
+XK.load_keysym_group('xkb')
+
+KeyPlan = namedtuple('KeyPlan', ['keycode', 'modifiers', 'level'])
+
+#The modifier keys selecting each level (index) of the core keyboard mapping
+LEVEL_MODIFIERS = (
+    (),
+    ('Shift_L',),
+    ('Mode_switch',),
+    ('Mode_switch', 'Shift_L'),
+    ('ISO_Level3_Shift',),
+    ('ISO_Level3_Shift', 'Shift_L'),
+    )
+
+#Display -> Keymap, so that all the users of a shared connection share one
+#table; a Keymap only holds a weak reference to its display, so that the
+#entry goes with the display
+_keymaps = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def keymap(display):
+    """Returns the Keymap of a display connection."""
+    with _lock:
+        table = _keymaps.get(display)
+        if table is None:
+            table = _keymaps[display] = Keymap(display)
+        return table
+
+
+def keysym_character(keysym):
+    """
+    Returns the character typed by a keysym, or None if it is not a printable
+    Latin-1 or Unicode keysym.
+    """
+    if 0x20 <= keysym <= 0x7e or 0xa0 <= keysym <= 0xff:
+        return chr(keysym)
+    if keysym & 0xff000000 == 0x01000000:
+        return chr(keysym & 0xffffff)
+    return None
+
+
+class Keymap(object):
+    """
+    Maps characters and keysym names to KeyPlan tuples. Characters are found
+    on the lowest level and keycode which produce them, or bound to a spare
+    keycode; a character which cannot be bound, or a keysym name which is not
+    on the keyboard, gets keycode 0 as X gives for unmapped keysyms.
+    """
+    def __init__(self, display):
+        self._display = weakref.ref(display)
+        self.keysym_to_string, self.string_to_keysym = translation_dicts()
+        self._plans = None
+        self._keysym_plans = None
+        #Character -> spare keycode, the least recently used first
+        self._bound = OrderedDict()
+        #The spare keycodes which are not bound
+        self._spare = []
+        self._width = 2
+        #(first keycode, count) of the MappingNotify events for our own changes
+        self._expected = Counter()
+        self._users = 0
+        add_event_handler(display, X.MappingNotify, self.invalidate)
+
+    @property
+    def display(self):
+        """The display connection, while it is alive."""
+        return self._display()
+
+    def invalidate(self, event=None):
+        """Forget the plans, they will be built again when needed."""
+        if event is not None and event.request == X.MappingKeyboard:
+            #Keep python-xlib's own keysym to keycode cache up to date too
+            self.display.refresh_keyboard_mapping(event)
+            key = event.first_keycode, event.count
+            if self._expected[key]:  # Our own binding, already planned
+                self._expected[key] -= 1
+                return
+        self._plans = None
+
+    def acquire(self):
+        """Count a user of the Keymap, which must later call release."""
+        self._users += 1
+
+    def release(self):
+        """
+        Give up the use of the Keymap; the last user restores the spare
+        keycodes.
+        """
+        self._users -= 1
+        if self._users <= 0 and self._bound:
+            self.restore()
+
+    def plans(self):
+        """
+        Returns the dictionary of the plans known so far, after checking for a
+        change of the mapping. Characters missing from it should be looked up
+        with plan().
+        """
+        process_events(self.display)
+        plans = self._plans
+        if plans is None:
+            plans = self._build()
+        return plans
+
+    def plan(self, character):
+        """
+        Returns the KeyPlan for a character, a keysym name such as 'Return',
+        or an integer keycode. Raises KeyError for an unknown name.
+        """
+        plans = self.plans()
+        try:
+            return plans[character]
+        except KeyError:
+            pass
+        if isinstance(character, int):
+            plan = KeyPlan(character, (), 0)
+        else:
+            keysym = self._string_to_keysym(character)
+            plan = self._keysym_plans.get(keysym)
+            if plan is None and len(character) == 1:
+                self.bind(character)
+                plan = self._plans.get(character)
+            if plan is None:
+                plan = KeyPlan(0, (), 0)
+        self._plans[character] = plan
+        return plan
+
+    def bind(self, characters):
+        """
+        Bind the characters which are not on the keyboard to spare keycodes,
+        with a single ChangeKeyboardMapping request for each run of
+        consecutive keycodes. The characters already bound become the most
+        recently used. If there are too few spare keycodes, only the first
+        characters are bound.
+
+        Before a keycode bound to another character is reused, the server is
+        waited on, so that the key events already sent for it are not
+        translated with the new mapping.
+        """
+        plans = self.plans()
+        bound = self._bound
+        #In order, so that the first characters are bound first
+        wanted = dict.fromkeys(characters)
+        for character in wanted:
+            if character in bound:
+                bound.move_to_end(character)
+        changes = {}
+        evicted = False
+        for character in wanted:
+            if character in plans or len(character) != 1:
+                continue
+            keysym = self._string_to_keysym(character)
+            if self._spare:
+                keycode = self._spare.pop()
+            else:
+                oldest = next(iter(bound), None)
+                if oldest is None or oldest in wanted:
+                    break
+                keycode = bound.pop(oldest)
+                del plans[oldest]
+                self._keysym_plans.pop(self._string_to_keysym(oldest), None)
+                evicted = True
+            bound[character] = keycode
+            plans[character] = self._keysym_plans[keysym] = KeyPlan(keycode,
+                                                                    (), 0)
+            changes[keycode] = keysym
+        if evicted:
+            self.display.sync()
+        self._change(changes)
+
+    def restore(self):
+        """Remove the keysyms bound to the spare keycodes."""
+        plans = self.plans()
+        changes = {}
+        for character, keycode in self._bound.items():
+            plans.pop(character, None)
+            self._keysym_plans.pop(self._string_to_keysym(character), None)
+            changes[keycode] = 0
+        self._bound.clear()
+        self._spare.extend(changes)
+        self._change(changes)
+        self.display.flush()
+
+    def _change(self, changes):
+        #Requests on a connection are processed in order, so the key events
+        #already sent are typed with the mapping they were planned for
+        keycodes = sorted(changes)
+        padding = [0] * (self._width - 2)
+        while keycodes:
+            run = 1
+            while (run < len(keycodes) and
+                    keycodes[run] == keycodes[0] + run):
+                run += 1
+            rows = [[changes[keycode]] * 2 + padding
+                    for keycode in keycodes[:run]]
+            self.display.change_keyboard_mapping(keycodes[0], rows)
+            self._expected[keycodes[0], run] += 1
+            keycodes = keycodes[run:]
+
+    def _string_to_keysym(self, character):
+        string_to_keysym = self.string_to_keysym
+        if character in string_to_keysym:
+            return string_to_keysym[character]
+        if len(character) == 1:
+            if 0x20 <= ord(character) <= 0x7e or 0xa0 <= ord(character) <= 0xff:
+                return ord(character)
+            if character not in special_X_keysyms:
+                return 0x01000000 + ord(character)
+        return string_to_keysym[special_X_keysyms[character]]
+
+    def _build(self):
+        info = self.display.display.info
+        first = info.min_keycode
+        mapping = self.display.get_keyboard_mapping(
+            first, info.max_keycode - first + 1)
+        keysym_to_string = self.keysym_to_string
+        self._width = max(2, len(mapping[0]) if mapping else 0)
+
+        #Keycodes without keysyms are spare, and so are those still holding a
+        #character bound by us
+        bound = OrderedDict()
+        for character, keycode in self._bound.items():
+            keysyms = mapping[keycode - first]
+            if keysyms and keysyms[0] == self._string_to_keysym(character):
+                bound[character] = keycode
+        self._bound = bound
+        self._spare = [first + offset for offset, keysyms in enumerate(mapping)
+                       if not any(keysyms)]
+
+        #The modifier keys are those with the keysym on their first level
+        modifier_keycodes = {}
+        for offset, keysyms in enumerate(mapping):
+            if keysyms and keysyms[0]:
+                modifier_keycodes.setdefault(keysyms[0], first + offset)
+
+        plans = {}
+        keysym_plans = {}
+        #Lower levels first, so that they are preferred; the modifier names
+        #are looked up in Xlib, as the tables lack the xkb group
+        for level, names in enumerate(LEVEL_MODIFIERS):
+            try:
+                modifiers = tuple(modifier_keycodes[XK.string_to_keysym(name)]
+                                  for name in names)
+            except KeyError:  # This level cannot be reached
+                continue
+            for offset, keysyms in enumerate(mapping):
+                if len(keysyms) <= level or not keysyms[level]:
+                    continue
+                keysym = keysyms[level]
+                if keysym in keysym_plans:
+                    continue
+                plan = keysym_plans[keysym] = KeyPlan(first + offset,
+                                                      modifiers, level)
+                character = keysym_character(keysym)
+                if character is not None:
+                    plans.setdefault(character, plan)
+                name = keysym_to_string.get(keysym)
+                if name is not None:
+                    plans.setdefault(name, plan)
+
+        #Control characters typed with keys such as Return and Tab
+        for character, name in special_X_keysyms.items():
+            if character not in plans and name in plans:
+                plans[character] = plans[name]
+
+        self._keysym_plans = keysym_plans
+        self._plans = plans
+        return plans
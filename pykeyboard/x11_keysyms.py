@@ -0,0 +1,140 @@
+#Copyright 2013 Paul Barton
+#
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Tables for translating between X keysyms and the names and characters used by
+PyKeyboard and PyKeyboardEvent.
+"""
+
+import importlib
+import marshal
+import os
+import threading
+import types
+
+import Xlib
+
+#The keysym groups translated by PyKeyboardEvent, beyond the miscellany and
+#latin1 groups which are always included
+KEYSYM_GROUPS = ('latin2', 'latin3', 'latin4', 'greek')
+
+#If this names a directory, the translation tables are kept there between
+#processes; set it before the first PyKeyboardEvent is created
+KEYSYM_CACHE_DIR = os.environ.get('PYUSERINPUT_KEYSYM_CACHE')
+
+#groups -> (keysym_to_string, string_to_keysym), shared by all instances
+_translation_dicts = {}
+_translation_lock = threading.Lock()
+
+
+def translation_dicts(groups=KEYSYM_GROUPS):
+    """
+    Returns read-only mappings for the translation of keysyms to strings and
+    from strings to keysyms, covering the miscellany and latin1 keysym groups
+    along with groups (names of the modules in Xlib.keysymdef, such as
+    'cyrillic' or 'hebrew'). The tables are built once per process for each
+    set of groups. Unicode keysyms (0x1000000 + code point) are not listed;
+    PyKeyboardEvent translates them directly.
+    """
+    groups = tuple(groups)
+    with _translation_lock:
+        tables = _translation_dicts.get(groups)
+        if tables is None:
+            keysym_to_string, string_to_keysym = _load_tables(groups)
+            tables = (types.MappingProxyType(keysym_to_string),
+                      types.MappingProxyType(string_to_keysym))
+            _translation_dicts[groups] = tables
+        return tables
+
+
+def _load_tables(groups):
+    path = None
+    if KEYSYM_CACHE_DIR:
+        path = os.path.join(KEYSYM_CACHE_DIR, 'keysyms-{0}-{1}.marshal'.format(
+            '.'.join(str(i) for i in Xlib.__version__), '-'.join(groups)))
+        try:
+            with open(path, 'rb') as readfile:
+                return marshal.load(readfile)
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+    tables = _build_tables(groups)
+    if path is not None:
+        #Written aside and renamed, so that a reader never sees half a table;
+        #the cache is only an optimization and failing to write it is harmless
+        temporary = '{0}.{1}'.format(path, os.getpid())
+        try:
+            with open(temporary, 'wb') as writefile:
+                marshal.dump(tables, writefile)
+            os.replace(temporary, path)
+        except OSError:
+            pass
+    return tables
+
+
+def _build_tables(groups):
+    #Read the group modules directly rather than Xlib.XK's globals, which
+    #would hold whatever groups anyone has loaded so far. Names are taken in
+    #the order Xlib.XK.load_keysym_group would add them, so that a keysym
+    #with several names translates to the same one
+    string_to_keysym = {}
+    for group in ('miscellany', 'latin1') + groups:
+        module = importlib.import_module('Xlib.keysymdef.' + group)
+        for name in sorted(module.__dict__):
+            if name.startswith('XK_'):
+                string_to_keysym[name[3:]] = module.__dict__[name]
+    keysym_to_string = dict((keysym, name) for name, keysym
+                            in string_to_keysym.items())
+    return keysym_to_string, string_to_keysym
+
+
+special_X_keysyms = {
+    ' ': "space",
+    '\t': "Tab",
+    '\n': "Return",  # for some reason this needs to be cr, not lf
+    '\r': "Return",
+    '\e': "Escape",
+    '!': "exclam",
+    '#': "numbersign",
+    '%': "percent",
+    '$': "dollar",
+    '&': "ampersand",
+    '"': "quotedbl",
+    '\'': "apostrophe",
+    '(': "parenleft",
+    ')': "parenright",
+    '*': "asterisk",
+    '=': "equal",
+    '+': "plus",
+    ',': "comma",
+    '-': "minus",
+    '.': "period",
+    '/': "slash",
+    ':': "colon",
+    ';': "semicolon",
+    '<': "less",
+    '>': "greater",
+    '?': "question",
+    '@': "at",
+    '[': "bracketleft",
+    ']': "bracketright",
+    '\\': "backslash",
+    '^': "asciicircum",
+    '_': "underscore",
+    '`': "grave",
+    '{': "braceleft",
+    '|': "bar",
+    '}': "braceright",
+    '~': "asciitilde"
+    }
@@ -21,13 +21,52 @@ As the base file, this provides a rough operational model along with the
 framework to be extended by each platform.
 """
 
+from collections import namedtuple
+from contextlib import contextmanager
 from threading import Thread
 
+from .delivery import EventQueue, DROP_OLDEST
+from .session import BUTTON_PRESS, KEY_PRESS
+from .pacing import paced
+from . import trajectory
+
 
 class ScrollSupportError(Exception):
     pass
 
 
+#A display output, with its offset and size in pixels in the screen's
+#coordinates; name is None where the platform does not provide one
+Monitor = namedtuple('Monitor', ['x', 'y', 'width', 'height', 'primary',
+                                 'name'])
+
+
+class InputEvent(namedtuple('InputEvent', ['time', 'received', 'type', 'x',
+                                           'y', 'detail', 'state',
+                                           'character', 'root'])):
+    """
+    An input event, as given to the listeners whose records attribute is
+    True:
+        time        the server's timestamp, in milliseconds
+        received    time.monotonic() when the reply holding the event was
+                    read from the server
+        type        MOTION, BUTTON_PRESS, BUTTON_RELEASE, KEY_PRESS or
+                    KEY_RELEASE from pymouse.session
+        x, y        pointer position in the screen's coordinates
+        detail      the PyMouse button number or the keycode (0 for motion)
+        state       modifier state bit mask
+        character   the character of a key event, or None
+        root        the root window id
+    Sorting events orders them by server time.
+    """
+    __slots__ = ()
+
+    @property
+    def press(self):
+        """True for a button or key press."""
+        return self.type in (BUTTON_PRESS, KEY_PRESS)
+
+
 class PyMouseMeta(object):
 
     def press(self, x, y, button=1):
@@ -87,6 +126,56 @@ class PyMouseMeta(object):
 
         raise NotImplementedError
 
+    def move_path(self, path, duration=0, rate=125, steps=None):
+        """
+        Move the mouse along a path, taking duration seconds. The path may be
+        a sequence of (x, y) points, or one of the paths from the trajectory
+        module (Polyline, Bezier, MinimumJerk).
+
+        All the intermediate points are computed up front: steps of them if
+        given, otherwise one per 1/rate seconds of the duration. They are then
+        sent on a fixed schedule, grouping the points that are due together
+        into a single batch. With no duration, the points are sent as fast as
+        possible.
+        """
+
+        points, period = trajectory.plan(path, duration, rate, steps)
+        for start, stop in paced(len(points), period):
+            with self.batch(sync=False):
+                for x, y in points[start:stop]:
+                    self.move(x, y)
+
+    def drag_path(self, path, duration=0, rate=125, steps=None, button=1):
+        """
+        Drag the mouse along a path: the button is pressed at the start of the
+        path, held during the motion, and released at its end. The arguments
+        are the same as for move_path.
+        """
+
+        points, period = trajectory.plan(path, duration, rate, steps)
+        self.press(points[0][0], points[0][1], button)
+        for start, stop in paced(len(points), period):
+            with self.batch(sync=False):
+                for x, y in points[start:stop]:
+                    self.move(x, y)
+        self.release(points[-1][0], points[-1][1], button)
+
+    @contextmanager
+    def batch(self, sync=True):
+        """
+        A context manager for grouping mouse events. Platforms which can queue
+        events (such as X11) will defer sending the events generated within the
+        block until it exits, and will then flush them all at once. If sync is
+        True, the exit will also wait for the events to be processed.
+
+        This base implementation does no batching, events are sent as usual.
+            with mouse.batch():
+                mouse.click(10, 10)
+                mouse.drag(50, 50)
+        """
+
+        yield self
+
     def position(self):
         """
         Get the current mouse position in pixels.
@@ -103,17 +192,81 @@ class PyMouseMeta(object):
 
         raise NotImplementedError
 
+    def monitors(self):
+        """
+        Get the layout of the monitors making up the screen, as a list of
+        Monitor tuples. This base implementation treats the whole screen as a
+        single primary monitor.
+        """
+
+        width, height = self.screen_size()
+        return [Monitor(0, 0, width, height, True, None)]
+
+    def monitor_at(self, x, y):
+        """
+        Get the Monitor showing the point x, y, or None if the point is not on
+        any monitor.
+        """
+
+        for monitor in self.monitors():
+            if (monitor.x <= x < monitor.x + monitor.width and
+                    monitor.y <= y < monitor.y + monitor.height):
+                return monitor
+        return None
+
+    def clamp(self, x, y):
+        """
+        Get the point nearest to x, y which is on one of the monitors, which is
+        where the pointer would end up if moved to x, y.
+        Returns a tuple of 2 integers
+        """
+
+        best = None
+        for monitor in self.monitors():
+            cx = min(max(x, monitor.x), monitor.x + monitor.width - 1)
+            cy = min(max(y, monitor.y), monitor.y + monitor.height - 1)
+            distance = (cx - x) ** 2 + (cy - y) ** 2
+            if not distance:
+                return cx, cy
+            if best is None or distance < best[0]:
+                best = distance, cx, cy
+        if best is None:
+            return x, y
+        return best[1], best[2]
+
 
 class PyMouseEventMeta(Thread):
-    def __init__(self, capture=False, capture_move=False):
+    #If True, click() and move() are given a single InputEvent instead of
+    #their positional arguments (X11 only)
+    records = False
+
+    def __init__(self, capture=False, capture_move=False, queue_size=None,
+                 overflow=DROP_OLDEST, consumer=True):
+        """
+        By default, click() and move() are called directly by the listening
+        thread. If queue_size is given, the events are instead put in an
+        EventQueue of that size (see pymouse.delivery for the overflow
+        policies) so that slow handlers do not hold up the listener. The queue
+        is then drained by a consumer thread calling click() and move(), or,
+        if consumer is False, by iterating over events().
+        """
         Thread.__init__(self)
         self.daemon = True
         self.capture = capture
         self.capture_move = capture_move
         self.state = True
+        self.queue = None
+        if queue_size is not None:
+            self.queue = EventQueue(queue_size, overflow)
+            if consumer:
+                deliver = Thread(target=self._deliver)
+                deliver.daemon = True
+                deliver.start()
 
     def stop(self):
         self.state = False
+        if self.queue is not None:
+            self.queue.close()
 
     def click(self, x, y, button, press):
         """Subclass this method with your click event handler"""
@@ -122,3 +275,56 @@ class PyMouseEventMeta(Thread):
     def move(self, x, y):
         """Subclass this method with your move event handler"""
         pass
+
+    def mouse_batch(self, events):
+        """
+        Subclass this method to receive, on X11, all the button and motion
+        events read at once: a NumPy structured array with the fields of
+        pymouse.x11_record.XEvent if NumPy is available, otherwise a list of
+        XEvent tuples. The 'detail' field holds the X11 button number, in
+        which 2 is the middle button and 3 the right one. click() and move()
+        are still called for each event if they are overridden.
+        """
+        pass
+
+    def events(self, timeout=None):
+        """
+        Iterate over the queued events as (name, args) pairs, such as
+        ('click', (x, y, button, press)) or ('move', (x, y)), until the
+        listener stops. Only for listeners with a queue and no consumer.
+        """
+        while True:
+            items = self.queue.drain(timeout)
+            if items is None:
+                return
+            for item in items:
+                yield item
+
+    def _deliver(self):
+        """The consumer thread, passing queued events to their handlers."""
+        for name, args in self.events():
+            getattr(self, name)(*args)
+
+    def _click(self, x, y, button, press):
+        """Called by the platform listener for each button event."""
+        if self.queue is None:
+            self.click(x, y, button, press)
+        else:
+            self.queue.put(('click', (x, y, button, press)))
+
+    def _move(self, x, y):
+        """Called by the platform listener for each motion event."""
+        if self.queue is None:
+            self.move(x, y)
+        else:
+            self.queue.put(('move', (x, y)), motion=True)
+
+    def _record(self, name, event):
+        """
+        Called by the platform listener for each event, as an InputEvent for
+        the handler of that name, if records is True.
+        """
+        if self.queue is None:
+            getattr(self, name)(event)
+        else:
+            self.queue.put((name, (event,)), motion=name == 'move')
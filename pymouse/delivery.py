@@ -0,0 +1,103 @@
+#Copyright 2013 Paul Barton
+#
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+A bounded event queue between the thread listening for input events and the
+code consuming them, so that a slow consumer does not stall the listener.
+"""
+
+from collections import deque
+import threading
+
+DROP_OLDEST = 'drop-oldest'
+BLOCK = 'block'
+COALESCE_MOTION = 'coalesce-motion'
+
+
+class EventQueue(object):
+    """
+    A bounded queue of (name, args) event items, filled by a listener and
+    emptied in whole drain cycles by a consumer. When the queue is full, the
+    overflow policy decides what happens to a new item:
+        'drop-oldest': the oldest queued item is discarded
+        'block': the listener waits until the consumer has made room
+        'coalesce-motion': as 'drop-oldest', but in addition a motion which
+            directly follows another queued motion replaces it, so that each
+            drain cycle sees only the latest position of a run of motions
+
+    The number of discarded and merged items are kept in the dropped and
+    coalesced counters.
+    """
+    def __init__(self, size, overflow=DROP_OLDEST):
+        if overflow not in (DROP_OLDEST, BLOCK, COALESCE_MOTION):
+            raise ValueError('Unknown overflow policy: {0}'.format(overflow))
+        self.size = max(int(size), 1)
+        self.overflow = overflow
+        self.dropped = 0
+        self.coalesced = 0
+        self.closed = False
+        self._items = deque()
+        self._last_motion = False
+        self._cond = threading.Condition()
+
+    def put(self, item, motion=False):
+        """
+        Add an item, which is a motion event if motion is True. Returns False
+        if the queue has been closed.
+        """
+        with self._cond:
+            if self.closed:
+                return False
+            items = self._items
+            if motion and self._last_motion and self.overflow == COALESCE_MOTION:
+                items[-1] = item
+                self.coalesced += 1
+                return True
+            if len(items) >= self.size:
+                if self.overflow == BLOCK:
+                    while len(items) >= self.size and not self.closed:
+                        self._cond.wait()
+                    if self.closed:
+                        return False
+                else:
+                    items.popleft()
+                    self.dropped += 1
+            items.append(item)
+            self._last_motion = motion
+            self._cond.notify_all()
+            return True
+
+    def drain(self, timeout=None):
+        """
+        Wait for items and return all of them as a list. Returns an empty list
+        if the timeout (in seconds) expires first, and None once the queue is
+        closed and empty.
+        """
+        with self._cond:
+            if not self._items and not self.closed:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None if self.closed else []
+            items = list(self._items)
+            self._items.clear()
+            self._last_motion = False
+            self._cond.notify_all()
+            return items
+
+    def close(self):
+        """Stop accepting items; those already queued can still be drained."""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
@@ -121,11 +121,11 @@ class PyMouseEvent(PyMouseEventMeta):
     def handler(self, proxy, type, event, refcon):
         (x, y) = CGEventGetLocation(event)
         if type in pressID:
-            self.click(x, y, pressID.index(type), True)
+            self._click(x, y, pressID.index(type), True)
         elif type in releaseID:
-            self.click(x, y, releaseID.index(type), False)
+            self._click(x, y, releaseID.index(type), False)
         else:
-            self.move(x, y)
+            self._move(x, y)
 
         if self.capture:
             CGEventSetType(event, kCGEventNull)
@@ -0,0 +1,57 @@
+#Copyright 2013 Paul Barton
+#
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Timing helpers for generating a series of input events at a steady rate.
+"""
+
+import time
+
+
+def paced(count, period):
+    """
+    Spreads count items over time, with item i due period*i seconds after the
+    first. Yields (start, stop) index ranges of the items which are due each
+    time the schedule wakes up, sleeping in between. Every due time is measured
+    from the same start on the monotonic clock, so a late wake-up shortens the
+    following sleep instead of delaying all the items after it.
+
+    The caller should send the items of each range (typically with a single
+    flush) before asking for the next one:
+        for start, stop in paced(len(points), 0.01):
+            send(points[start:stop])
+
+    If period is 0, all the items are yielded at once. If count is None, the
+    schedule never ends, for items coming from a stream of unknown length; the
+    caller stops iterating when the stream runs out.
+    """
+    if count is not None and count <= 0:
+        return
+    if period <= 0:
+        yield 0, count
+        return
+    start = time.monotonic()
+    sent = 0
+    while count is None or sent < count:
+        #Index of the first item that is not yet due
+        due = int((time.monotonic() - start) / period) + 1
+        if count is not None:
+            due = min(due, count)
+        yield sent, due
+        sent = due
+        if count is None or sent < count:
+            delay = start + sent * period - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
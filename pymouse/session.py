@@ -0,0 +1,414 @@
+#Copyright 2013 Paul Barton
+#
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Recording of mouse and keyboard sessions with PyMouseEvent and PyKeyboardEvent,
+and their replay with PyMouse and PyKeyboard.
+
+A session file is a 32 byte header followed by fixed-width little-endian
+records, one per event:
+    timestamp   int64   microseconds since the start of the recording
+    type        uint8   MOTION, BUTTON_PRESS, BUTTON_RELEASE, KEY_PRESS or
+                        KEY_RELEASE
+    (padding)   1 byte
+    code        uint16  the PyMouse button number or the keycode
+    x, y        int16   pointer position (0 for key events)
+    state       uint16  modifier state (0 where unknown)
+and then by a sparse index of the timestamps of every INDEX_STRIDE-th record,
+as int64 values. The header holds the number of records and the offset of the
+index, which are filled in when the recording is closed; in a file which was
+not closed properly they are 0, and the records run to the end of the file.
+(Version 1 files have a 16 byte header without these fields, and no index.)
+
+Both the recorder and the player work on a few thousand records at a time,
+so sessions of any length are written and replayed in constant memory.
+SessionFile maps a session file into memory for random access by time.
+"""
+
+from array import array
+from bisect import bisect_left
+from contextlib import ExitStack
+import mmap
+import struct
+import threading
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MOTION = 0
+BUTTON_PRESS = 1
+BUTTON_RELEASE = 2
+KEY_PRESS = 3
+KEY_RELEASE = 4
+
+MAGIC = b'PUIS'
+VERSION = 2
+HEADER_V1 = struct.Struct('<4sHHd')
+HEADER = struct.Struct('<4sHHdQQ')
+RECORD = struct.Struct('<qBxHhhH')
+TIMESTAMP = struct.Struct('<q')
+
+#The layout of RECORD as a NumPy structured type
+if numpy is not None:
+    RECORD_DTYPE = numpy.dtype({
+        'names': ['timestamp', 'type', 'code', 'x', 'y', 'state'],
+        'formats': ['<i8', 'u1', '<u2', '<i2', '<i2', '<u2'],
+        'offsets': [0, 8, 10, 12, 14, 16],
+        'itemsize': RECORD.size})
+
+#Records held in memory before being written out, or read in at a time
+CHUNK = 4096
+#Records per entry of the timestamp index
+INDEX_STRIDE = 1024
+
+
+def read_header(data):
+    """
+    Check the header at the start of the bytes data of a session file. Returns
+    (version, wall clock start time, header size, record count, index offset);
+    the count and offset are 0 if unknown.
+    """
+    if len(data) < HEADER_V1.size:
+        raise ValueError('Not a session file: too short')
+    magic, version, record_size, started = HEADER_V1.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('Not a session file: bad magic number')
+    if record_size != RECORD.size:
+        raise ValueError('Unsupported record size: {0}'.format(record_size))
+    if version == 1:
+        return version, started, HEADER_V1.size, 0, 0
+    if len(data) < HEADER.size:
+        raise ValueError('Not a session file: too short')
+    count, index_offset = HEADER.unpack_from(data)[4:]
+    return version, started, HEADER.size, count, index_offset
+
+
+def iter_records(path, start=None, end=None):
+    """
+    Iterate over the records of a session file as (timestamp, type, code, x,
+    y, state) tuples, timestamp in microseconds. If start or end (in seconds
+    from the beginning of the recording) are given, only the records from
+    start and before end are read.
+    """
+    with SessionFile(path) as session:
+        for record in session.records(start, end):
+            yield record
+
+
+class SessionWriter(object):
+    """
+    Writes records to a session file, buffering them in a bytearray which is
+    written out every CHUNK records. May be used from several threads.
+    """
+    def __init__(self, path):
+        self._file = open(path, 'wb')
+        self.started = time.time()
+        self._file.write(HEADER.pack(MAGIC, VERSION, RECORD.size,
+                                     self.started, 0, 0))
+        self._buffer = bytearray()
+        self._pending = 0
+        self._index = array('q')
+        self._last = 0
+        self._lock = threading.Lock()
+        self.start = time.monotonic()
+        self.count = 0
+
+    def write(self, etype, code=0, x=0, y=0, state=0):
+        """Add a record for an event happening now."""
+        timestamp = int((time.monotonic() - self.start) * 1000000)
+        record = RECORD.pack(timestamp, etype, code, x, y, state)
+        with self._lock:
+            if self._file is None:
+                return
+            #Timestamps are taken outside the lock, keep them in order
+            if timestamp < self._last:
+                timestamp = self._last
+                record = RECORD.pack(timestamp, etype, code, x, y, state)
+            self._last = timestamp
+            if not self.count % INDEX_STRIDE:
+                self._index.append(timestamp)
+            self._buffer += record
+            self._pending += 1
+            self.count += 1
+            if self._pending >= CHUNK:
+                self._flush()
+
+    def _flush(self):
+        self._file.write(self._buffer)
+        del self._buffer[:]
+        self._pending = 0
+
+    def close(self):
+        """Write out the remaining records and the index, and close the file."""
+        with self._lock:
+            if self._file is None:
+                return
+            self._flush()
+            index_offset = self._file.tell()
+            self._file.write(struct.pack('<{0}q'.format(len(self._index)),
+                                         *self._index))
+            self._file.seek(0)
+            self._file.write(HEADER.pack(MAGIC, VERSION, RECORD.size,
+                                         self.started, self.count,
+                                         index_offset))
+            self._file.close()
+            self._file = None
+
+
+class SessionFile(object):
+    """
+    A session file mapped into memory, for random access to its records by
+    time without reading the records before them. Times are given in seconds
+    from the start of the recording.
+        with SessionFile('session.puis') as session:
+            minute = session.between(47 * 60, 48 * 60)
+
+    The arrays and views returned by between() point into the mapping, they
+    must be released before the file is closed.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as readfile:
+            self._map = mmap.mmap(readfile.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        (self.version, self.started, self._offset, count,
+         index_offset) = read_header(self._map)
+        if index_offset:
+            self.count = count
+            index = self._map[index_offset:]
+            self._index = [t for (t,) in TIMESTAMP.iter_unpack(index)]
+        else:
+            #Unindexed: the records run to the end of the file, and the
+            #search falls back to bisecting all of them
+            self.count = (len(self._map) - self._offset) // RECORD.size
+            self._index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._map.close()
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError('record index out of range')
+        return RECORD.unpack_from(self._map, self._offset + i * RECORD.size)
+
+    def _timestamp(self, i):
+        return TIMESTAMP.unpack_from(self._map,
+                                     self._offset + i * RECORD.size)[0]
+
+    def find(self, seconds):
+        """Returns the index of the first record at or after seconds."""
+        target = int(round(seconds * 1000000))
+        if self._index is None:
+            low, high = 0, self.count
+        else:
+            #The index narrows the search down to one stride of records
+            block = max(bisect_left(self._index, target) - 1, 0)
+            low = block * INDEX_STRIDE
+            high = min(low + 2 * INDEX_STRIDE, self.count)
+        while low < high:
+            middle = (low + high) // 2
+            if self._timestamp(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _range(self, start, end):
+        first = 0 if start is None else self.find(start)
+        last = self.count if end is None else self.find(end)
+        return first, max(first, last)
+
+    def between(self, start=None, end=None):
+        """
+        Returns the records from start and before end without copying them: as
+        a NumPy structured array (see RECORD_DTYPE) if NumPy is available,
+        otherwise as a memoryview of the packed records, which can be read
+        with RECORD.iter_unpack.
+        """
+        first, last = self._range(start, end)
+        offset = self._offset + first * RECORD.size
+        if numpy is not None:
+            return numpy.frombuffer(self._map, dtype=RECORD_DTYPE,
+                                    count=last - first, offset=offset)
+        return memoryview(self._map)[offset:offset + (last - first) *
+                                     RECORD.size]
+
+    def records(self, start=None, end=None):
+        """
+        Iterate over the records from start and before end as tuples, reading
+        CHUNK records at a time.
+        """
+        first, last = self._range(start, end)
+        for chunk in range(first, last, CHUNK):
+            offset = self._offset + chunk * RECORD.size
+            stop = self._offset + min(chunk + CHUNK, last) * RECORD.size
+            for record in RECORD.iter_unpack(self._map[offset:stop]):
+                yield record
+
+
+class SessionRecorder(object):
+    """
+    Records the mouse and/or keyboard input of display to a session file,
+    until stop() is called.
+        recorder = SessionRecorder('session.puis')
+        recorder.start()
+        ...
+        recorder.stop()
+
+    mouse_args and keyboard_args are dictionaries of further arguments for
+    the PyMouseEvent and the PyKeyboardEvent, such as capture_move for the
+    mouse or hub for either.
+    """
+    def __init__(self, path, mouse=True, keyboard=True, display=None,
+                 mouse_args=None, keyboard_args=None):
+        self.writer = SessionWriter(path)
+        self.listeners = []
+        if mouse:
+            from pymouse import PyMouseEvent
+            self.listeners.append(_mouse_recorder(PyMouseEvent, self.writer,
+                                                  display=display,
+                                                  **(mouse_args or {})))
+        if keyboard:
+            from pykeyboard import PyKeyboardEvent
+            self.listeners.append(_keyboard_recorder(PyKeyboardEvent,
+                                                     self.writer,
+                                                     display=display,
+                                                     **(keyboard_args or {})))
+
+    def start(self):
+        for listener in self.listeners:
+            listener.start()
+
+    def stop(self):
+        for listener in self.listeners:
+            listener.stop()
+        self.writer.close()
+
+
+def _mouse_recorder(base, writer, **listener_args):
+    class MouseRecorder(base):
+        def click(self, x, y, button, press):
+            writer.write(BUTTON_PRESS if press else BUTTON_RELEASE,
+                         button, x, y)
+
+        def move(self, x, y):
+            writer.write(MOTION, 0, x, y)
+    return MouseRecorder(**listener_args)
+
+
+def _keyboard_recorder(base, writer, **listener_args):
+    class KeyboardRecorder(base):
+        def _tap(self, event, *args):
+            #The raw event is needed for the modifier state
+            self._recorded_state = getattr(event, 'state', 0)
+            base._tap(self, event, *args)
+
+        def tap(self, keycode, character, press):
+            writer.write(KEY_PRESS if press else KEY_RELEASE, keycode,
+                         state=self._recorded_state)
+
+        def escape(self, event):
+            return False
+    return KeyboardRecorder(**listener_args)
+
+
+class SessionPlayer(object):
+    """
+    Replays a session file with a PyMouse and a PyKeyboard, either of which
+    may be None to skip its events.
+
+    Each event is due at its recorded time divided by speed, measured from the
+    start of the replay on the monotonic clock, so the replay does not drift.
+    The events which are due together are sent in one batch. A speed of None
+    (or 0) replays the events as fast as possible.
+    """
+    def __init__(self, path, mouse=None, keyboard=None, speed=1.0):
+        self.path = path
+        self.mouse = mouse
+        self.keyboard = keyboard
+        self.speed = speed
+        self.state = True
+
+    def stop(self):
+        """Stop a replay in progress, from another thread."""
+        self.state = False
+
+    def play(self, start=None, end=None):
+        """
+        Replay the session, or only its part from start and before end (in
+        seconds from the beginning of the recording).
+        """
+        self.state = True
+        speed = self.speed
+        due = []
+        origin = None
+        for record in iter_records(self.path, start, end):
+            if not self.state:
+                break
+            if origin is None:
+                #The first record replayed is due immediately
+                origin = time.monotonic() - record[0] / (1000000.0 * (speed or 1))
+            if speed:
+                wait = origin + record[0] / (1000000.0 * speed) - time.monotonic()
+                if wait > 0:
+                    #Send what is due before sleeping until the next event
+                    self._send(due)
+                    due = []
+                    time.sleep(wait)
+            due.append(record)
+            if len(due) >= CHUNK:
+                self._send(due)
+                due = []
+        self._send(due)
+
+    def _send(self, records):
+        mouse = self.mouse
+        keyboard = self.keyboard
+        with ExitStack() as batches:
+            #A single sync for the events due together, made by the mouse
+            #when there is one
+            if mouse is not None:
+                batches.enter_context(mouse.batch())
+            if keyboard is not None:
+                batches.enter_context(keyboard.batch(sync=mouse is None))
+            for timestamp, etype, code, x, y, state in records:
+                if etype in (KEY_PRESS, KEY_RELEASE):
+                    if keyboard is None:
+                        continue
+                    if etype == KEY_PRESS:
+                        keyboard.press_key(code)
+                    else:
+                        keyboard.release_key(code)
+                elif mouse is None:
+                    continue
+                elif etype == MOTION:
+                    mouse.move(x, y)
+                elif etype == BUTTON_PRESS:
+                    mouse.press(x, y, code)
+                elif etype == BUTTON_RELEASE:
+                    mouse.release(x, y, code)
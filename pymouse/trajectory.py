@@ -0,0 +1,209 @@
+#Copyright 2013 Paul Barton
+#
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Paths for PyMouse.move_path and PyMouse.drag_path. Each path computes all of
+its intermediate pointer positions in a single pass, using NumPy when it is
+available and plain Python otherwise, so that no per-point work is left for
+the time-critical injection loop.
+
+A path is any of the classes below, or a plain sequence of (x, y) points which
+will be treated as a Polyline.
+"""
+
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def _chord_steps(points):
+    """One step per pixel along the longest axis of each segment."""
+    steps = 0
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        steps += max(abs(x1 - x0), abs(y1 - y0))
+    return max(int(math.ceil(steps)), 1) + 1
+
+
+def _linspace(n):
+    if n == 1:
+        return [1.0]
+    return [i / float(n - 1) for i in range(n)]
+
+
+class Path(object):
+    """
+    The base class for paths. Subclasses implement _numpy_points and
+    _python_points, which receive the number of points to compute.
+    """
+
+    def default_steps(self):
+        """The number of points used when none is requested."""
+        raise NotImplementedError
+
+    def points(self, n=None):
+        """
+        Returns a list of n (x, y) integer points along the path, beginning
+        and ending on its endpoints. If n is None, default_steps() is used.
+        """
+        if n is None:
+            n = self.default_steps()
+        n = max(int(n), 1)
+        if numpy is not None:
+            return [tuple(p) for p in
+                    numpy.rint(self._numpy_points(n)).astype(int).tolist()]
+        return [(int(round(x)), int(round(y)))
+                for x, y in self._python_points(n)]
+
+
+class Polyline(Path):
+    """
+    A series of straight segments through the given points. When resampled,
+    the points are spaced evenly along its length.
+    """
+    def __init__(self, points):
+        self.vertices = [tuple(p) for p in points]
+        if not self.vertices:
+            raise ValueError('A Polyline needs at least one point')
+
+    def default_steps(self):
+        return len(self.vertices)
+
+    def points(self, n=None):
+        if n is None:  # No resampling needed
+            return [(int(round(x)), int(round(y))) for x, y in self.vertices]
+        return Path.points(self, n)
+
+    def _numpy_points(self, n):
+        vertices = numpy.asarray(self.vertices, dtype=float)
+        lengths = numpy.hypot(*numpy.diff(vertices, axis=0).T)
+        distance = numpy.concatenate(([0.0], numpy.cumsum(lengths)))
+        targets = numpy.linspace(0.0, distance[-1], n)
+        return numpy.column_stack(
+            (numpy.interp(targets, distance, vertices[:, 0]),
+             numpy.interp(targets, distance, vertices[:, 1])))
+
+    def _python_points(self, n):
+        vertices = self.vertices
+        distance = [0.0]
+        for (x0, y0), (x1, y1) in zip(vertices, vertices[1:]):
+            distance.append(distance[-1] + math.hypot(x1 - x0, y1 - y0))
+        total = distance[-1]
+        points = []
+        segment = 0
+        for t in _linspace(n):
+            target = t * total
+            while (segment < len(vertices) - 2 and
+                   distance[segment + 1] < target):
+                segment += 1
+            if len(vertices) == 1:
+                points.append(vertices[0])
+                continue
+            (x0, y0), (x1, y1) = vertices[segment], vertices[segment + 1]
+            span = distance[segment + 1] - distance[segment]
+            f = (target - distance[segment]) / span if span else 0.0
+            points.append((x0 + (x1 - x0) * f, y0 + (y1 - y0) * f))
+        return points
+
+
+class Bezier(Path):
+    """
+    A Bezier curve of any degree, defined by its control points: the first and
+    last are the endpoints.
+    """
+    def __init__(self, points):
+        self.controls = [tuple(p) for p in points]
+        if len(self.controls) < 2:
+            raise ValueError('A Bezier curve needs at least two points')
+
+    def default_steps(self):
+        #The control polygon is never shorter than the curve
+        return _chord_steps(self.controls)
+
+    def _numpy_points(self, n):
+        degree = len(self.controls) - 1
+        t = numpy.linspace(0.0, 1.0, n)[:, None]
+        k = numpy.arange(degree + 1)
+        binomials = numpy.array([math.comb(degree, i) for i in k], dtype=float)
+        basis = binomials * t ** k * (1 - t) ** (degree - k)
+        return basis.dot(numpy.asarray(self.controls, dtype=float))
+
+    def _python_points(self, n):
+        degree = len(self.controls) - 1
+        binomials = [math.comb(degree, i) for i in range(degree + 1)]
+        points = []
+        for t in _linspace(n):
+            x = y = 0.0
+            for i, (cx, cy) in enumerate(self.controls):
+                b = binomials[i] * t ** i * (1 - t) ** (degree - i)
+                x += b * cx
+                y += b * cy
+            points.append((x, y))
+        return points
+
+
+class MinimumJerk(Path):
+    """
+    A straight movement from start to end following the minimum-jerk velocity
+    profile of human reaching movements: slow at both ends, fastest midway.
+    """
+    def __init__(self, start, end):
+        self.start = tuple(start)
+        self.end = tuple(end)
+
+    def default_steps(self):
+        return _chord_steps([self.start, self.end])
+
+    def _numpy_points(self, n):
+        t = numpy.linspace(0.0, 1.0, n)
+        s = t ** 3 * (10 - 15 * t + 6 * t ** 2)
+        start = numpy.asarray(self.start, dtype=float)
+        end = numpy.asarray(self.end, dtype=float)
+        return start + (end - start) * s[:, None]
+
+    def _python_points(self, n):
+        (x0, y0), (x1, y1) = self.start, self.end
+        points = []
+        for t in _linspace(n):
+            s = t ** 3 * (10 - 15 * t + 6 * t ** 2)
+            points.append((x0 + (x1 - x0) * s, y0 + (y1 - y0) * s))
+        return points
+
+
+def as_path(path):
+    """Returns path itself if it is a Path, otherwise a Polyline of it."""
+    if isinstance(path, Path):
+        return path
+    return Polyline(path)
+
+
+def plan(path, duration=0, rate=125, steps=None):
+    """
+    Computes the points for moving along path in duration seconds. The number
+    of points is steps if given, otherwise one per 1/rate seconds of the
+    duration, or the path's default if there is no duration. Returns the list
+    of points and the period in seconds between them.
+    """
+    path = as_path(path)
+    if steps is None and duration:
+        steps = int(duration * rate) + 1
+    points = path.points(steps)
+    if len(points) > 1 and duration:
+        period = float(duration) / (len(points) - 1)
+    else:
+        period = 0
+    return points, period
@@ -16,6 +16,7 @@
 from ctypes import *
 import win32api, win32con
 from .base import PyMouseMeta, PyMouseEventMeta, ScrollSupportError
+from .delivery import DROP_OLDEST
 import pythoncom
 from time import sleep
 
@@ -89,10 +90,13 @@ in Windows. This feature is only available on Mac.')
         return width, height
 
 class PyMouseEvent(PyMouseEventMeta):
-    def __init__(self, capture=False, capture_move=False):
+    def __init__(self, capture=False, capture_move=False, queue_size=None,
+                 overflow=DROP_OLDEST, consumer=True):
         import pyHook
 
-        PyMouseEventMeta.__init__(self, capture=capture, capture_move=capture_move)
+        PyMouseEventMeta.__init__(self, capture=capture, capture_move=capture_move,
+                                  queue_size=queue_size, overflow=overflow,
+                                  consumer=consumer)
         self.hm = pyHook.HookManager()
 
     def run(self):
@@ -104,27 +108,27 @@ class PyMouseEvent(PyMouseEventMeta):
 
     def stop(self):
         self.hm.UnhookMouse()
-        self.state = False
+        PyMouseEventMeta.stop(self)
 
     def _action(self, event):
         import pyHook
         x, y = event.Position
 
         if event.Message == pyHook.HookConstants.WM_MOUSEMOVE:
-            self.move(x,y)
+            self._move(x, y)
 
         elif event.Message == pyHook.HookConstants.WM_LBUTTONDOWN:
-            self.click(x, y, 1, True)
+            self._click(x, y, 1, True)
         elif event.Message == pyHook.HookConstants.WM_LBUTTONUP:
-            self.click(x, y, 1, False)
+            self._click(x, y, 1, False)
         elif event.Message == pyHook.HookConstants.WM_RBUTTONDOWN:
-            self.click(x, y, 2, True)
+            self._click(x, y, 2, True)
         elif event.Message == pyHook.HookConstants.WM_RBUTTONUP:
-            self.click(x, y, 2, False)
+            self._click(x, y, 2, False)
         elif event.Message == pyHook.HookConstants.WM_MBUTTONDOWN:
-            self.click(x, y, 3, True)
+            self._click(x, y, 3, True)
         elif event.Message == pyHook.HookConstants.WM_MBUTTONUP:
-            self.click(x, y, 3, False)
+            self._click(x, y, 3, False)
             
         elif event.Message == pyHook.HookConstants.WM_MOUSEWHEEL:
             # event.Wheel is -1 when scrolling down, 1 when scrolling up
@@ -13,70 +13,271 @@
 #You should have received a copy of the GNU General Public License
 #along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from Xlib.display import Display
+from collections import deque
+from contextlib import contextmanager
+import threading
+import time
+import weakref
+
 from Xlib import X
 from Xlib.ext.xtest import fake_input
 from Xlib.ext import record
-from Xlib.protocol import rq
 
-from .base import PyMouseMeta, PyMouseEventMeta, ScrollSupportError
+from .base import (PyMouseMeta, PyMouseEventMeta, ScrollSupportError,
+                   InputEvent)
+from .delivery import DROP_OLDEST
+from .pacing import paced
+from .session import MOTION, BUTTON_PRESS, BUTTON_RELEASE
+from . import trajectory
+from .x11_async import AsyncRecordListener
+from .x11_capture import CaptureProcess
+from .x11_display import get_display, release_display
+from .x11_hub import record_hub
+from .x11_monitors import monitor_layout
+from .x11_record import decode_events, event_batch, record_ranges
 
 button_ids = [None, 1, 3, 2, 4, 5, 6, 7]
 
 
+class PointerTracker(object):
+    """
+    Keeps the last known pointer position so that PyMouse does not need a
+    query_pointer round trip before every move. The position is fed by the
+    events PyMouse injects itself and, if listen is True, by the motion and
+    button events seen by a RECORD listener, which catches the pointer being
+    moved by anything else.
+
+    A cached position older than max_age seconds is considered stale, and
+    position() will return None to force a real query.
+    """
+    def __init__(self, display=None, max_age=0.1, listen=True):
+        self.max_age = max_age
+        #(x, y, time of update) replaced as a whole, so readers on other
+        #threads always see a consistent value
+        self._state = None
+        #Positions injected but not yet seen by the listener
+        self._echoes = deque(maxlen=64)
+        self.listener = None
+        if listen:
+            self.listener = _PointerListener(self, display)
+            self.listener.start()
+
+    def position(self):
+        """
+        Returns the cached (x, y) position, or None if there is none or if it
+        has gone stale.
+        """
+        state = self._state
+        if state is None or time.monotonic() - state[2] > self.max_age:
+            return None
+        return state[0], state[1]
+
+    def queried(self, x, y):
+        """Record a position obtained from the X server."""
+        self._echoes.clear()
+        self._state = (x, y, time.monotonic())
+
+    def injected(self, x, y):
+        """Record a pointer motion which has been sent to the X server."""
+        if self.listener is not None:
+            self._echoes.append((x, y))
+        self._state = (x, y, time.monotonic())
+
+    def observed(self, x, y):
+        """Record a pointer position reported by the listener."""
+        echoes = self._echoes
+        if not echoes:
+            self._state = (x, y, time.monotonic())
+        elif (x, y) in echoes:
+            #The server has caught up to one of our own motions; the cache
+            #already holds that one or a later one
+            while echoes and echoes.popleft() != (x, y):
+                pass
+        #Otherwise the motion was processed before our pending injections,
+        #which will override it
+
+    def stop(self):
+        """Stop the listener, if there is one."""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+
 class PyMouse(PyMouseMeta):
-    def __init__(self, display=None):
+    def __init__(self, display=None, tracker=None):
+        """
+        Passing tracker=True, or a PointerTracker instance (which may be shared
+        between several PyMouse objects), makes position() and the redundant
+        move check read from the tracked pointer position instead of querying
+        the X server each time. A tracker created for tracker=True is stopped
+        along with the PyMouse; one passed in is left to its owner.
+        """
         PyMouseMeta.__init__(self)
-        self.display = Display(display)
-        self.display2 = Display(display)
+        self.display = get_display(display)
+        weakref.finalize(self, release_display, self.display)
+        if tracker is True:
+            tracker = PointerTracker(display)
+            weakref.finalize(self, tracker.stop)
+        self.tracker = tracker
+        #Depth of nested batch() blocks; events are only synced at depth 0
+        self._batch_depth = 0
 
     def press(self, x, y, button=1):
         self.move(x, y)
         fake_input(self.display, X.ButtonPress, button_ids[button])
-        self.display.sync()
+        self._commit()
 
     def release(self, x, y, button=1):
         self.move(x, y)
         fake_input(self.display, X.ButtonRelease, button_ids[button])
-        self.display.sync()
+        self._commit()
 
-    def scroll(self, vertical=None, horizontal=None, depth=None):
+    def scroll(self, vertical=None, horizontal=None, depth=None,
+               duration=None):
+        """
+        Scrolling in X11 is done with the buttons 4 (up), 5 (down), 6 (left)
+        and 7 (right). The press and release pairs for every tick are queued
+        and sent in a single flush, at the current pointer position.
+
+        If a duration (in seconds) is given, the ticks are instead spread
+        evenly over that time. Each tick is due at a fixed offset from the
+        start, so sleeping late does not accumulate drift; the ticks which are
+        due when the scheduler wakes are sent together in one flush.
+        """
         #Xlib supports only vertical and horizontal scrolling
         if depth is not None:
             raise ScrollSupportError('PyMouse cannot support depth-scrolling \
 in X11. This feature is only available on Mac.')
 
         #Execute vertical then horizontal scrolling events
+        ticks = []
         if vertical is not None:
             vertical = int(vertical)
-            if vertical == 0:  # Do nothing with 0 distance
-                pass
-            elif vertical > 0:  # Scroll up if positive
-                self.click(*self.position(), button=4, n=vertical)
+            if vertical > 0:  # Scroll up if positive
+                ticks += [4] * vertical
             else:  # Scroll down if negative
-                self.click(*self.position(), button=5, n=abs(vertical))
+                ticks += [5] * abs(vertical)
         if horizontal is not None:
             horizontal = int(horizontal)
-            if horizontal == 0:  # Do nothing with 0 distance
-                pass
-            elif horizontal > 0:  # Scroll right if positive
-                self.click(*self.position(), button=7, n=horizontal)
+            if horizontal > 0:  # Scroll right if positive
+                ticks += [7] * horizontal
             else:  # Scroll left if negative
-                self.click(*self.position(), button=6, n=abs(horizontal))
+                ticks += [6] * abs(horizontal)
+        if not ticks:  # Do nothing with 0 distance
+            return
+
+        period = float(duration or 0) / len(ticks)
+        for start, stop in paced(len(ticks), period):
+            self._scroll_ticks(ticks[start:stop])
+            if stop < len(ticks):
+                self.display.flush()
+        self._commit()
+
+    def _scroll_ticks(self, buttons):
+        """Queue a press and release of each of the scroll buttons."""
+        for button in buttons:
+            fake_input(self.display, X.ButtonPress, button)
+            fake_input(self.display, X.ButtonRelease, button)
 
     def move(self, x, y):
-        if (x, y) != self.position():
+        #Inside a batch a query would cost a round trip and send the batch,
+        #so a position the tracker cannot give is unknown and the motion is
+        #always queued
+        if not self._batch_depth:
+            current = self.position()
+        elif self.tracker is not None:
+            current = self.tracker.position()
+        else:
+            current = None
+        if (x, y) != current:
             fake_input(self.display, X.MotionNotify, x=x, y=y)
-            self.display.sync()
+            self._injected(x, y)
+            self._commit()
 
     def drag(self, x, y):
         fake_input(self.display, X.ButtonPress, button_ids[1])
         fake_input(self.display, X.MotionNotify, x=x, y=y)
         fake_input(self.display, X.ButtonRelease, button_ids[1])
-        self.display.sync()
+        self._injected(x, y)
+        self._commit()
+
+    @contextmanager
+    def batch(self, sync=True):
+        """
+        Queue the fake_input requests generated within the block and send them
+        to the X server in a single flush when the outermost block exits. If
+        sync is True, a single sync is then made so that the events have been
+        processed by the time the block returns. Blocks may be nested.
+
+        Batching is per display connection, not per object: the connection is
+        shared with the other PyMouse and PyKeyboard objects of the display,
+        and any of them syncing or flushing it within the block sends the
+        requests queued so far.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                if sync:
+                    self.display.sync()
+                else:
+                    self.display.flush()
+
+    def _commit(self):
+        """
+        Sync the queued requests with the X server, unless a batch is open in
+        which case they stay queued until it closes.
+        """
+        if not self._batch_depth:
+            self.display.sync()
+
+    def move_path(self, path, duration=0, rate=125, steps=None):
+        points, period = trajectory.plan(path, duration, rate, steps)
+        self._send_path(points, period)
+        self._commit()
+
+    def drag_path(self, path, duration=0, rate=125, steps=None, button=1):
+        points, period = trajectory.plan(path, duration, rate, steps)
+        self.move(*points[0])
+        fake_input(self.display, X.ButtonPress, button_ids[button])
+        self._send_path(points, period)
+        fake_input(self.display, X.ButtonRelease, button_ids[button])
+        self._commit()
+
+    def _send_path(self, points, period):
+        """
+        Send the motions along precomputed points, flushing once per group of
+        points that are due together. Consecutive duplicate points are
+        skipped, as they would not move the pointer.
+        """
+        last = None
+        for start, stop in paced(len(points), period):
+            for point in points[start:stop]:
+                if point != last:
+                    fake_input(self.display, X.MotionNotify,
+                               x=point[0], y=point[1])
+                    last = point
+            if stop < len(points):
+                self.display.flush()
+        if last is not None:
+            self._injected(*last)
+
+    def _injected(self, x, y):
+        """Inform the tracker, if any, of a motion sent to (x, y)."""
+        if self.tracker is not None:
+            #The server keeps the pointer on the monitors
+            self.tracker.injected(*self.clamp(x, y))
 
     def position(self):
+        if self.tracker is not None:
+            cached = self.tracker.position()
+            if cached is not None:
+                return cached
         coord = self.display.screen().root.query_pointer()._data
+        if self.tracker is not None:
+            self.tracker.queried(coord["root_x"], coord["root_y"])
         return coord["root_x"], coord["root_y"]
 
     def screen_size(self):
@@ -84,28 +285,120 @@ in X11. This feature is only available on Mac.')
         height = self.display.screen().height_in_pixels
         return width, height
 
+    def monitors(self):
+        """
+        The monitors are read from RandR or Xinerama, and cached until the X
+        server reports a change of the screen configuration. Inside a batch,
+        the connection is not read for such a report, which would send the
+        queued events.
+        """
+        return monitor_layout(self.display).monitors(
+            check=not self._batch_depth)
+
 
 class PyMouseEvent(PyMouseEventMeta):
-    def __init__(self, capture=False, capture_move=False, display=None):
+    """
+    The PyMouseEvent implementation for X11 systems. If hub is True, the
+    events are received from the display's shared RecordHub, on its thread,
+    instead of from a RECORD context of the listener's own. If process is
+    True, they are recorded by a CaptureProcess instead, so that they are
+    read from the server on time even while this process is busy.
+
+    Only the event types returned by recorded_types are recorded, so that a
+    listener which does not handle motion is not sent every pointer motion.
+    On the hub, the events are only passed to click() and move(), never to
+    mouse_batch().
+    """
+    #Whether all the events are read, rather than given to the handlers
+    _iterated = False
+
+    def __init__(self, capture=False, capture_move=False, display=None,
+                 queue_size=None, overflow=DROP_OLDEST, consumer=True,
+                 hub=False, process=False):
+        if hub and process:
+            raise ValueError('hub and process cannot both be used')
         PyMouseEventMeta.__init__(self,
                                   capture=capture,
-                                  capture_move=capture_move)
-        self.display = Display(display)
-        self.display2 = Display(display)
+                                  capture_move=capture_move,
+                                  queue_size=queue_size,
+                                  overflow=overflow,
+                                  consumer=consumer)
+        #Every event is wanted if they are read from events()
+        if queue_size is not None and not consumer:
+            self._iterated = True
+        self.display = get_display(display)
+        weakref.finalize(self, release_display, self.display)
+        self.hub = None
+        self.capture_process = None
+        self._recorded = self.recorded_types()
+        self._configure_delivery()
+        if process:
+            self.capture_process = CaptureProcess(display)
+            return
+        if hub:
+            self.hub = record_hub(display)
+            self._stopped = threading.Event()
+            return
+        #The RECORD context blocks its connection, so it needs its own
+        self.display2 = get_display(display, shared=False)
         self.ctx = self.display2.record_create_context(
             0,
-            [record.AllClients],
-            [{
-                    'core_requests': (0, 0),
-                    'core_replies': (0, 0),
-                    'ext_requests': (0, 0, 0, 0),
-                    'ext_replies': (0, 0, 0, 0),
-                    'delivered_events': (0, 0),
-                    'device_events': (X.ButtonPressMask, X.ButtonReleaseMask),
-                    'errors': (0, 0),
-                    'client_started': False,
-                    'client_died': False,
-            }])
+            [record.AllClients] if self._recorded else [],
+            record_ranges(self._recorded))
+
+    def recorded_types(self):
+        """
+        Returns the set of event types to record: the button events if click
+        is overridden or capture is set, and MotionNotify if move is
+        overridden or capture_move is set.
+        """
+        types = set()
+        every = self._iterated or self._overridden('mouse_batch')
+        if every or self.capture or self._overridden('click'):
+            types.update((X.ButtonPress, X.ButtonRelease))
+        if every or self.capture_move or self._overridden('move'):
+            types.add(X.MotionNotify)
+        return frozenset(types)
+
+    def _overridden(self, name):
+        """Whether the handler of that name is given by a subclass."""
+        return (getattr(getattr(self, name), '__func__', None) is not
+                getattr(PyMouseEventMeta, name))
+
+    def _configure_delivery(self):
+        self._batched = self._overridden('mouse_batch')
+        #click() and move() are not called when only batches are handled
+        self._per_event = (not self._batched or self.queue is not None or
+                           self._overridden('click') or
+                           self._overridden('move'))
+
+    def update_recording(self):
+        """
+        Record the event types now returned by recorded_types, after a change
+        of capture_move or of the handlers. The running context is changed in
+        place, without restarting the listener, except in a capture process,
+        which keeps the types it was started with.
+        """
+        self._configure_delivery()
+        types = self.recorded_types()
+        if types == self._recorded:
+            return
+        self._recorded = types
+        if self.capture_process is not None:
+            return
+        if self.hub is not None:
+            if self.state and self.is_alive():
+                self.hub.subscribe(self._record_event, types)
+            return
+        if types:
+            #Registering the clients again replaces their ranges
+            self.display.record_register_clients(self.ctx, 0,
+                                                 [record.AllClients],
+                                                 record_ranges(types))
+        else:
+            self.display.record_unregister_clients(self.ctx,
+                                                   [record.AllClients])
+        self.display.flush()
 
     def run(self):
         try:
@@ -119,24 +412,45 @@ class PyMouseEvent(PyMouseEventMeta):
                 capturing = False
 
             if capturing:
-                self.display2.screen().root.grab_pointer(True,
-                                                         capturing,
-                                                         X.GrabModeAsync,
-                                                         X.GrabModeAsync,
-                                                         0, 0, X.CurrentTime)
+                if self.hub is None and self.capture_process is None:
+                    self.display2.screen().root.grab_pointer(True,
+                                                             capturing,
+                                                             X.GrabModeAsync,
+                                                             X.GrabModeAsync,
+                                                             0, 0, X.CurrentTime)
                 self.display.screen().root.grab_pointer(True,
                                                          capturing,
                                                          X.GrabModeAsync,
                                                          X.GrabModeAsync,
                                                          0, 0, X.CurrentTime)
 
+            if self.capture_process is not None:
+                self.capture_process.start(self._recorded)
+                for data, times in self.capture_process.chunks():
+                    self._handle(data, decode_events(data), times)
+                return
+            if self.hub is not None:
+                self.hub.subscribe(self._record_event, self._recorded)
+                self._stopped.wait()
+                self.hub.unsubscribe(self._record_event)
+                return
             self.display2.record_enable_context(self.ctx, self.handler)
             self.display2.record_free_context(self.ctx)
         except KeyboardInterrupt:
             self.stop()
 
     def stop(self):
-        self.state = False
+        PyMouseEventMeta.stop(self)
+        if self.capture_process is not None:
+            self.display.ungrab_pointer(X.CurrentTime)
+            self.display.flush()
+            self.capture_process.stop()
+            return
+        if self.hub is not None:
+            self.display.ungrab_pointer(X.CurrentTime)
+            self.display.flush()
+            self._stopped.set()
+            return
         self.display.flush()
         self.display.record_disable_context(self.ctx)
         self.display.ungrab_pointer(X.CurrentTime)
@@ -145,18 +459,101 @@ class PyMouseEvent(PyMouseEventMeta):
         self.display2.ungrab_pointer(X.CurrentTime)
 
     def handler(self, reply):
-        data = reply.data
-        while len(data):
-            event, data = rq.EventField(None).parse_binary_value(data, self.display.display, None, None)
-
-            #In X11, the button numbers are: leftclick=1, middleclick=2,
-            #  rightclick=3, scrollup=4, scrolldown=5, scrollleft=6,
-            #  scrollright=7
-            #  For the purposes of the cross-platform interface of PyMouse, we
-            #  invert the button number values of the right and middle buttons
-            if event.type == X.ButtonPress:
-                self.click(event.root_x, event.root_y, (None, 1, 3, 2, 4, 5, 6, 7)[event.detail], True)
-            elif event.type == X.ButtonRelease:
-                self.click(event.root_x, event.root_y, (None, 1, 3, 2, 4, 5, 6, 7)[event.detail], False)
-            else:
-                self.move(event.root_x, event.root_y)
+        received = time.monotonic()
+        events = decode_events(reply.data, self.display.display)
+        self._handle(reply.data, events, [received] * len(events))
+
+    def _handle(self, data, events, times):
+        #times holds the receive time of each event
+        if self._batched:
+            self.mouse_batch(event_batch(data, events))
+        if self._per_event:
+            for event, received in zip(events, times):
+                self._record_event(event, received)
+
+    def _record_event(self, event, received):
+        #In X11, the button numbers are: leftclick=1, middleclick=2,
+        #  rightclick=3, scrollup=4, scrolldown=5, scrollleft=6,
+        #  scrollright=7
+        #  For the purposes of the cross-platform interface of PyMouse, we
+        #  invert the button number values of the right and middle buttons
+        if self.records:
+            self._record_input(event, received)
+        elif event.type == X.ButtonPress:
+            self._click(event.root_x, event.root_y, (None, 1, 3, 2, 4, 5, 6, 7)[event.detail], True)
+        elif event.type == X.ButtonRelease:
+            self._click(event.root_x, event.root_y, (None, 1, 3, 2, 4, 5, 6, 7)[event.detail], False)
+        else:
+            self._move(event.root_x, event.root_y)
+
+    def _record_input(self, event, received):
+        if event.type == X.MotionNotify:
+            self._record('move', InputEvent(event.time, received, MOTION,
+                                            event.root_x, event.root_y, 0,
+                                            event.state, None, event.root))
+        else:
+            self._record('click', InputEvent(
+                event.time, received,
+                BUTTON_PRESS if event.type == X.ButtonPress else BUTTON_RELEASE,
+                event.root_x, event.root_y, button_ids[event.detail],
+                event.state, None, event.root))
+
+
+class _PointerListener(PyMouseEvent):
+    """Feeds the pointer positions of recorded events to a PointerTracker."""
+    def __init__(self, tracker, display=None):
+        #Shares the recording with any other listener of the display
+        PyMouseEvent.__init__(self, display=display, hub=True)
+        self.tracker = tracker
+
+    def click(self, x, y, button, press):
+        self.tracker.observed(x, y)
+
+    def move(self, x, y):
+        self.tracker.observed(x, y)
+
+
+class AsyncPyMouseEvent(AsyncRecordListener, PyMouseEvent):
+    """
+    A PyMouseEvent for asyncio applications. Rather than running in a thread
+    and calling click() and move(), it listens on the running event loop and
+    its events are read by asynchronous iteration, as ('click', (x, y, button,
+    press)) and ('move', (x, y)) pairs, or ('click', (event,)) and ('move',
+    (event,)) pairs of InputEvent tuples if records is True:
+        async with AsyncPyMouseEvent() as mouse_events:
+            x, y, button, press = await mouse_events.next_click()
+    """
+    _iterated = True
+
+    def __init__(self, display=None, maxsize=0):
+        PyMouseEvent.__init__(self, display=display)
+        self._async_init(maxsize)
+
+    def _click(self, x, y, button, press):
+        self._put(('click', (x, y, button, press)))
+
+    def _move(self, x, y):
+        self._put(('move', (x, y)))
+
+    def _record(self, name, event):
+        self._put((name, (event,)))
+
+    async def next_click(self, button=None, press=True):
+        """
+        Wait for the next press (or release, if press is False) of the button,
+        or of any button if it is None. Returns (x, y, button, press), or
+        (event,) if records is True.
+        """
+        if self.records:
+            return await self.next_event(
+                'click', lambda event: (event.press == press and
+                                        button in (None, event.detail)))
+        return await self.next_event(
+            'click', lambda x, y, b, p: p == press and button in (None, b))
+
+    async def next_move(self):
+        """
+        Wait for the next pointer motion. Returns (x, y), or (event,) if records
+        is True.
+        """
+        return await self.next_event('move')
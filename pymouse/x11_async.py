@@ -0,0 +1,134 @@
+#Copyright 2013 Paul Barton
+#
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Support for running the X11 listeners on an asyncio event loop instead of in
+their own thread. The RECORD connection's socket is watched by the loop with
+add_reader, and the replies are read and decoded only when data has arrived,
+so the loop never blocks.
+"""
+
+import asyncio
+
+from Xlib.ext import record
+
+
+class AsyncRecordListener(object):
+    """
+    A mixin for the X11 listener classes, which provide the RECORD context in
+    self.ctx on the private connection self.display2, the shared connection
+    self.display, and the reply handler self.handler. The handler's events
+    should be passed to _put as (name, args) pairs, which are then available
+    by iterating asynchronously over the listener:
+        async with AsyncPyMouseEvent() as listener:
+            async for name, args in listener:
+                ...
+
+    If maxsize is given, at most that many events are kept waiting; when it
+    is full the oldest event is discarded and counted in self.dropped.
+    """
+    def _async_init(self, maxsize=0):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._loop = None
+        self._events = None
+        self._reading = False
+
+    def start(self):
+        """
+        Begin listening on the running event loop. Must be called from a
+        coroutine or callback running on that loop.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._events = asyncio.Queue(self.maxsize)
+        self.state = True
+        #Send the request without waiting for its replies, which will be
+        #parsed (calling the handler) as they are read from the socket
+        protocol = self.display2.display
+        record.EnableContext(self.handler,
+                             display=protocol,
+                             defer=True,
+                             opcode=protocol.get_extension_major(record.extname),
+                             context=self.ctx)
+        self.display2.flush()
+        self._loop.add_reader(self.display2.fileno(), self._readable)
+
+    def stop(self):
+        """Stop listening, ending any iteration over the events."""
+        if self._loop is None:
+            return
+        self.state = False
+        self._loop.remove_reader(self.display2.fileno())
+        self._loop = None
+        self.display.record_disable_context(self.ctx)
+        self.display.flush()
+        self._put(None)
+        #When stopped by the handler, display2 is still parsing the reply and
+        #is closed once it is done
+        if not self._reading:
+            self._close()
+
+    def _close(self):
+        self.display2.record_free_context(self.ctx)
+        self.display2.close()
+
+    def _readable(self):
+        #Receive whatever has arrived without blocking
+        self._reading = True
+        try:
+            self.display2.pending_events()
+        finally:
+            self._reading = False
+        if self._loop is None:  # Stopped by the handler
+            self._close()
+
+    def _put(self, item):
+        if self._events is None:
+            return
+        if self._events.full():
+            self._events.get_nowait()
+            self.dropped += 1
+        self._events.put_nowait(item)
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.stop()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._events is None:
+            raise StopAsyncIteration
+        item = await self._events.get()
+        if item is None:
+            #Leave the marker for any other waiting consumer
+            self._events.put_nowait(None)
+            raise StopAsyncIteration
+        return item
+
+    async def next_event(self, name, match=None):
+        """
+        Wait for the next event called name whose args satisfy match (a
+        function returning True or False), and return its args. Events which
+        do not match are consumed. Returns None if the listener stops.
+        """
+        async for event_name, args in self:
+            if event_name == name and (match is None or match(*args)):
+                return args
+        return None
@@ -0,0 +1,302 @@
+#Copyright 2013 Paul Barton
+#
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Capture of the input events of an X display in a child process, so that the
+events are read from the server as they come however busy the listening
+process is with other threads.
+
+The child process owns the RECORD connection and context, and copies the core
+input events of each reply, as fixed size records, into an EventRing in
+shared memory, with the time.monotonic() time at which the reply was read;
+the monotonic clock is the same in every process. The listening process
+reads them from the ring and decodes them with pymouse.x11_record. The ring
+has a single producer and a single consumer, each of which only writes its
+own index, so it needs no lock; a pipe only wakes the consumer up when
+records have been added.
+"""
+
+import multiprocessing
+from multiprocessing import connection, shared_memory
+import os
+import signal
+import struct
+import threading
+import time
+
+from Xlib.ext import record
+
+from .x11_display import get_display
+from .x11_record import EVENT_SIZE, core_records, decode_events, record_ranges
+
+_index = struct.Struct('=Q')
+_stamp = struct.Struct('=d')
+
+#Each index on a cache line of its own, so that the producer and the consumer
+#do not write to the same line
+_CAPACITY = 0
+_DROPPED = 8
+_WRITE = 64
+_READ = 128
+_HEADER_SIZE = 192
+
+
+class EventRing(object):
+    """
+    A ring of capacity records of EVENT_SIZE bytes in shared memory, each
+    with the time at which it was received, with one producer calling put and
+    one consumer calling get, possibly in different processes. A new ring is
+    created if name is None, otherwise the existing ring of that name is
+    opened.
+
+    The records are copied before the index which makes them visible is
+    written, and the aligned 8 byte indices are written whole, which is all
+    the ordering the protocol needs on the platforms with X servers.
+    """
+    def __init__(self, capacity=4096, name=None):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(
+                create=True,
+                size=_HEADER_SIZE + capacity * (EVENT_SIZE + _stamp.size))
+            _index.pack_into(self.shm.buf, _CAPACITY, capacity)
+            for offset in (_DROPPED, _WRITE, _READ):
+                _index.pack_into(self.shm.buf, offset, 0)
+        else:
+            self.shm = shared_memory.SharedMemory(name)
+            capacity = _index.unpack_from(self.shm.buf, _CAPACITY)[0]
+        self.name = self.shm.name
+        self.capacity = capacity
+        #The receive times follow the records, one for each
+        self._times = _HEADER_SIZE + capacity * EVENT_SIZE
+
+    @property
+    def dropped(self):
+        """The number of records which were put while the ring was full."""
+        return _index.unpack_from(self.shm.buf, _DROPPED)[0]
+
+    def put(self, data, received):
+        """
+        Add the records in data, all received at the time received, dropping
+        those which do not fit. Only for the producer.
+        """
+        buf = self.shm.buf
+        capacity = self.capacity
+        count = len(data) // EVENT_SIZE
+        write = _index.unpack_from(buf, _WRITE)[0]
+        read = _index.unpack_from(buf, _READ)[0]
+        stored = min(count, capacity - (write - read))
+        if stored:
+            start = write % capacity
+            first = min(stored, capacity - start)
+            offset = _HEADER_SIZE + start * EVENT_SIZE
+            buf[offset:offset + first * EVENT_SIZE] = data[:first * EVENT_SIZE]
+            rest = (stored - first) * EVENT_SIZE
+            if rest:
+                buf[_HEADER_SIZE:_HEADER_SIZE + rest] = \
+                    data[first * EVENT_SIZE:first * EVENT_SIZE + rest]
+            stamps = _stamp.pack(received) * stored
+            split = first * _stamp.size
+            offset = self._times + start * _stamp.size
+            buf[offset:offset + split] = stamps[:split]
+            if rest:
+                buf[self._times:self._times + len(stamps) - split] = \
+                    stamps[split:]
+            _index.pack_into(buf, _WRITE, write + stored)
+        if stored < count:
+            _index.pack_into(buf, _DROPPED, self.dropped + count - stored)
+
+    def get(self):
+        """
+        Returns the bytes of all the records put and not yet got, and the
+        tuple of their receive times. Only for the consumer.
+        """
+        buf = self.shm.buf
+        capacity = self.capacity
+        read = _index.unpack_from(buf, _READ)[0]
+        count = _index.unpack_from(buf, _WRITE)[0] - read
+        if not count:
+            return b'', ()
+        start = read % capacity
+        first = min(count, capacity - start)
+        offset = _HEADER_SIZE + start * EVENT_SIZE
+        data = bytes(buf[offset:offset + first * EVENT_SIZE])
+        if first < count:
+            data += bytes(buf[_HEADER_SIZE:
+                              _HEADER_SIZE + (count - first) * EVENT_SIZE])
+        times = self._times + start * _stamp.size
+        stamps = bytes(buf[times:times + first * _stamp.size])
+        if first < count:
+            stamps += bytes(buf[self._times:
+                                self._times + (count - first) * _stamp.size])
+        _index.pack_into(buf, _READ, read + count)
+        return data, tuple(stamp for stamp, in _stamp.iter_unpack(stamps))
+
+    def close(self):
+        """Stop using the ring in this process."""
+        self.shm.close()
+
+    def unlink(self):
+        """Free the shared memory, once no process uses the ring."""
+        self.shm.unlink()
+
+
+def _capture(name, types, ring_name, notify, control):
+    """The child process, recording the events until control is closed."""
+    #Interrupting the listening process must not kill its capture first
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    ring = EventRing(name=ring_name)
+    notify_fd = notify.fileno()
+    os.set_blocking(notify_fd, False)
+    local = get_display(name, shared=False)
+    record_display = get_display(name, shared=False)
+    ctx = record_display.record_create_context(
+        0, [record.AllClients] if types else [], record_ranges(types))
+    #Set by the first reply, which the server sends once the context is
+    #enabled; disabling it any earlier would do nothing
+    started = threading.Event()
+
+    def handler(reply):
+        received = time.monotonic()
+        started.set()
+        data = core_records(reply.data, record_display.display)
+        if data:
+            ring.put(data, received)
+            try:
+                os.write(notify_fd, b'\0')
+            except BlockingIOError:  # The consumer has yet to wake up
+                pass
+
+    def watch():
+        #Ends with the listening process, too, which closes control
+        connection.wait([control, multiprocessing.parent_process().sentinel])
+        started.wait()
+        local.record_disable_context(ctx)
+        local.flush()
+
+    watcher = threading.Thread(target=watch)
+    watcher.daemon = True
+    watcher.start()
+    try:
+        record_display.record_enable_context(ctx, handler)
+        record_display.record_free_context(ctx)
+    finally:
+        record_display.close()
+        local.close()
+        ring.close()
+        notify.close()
+
+
+class CaptureProcess(object):
+    """
+    Records the input events of a display in a child process. Iterating over
+    it yields lists of events, as returned by pymouse.x11_record.decode_events,
+    until stop is called:
+        capture = CaptureProcess()
+        capture.start((X.ButtonPress, X.ButtonRelease))
+        for events in capture:
+            ...
+
+    At most capacity events are kept waiting; while the ring is full, new
+    events are dropped and counted in dropped.
+    """
+    #Run by the child process as _target(display name, event types, ring
+    #name, notify pipe, control pipe)
+    _target = staticmethod(_capture)
+
+    def __init__(self, display=None, capacity=4096):
+        self.name = display
+        self.capacity = capacity
+        self._dropped = 0
+        self._ring = None
+        self._process = None
+        self._notify = None
+        self._control = None
+        self._stopped = False
+
+    @property
+    def dropped(self):
+        """The number of events dropped because the ring was full."""
+        if self._ring is not None:
+            return self._ring.dropped
+        return self._dropped
+
+    def start(self, types):
+        """Start recording the events of the given types."""
+        if self._stopped:
+            return
+        context = multiprocessing.get_context('spawn')
+        self._ring = EventRing(self.capacity)
+        self._notify, notify = context.Pipe(duplex=False)
+        control, self._control = context.Pipe(duplex=False)
+        self._process = context.Process(target=self._target,
+                                        args=(self.name, sorted(types),
+                                              self._ring.name, notify,
+                                              control))
+        self._process.daemon = True
+        self._process.start()
+        #Only the child's ends may remain, so that closing them is seen
+        notify.close()
+        control.close()
+
+    def stop(self):
+        """Stop recording; the iteration ends after the last events."""
+        self._stopped = True
+        if self._control is not None:
+            self._control.close()
+            self._control = None
+
+    def __iter__(self):
+        for data, times in self.chunks():
+            yield decode_events(data)
+
+    def chunks(self):
+        """
+        Iterate over the events as (data, times) pairs until stop is called:
+        data is the bytes of their records, which are read by
+        pymouse.x11_record.decode_events or event_batch, and times the
+        time.monotonic() times at which the child received them, one for each
+        record.
+        """
+        if self._process is None:
+            return
+        ring = self._ring
+        notify = self._notify
+        try:
+            while True:
+                data, times = ring.get()
+                if data:
+                    yield data, times
+                    continue
+                #Woken up by the child, or by the end of the child
+                notify.poll(None)
+                if not os.read(notify.fileno(), 4096):
+                    data, times = ring.get()
+                    if data:
+                        yield data, times
+                    break
+        finally:
+            self._close()
+
+    def _close(self):
+        if self._process is None:
+            return
+        self.stop()
+        self._process.join()
+        self._process = None
+        self._notify.close()
+        self._dropped = self._ring.dropped
+        self._ring.close()
+        self._ring.unlink()
+        self._ring = None
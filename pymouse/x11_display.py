@@ -0,0 +1,136 @@
+#Copyright 2013 Paul Barton
+#
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+A process-wide registry of X display connections, shared by the X11 classes of
+PyMouse and PyKeyboard so that a script using both opens one connection per
+display instead of one or two per object.
+
+Requests are queued per connection, so a PyMouse.batch() block only holds
+back the requests of the display until another user of the connection, such as
+a PyKeyboard, syncs or flushes it.
+
+Thread affinity:
+  * A shared connection may be used from any thread for sending requests and
+    waiting on their replies (fake_input, query_pointer, grabs, ...).
+    python-xlib serializes the I/O on a connection, and the X server processes
+    requests from one connection in the order they were sent.
+  * A shared connection must never be used for blocking on events, or for a
+    request which takes over the connection such as record_enable_context.
+    Use a private connection, get_display(name, shared=False), for those.
+  * Connections are never shared across processes: after a fork, the child
+    opens its own.
+  * Events arriving on a shared connection (such as RandR notifications) are
+    read with process_events, which passes them to the handlers registered
+    with add_event_handler. Nothing else should read its events.
+"""
+
+import os
+import select
+import threading
+import types
+import weakref
+
+from Xlib.display import Display
+
+#(pid, display name) -> [Display, reference count]
+_registry = {}
+_lock = threading.Lock()
+
+#Display -> {event type: (reference, ...)}, where calling a reference returns
+#the handler, or None once it is gone; the tuples are replaced as a whole
+_event_handlers = weakref.WeakKeyDictionary()
+#Held while reading events, so that another thread cannot take the events
+#counted as pending and leave next_event blocking
+_event_lock = threading.RLock()
+
+
+def _key(name):
+    if name is None:
+        name = os.environ.get('DISPLAY', '')
+    return os.getpid(), name
+
+
+def get_display(name=None, shared=True):
+    """
+    Returns a connection to the named display (None for $DISPLAY). If shared is
+    True, the connection is taken from the registry, opening it if needed, and
+    must be given back with release_display. Otherwise a new private
+    connection is returned, which belongs to the caller.
+    """
+    if not shared:
+        return Display(name)
+    key = _key(name)
+    with _lock:
+        entry = _registry.get(key)
+        if entry is None:
+            entry = _registry[key] = [Display(name), 0]
+        entry[1] += 1
+        return entry[0]
+
+
+def release_display(display):
+    """
+    Gives back a shared connection obtained from get_display. The connection
+    is closed once it is no longer used by anyone.
+    """
+    with _lock:
+        for key, entry in list(_registry.items()):
+            if entry[0] is display:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del _registry[key]
+                    if key[0] == os.getpid():
+                        display.close()
+                return
+
+
+def add_event_handler(display, event_type, handler):
+    """
+    Register handler(event) to be called by process_events for the events of
+    event_type received on display. A bound method is only held weakly, so
+    that its object (which usually holds the display) can still be freed; the
+    handler is then forgotten.
+    """
+    if isinstance(handler, types.MethodType):
+        reference = weakref.WeakMethod(handler)
+    else:
+        reference = lambda: handler
+    with _lock:
+        handlers = _event_handlers.setdefault(display, {})
+        handlers[event_type] = tuple(
+            [alive for alive in handlers.get(event_type, ())
+             if alive() is not None] + [reference])
+
+
+def process_events(display):
+    """
+    Pass the events which have arrived on display to their registered
+    handlers, without blocking. The events already read by the connection
+    are handled without any I/O. The socket is only read if the server has
+    sent more, and reading it also sends the requests queued on the
+    connection; otherwise the queued requests are left alone.
+    """
+    handlers = _event_handlers.get(display, {})
+    with _event_lock:
+        if select.select([display], [], [], 0)[0]:
+            display.pending_events()
+        #next_event does no I/O while events are queued
+        for i in range(len(display.display.event_queue)):
+            event = display.next_event()
+            for reference in handlers.get(event.type, ()):
+                handler = reference()
+                if handler is not None:
+                    handler(event)
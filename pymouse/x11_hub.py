@@ -0,0 +1,164 @@
+#Copyright 2013 Paul Barton
+#
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+A single RECORD context per display, shared by any number of listeners. Each
+RECORD context makes the X server send another copy of the input events, so
+rather than one context per listener, the hub records the key, button and
+motion events once, decodes each reply once and passes every event to the
+subscribers of its type. Only the types some subscriber wants are recorded.
+"""
+
+import os
+import threading
+import time
+
+from Xlib import X
+from Xlib.ext import record
+
+from .x11_display import get_display, release_display, process_events
+from .x11_record import decode_events, record_ranges
+
+#The event types a hub can record
+DEVICE_EVENTS = (X.KeyPress, X.KeyRelease, X.ButtonPress, X.ButtonRelease,
+                 X.MotionNotify)
+
+#(pid, display name) -> RecordHub
+_hubs = {}
+_lock = threading.Lock()
+
+
+def record_hub(name=None):
+    """Returns the RecordHub of the named display (None for $DISPLAY)."""
+    if name is None:
+        name = os.environ.get('DISPLAY', '')
+    key = os.getpid(), name
+    with _lock:
+        hub = _hubs.get(key)
+        if hub is None:
+            hub = _hubs[key] = RecordHub(name)
+        return hub
+
+
+class RecordHub(object):
+    """
+    Records the input events of a display for its subscribers. The RECORD
+    context is created for the first subscriber and freed after the last one
+    leaves; while there are subscribers, a daemon thread receives the events
+    and calls the subscribers' callbacks, which should return quickly.
+    """
+    def __init__(self, name=None):
+        self.name = name
+        self.display = None
+        self._subscribers = {}
+        #Event type -> tuple of callbacks, replaced as a whole
+        self._dispatch = {}
+        #The event types being recorded
+        self._types = frozenset()
+        self._lock = threading.Lock()
+        self._record_display = None
+        self._ctx = None
+        self._thread = None
+
+    def subscribe(self, callback, types=DEVICE_EVENTS):
+        """
+        Call callback(event, received) for each recorded event whose type is
+        in types, with the event as decoded by pymouse.x11_record.decode_events
+        and the time.monotonic() time at which its reply was read.
+        """
+        with self._lock:
+            self._subscribers[callback] = frozenset(types)
+            self._update()
+            if self._thread is None:
+                self._start()
+
+    def unsubscribe(self, callback):
+        """
+        Stop calling callback; the last subscriber stops the recording, and
+        waits for the end of the hub's thread unless it is called from that
+        thread, by a callback.
+        """
+        thread = None
+        with self._lock:
+            if self._subscribers.pop(callback, None) is None:
+                return
+            if not self._subscribers and self._thread is not None:
+                thread = self._thread
+                self._stop()
+            self._update()
+        #Outside the lock, which the thread may need until it ends
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _update(self):
+        dispatch = {}
+        for callback, types in self._subscribers.items():
+            for event_type in types:
+                dispatch[event_type] = dispatch.get(event_type, ()) + (callback,)
+        self._dispatch = dispatch
+        types = frozenset(dispatch)
+        if types != self._types and self._ctx is not None:
+            #Registering the clients again replaces their ranges
+            if types:
+                self.display.record_register_clients(self._ctx, 0,
+                                                     [record.AllClients],
+                                                     record_ranges(types))
+            else:
+                self.display.record_unregister_clients(self._ctx,
+                                                       [record.AllClients])
+            self.display.flush()
+        self._types = types
+
+    def _start(self):
+        self.display = get_display(self.name)
+        #The RECORD context blocks its connection, so it needs its own
+        self._record_display = get_display(self.name, shared=False)
+        self._ctx = self._record_display.record_create_context(
+            0,
+            [record.AllClients] if self._types else [],
+            record_ranges(self._types))
+        self._thread = threading.Thread(target=self._run,
+                                        args=(self._record_display, self._ctx))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _stop(self):
+        #Disabling the context from another connection ends the recording
+        self.display.record_disable_context(self._ctx)
+        self.display.flush()
+        release_display(self.display)
+        self.display = None
+        self._ctx = None
+        self._thread = None
+
+    def _run(self, record_display, ctx):
+        try:
+            record_display.record_enable_context(ctx, self._handler)
+            record_display.record_free_context(ctx)
+        finally:
+            record_display.close()
+
+    def _handler(self, reply):
+        received = time.monotonic()
+        display = self.display
+        if display is None:
+            return
+        #Let the handlers of the shared connection see mapping changes
+        #before the events are decoded
+        process_events(display)
+        dispatch = self._dispatch
+        for event in decode_events(reply.data, display.display):
+            for callback in dispatch.get(event.type, ()):
+                callback(event, received)
@@ -0,0 +1,113 @@
+#Copyright 2013 Paul Barton
+#
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+The monitor layout of an X screen, queried once from RandR (1.5 monitors) or
+Xinerama and cached until the server sends an RRScreenChangeNotify event.
+"""
+
+import threading
+import weakref
+
+from Xlib.ext import randr
+
+from .base import Monitor
+from .x11_display import add_event_handler, process_events
+
+#Display -> MonitorLayout, so that all the users of a shared connection
+#share one cache; a MonitorLayout only holds a weak reference to its display,
+#so that the entry goes with the display
+_layouts = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def monitor_layout(display):
+    """Returns the MonitorLayout of a display connection."""
+    with _lock:
+        layout = _layouts.get(display)
+        if layout is None:
+            layout = _layouts[display] = MonitorLayout(display)
+        return layout
+
+
+class MonitorLayout(object):
+    """
+    Caches the list of Monitor tuples of a display's default screen. Reading
+    the monitors only checks the events already received by the connection for
+    a screen change, it does not send any request unless the cache has been
+    invalidated.
+    """
+    def __init__(self, display):
+        self._display = weakref.ref(display)
+        self._monitors = None
+        #The server's RandR version; monitors need 1.5
+        self._randr_version = (0, 0)
+        if display.has_extension('RANDR'):
+            version = display.xrandr_query_version()
+            self._randr_version = (version.major_version,
+                                   version.minor_version)
+            first_event = display.query_extension('RANDR').first_event
+            add_event_handler(display,
+                              first_event + randr.RRScreenChangeNotify,
+                              self.invalidate)
+            display.screen().root.xrandr_select_input(
+                randr.RRScreenChangeNotifyMask)
+            display.flush()
+
+    @property
+    def display(self):
+        """The display connection, while it is alive."""
+        return self._display()
+
+    def invalidate(self, event=None):
+        """Forget the cached layout, it will be queried again when needed."""
+        self._monitors = None
+
+    def monitors(self, check=True):
+        """
+        Returns the list of Monitor tuples, the primary one first. If check
+        is False, the events received are not looked at for a screen change.
+        """
+        if check:
+            process_events(self.display)
+        monitors = self._monitors
+        if monitors is None:
+            monitors = self._monitors = self._query()
+        return monitors
+
+    def _query(self):
+        display = self.display
+        root = display.screen().root
+        monitors = []
+        if (self._randr_version >= (1, 5) and
+                hasattr(root, 'xrandr_get_monitors')):
+            for info in root.xrandr_get_monitors().monitors:
+                monitors.append(Monitor(info.x, info.y,
+                                        info.width_in_pixels,
+                                        info.height_in_pixels,
+                                        bool(info.primary),
+                                        display.get_atom_name(info.name)))
+        elif (display.has_extension('XINERAMA') and
+                display.xinerama_is_active()):
+            for i, info in enumerate(display.xinerama_query_screens().screens):
+                monitors.append(Monitor(info.x, info.y, info.width,
+                                        info.height, i == 0, None))
+        if not monitors:
+            screen = display.screen()
+            monitors.append(Monitor(0, 0, screen.width_in_pixels,
+                                    screen.height_in_pixels, True, None))
+        #The primary monitor first, the others in order
+        monitors.sort(key=lambda monitor: not monitor.primary)
+        return monitors
@@ -0,0 +1,150 @@
+#Copyright 2013 Paul Barton
+#
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Decoding of the event data in X RECORD replies, shared by the X11 listeners of
+PyMouse and PyKeyboard.
+
+The core input events (KeyPress, KeyRelease, ButtonPress, ButtonRelease and
+MotionNotify) share one 32 byte layout, which is unpacked with a precompiled
+struct straight from the reply buffer into an XEvent tuple. The fields of an
+XEvent have the same names as those of python-xlib's events, but the window
+fields are plain integer ids. Any other event type is parsed by python-xlib.
+
+The core input events of a reply may also be taken as a batch, which is a
+NumPy structured array over the reply data if NumPy is available.
+"""
+
+from collections import namedtuple
+import struct
+
+from Xlib import X
+from Xlib.protocol import rq
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+XEvent = namedtuple('XEvent', ['type', 'detail', 'sequence_number', 'time',
+                               'root', 'window', 'child', 'root_x', 'root_y',
+                               'event_x', 'event_y', 'state', 'same_screen'])
+
+#The layout of the core key, button and motion events
+_core = struct.Struct('=BBHLLLLhhhhHBx')
+
+EVENT_SIZE = 32
+
+CORE_TYPES = frozenset([X.KeyPress, X.KeyRelease, X.ButtonPress,
+                        X.ButtonRelease, X.MotionNotify])
+
+#The layout of the core events as a NumPy structured type, with the fields of
+#XEvent
+if numpy is not None:
+    EVENT_DTYPE = numpy.dtype({
+        'names': list(XEvent._fields),
+        'formats': ['u1', 'u1', 'u2', 'u4', 'u4', 'u4', 'u4', 'i2', 'i2',
+                    'i2', 'i2', 'u2', 'u1'],
+        'offsets': [0, 1, 2, 4, 8, 12, 16, 20, 22, 24, 26, 28, 30],
+        'itemsize': EVENT_SIZE})
+
+_event_field = rq.EventField(None)
+_make = XEvent._make
+
+
+def _only_core(data):
+    return not len(data) % EVENT_SIZE and CORE_TYPES.issuperset(data[::EVENT_SIZE])
+
+
+def decode_events(data, display=None):
+    """
+    Returns a list of the events in the data of a RECORD reply. The core input
+    events are XEvent tuples; other events are python-xlib event objects,
+    which need the protocol display (display.display) to be parsed.
+    """
+    if not data:
+        return []
+    #Most replies hold only core input events, which decode in a single pass
+    if _only_core(data):
+        return list(map(_make, _core.iter_unpack(data)))
+
+    view = memoryview(data)
+    events = []
+    offset = 0
+    end = len(view)
+    while offset < end:
+        etype = view[offset] & 0x7f
+        if etype in CORE_TYPES and end - offset >= EVENT_SIZE:
+            fields = _core.unpack_from(view, offset)
+            events.append(_make((etype,) + fields[1:]))
+            offset += EVENT_SIZE
+        else:
+            event, rest = _event_field.parse_binary_value(view[offset:],
+                                                          display, None, None)
+            events.append(event)
+            offset = end - len(rest)
+    return events
+
+
+def core_records(data, display=None):
+    """
+    Returns the core input events in the data of a RECORD reply, packed as
+    EVENT_SIZE byte records which decode_events decodes in a single pass.
+    """
+    if _only_core(data):
+        return data
+    return b''.join(_core.pack(*event) for event in decode_events(data, display)
+                    if isinstance(event, XEvent))
+
+
+def event_batch(data, events):
+    """
+    Returns the core input events in the data of a RECORD reply, of which
+    events is the decoded list, as a batch: a NumPy structured array (see
+    EVENT_DTYPE) if NumPy is available, otherwise a list of XEvent tuples.
+    """
+    if numpy is None:
+        return [event for event in events if isinstance(event, XEvent)]
+    if not _only_core(data):
+        data = b''.join(_core.pack(*event) for event in events
+                        if isinstance(event, XEvent))
+    return numpy.frombuffer(data, dtype=EVENT_DTYPE)
+
+
+def record_ranges(types):
+    """
+    Returns the RECORD ranges for recording the device events of the given
+    types: one range for each run of consecutive event types, so that no
+    other type is recorded. An empty list records nothing.
+    """
+    types = sorted(set(types))
+    ranges = []
+    while types:
+        run = 1
+        while run < len(types) and types[run] == types[0] + run:
+            run += 1
+        ranges.append({
+                'core_requests': (0, 0),
+                'core_replies': (0, 0),
+                'ext_requests': (0, 0, 0, 0),
+                'ext_replies': (0, 0, 0, 0),
+                'delivered_events': (0, 0),
+                'device_events': (types[0], types[run - 1]),
+                'errors': (0, 0),
+                'client_started': False,
+                'client_died': False,
+        })
+        types = types[run:]
+    return ranges
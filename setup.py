@@ -21,9 +21,14 @@ setup(name='PyUserInput',
       author_email='pablo.barton@gmail.com',
       url='https://github.com/SavinaRoja/PyUserInput',
       package_dir = {'': '.'},
+      #pykeyboard's X11 backend is built on pymouse's (the shared display
+      #connections, RECORD listeners and pacing), so they ship together
       packages = ['pykeyboard', 'pymouse'],
       license='http://www.gnu.org/licenses/gpl-3.0.html',
       keywords='mouse,keyboard user input event',
+      #The X11 capture process uses multiprocessing.shared_memory, new in
+      #Python 3.8
+      python_requires='>=3.8',
       )
 
 def dependency_check(dep_list):
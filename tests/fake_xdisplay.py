@@ -0,0 +1,176 @@
+'''
+A fake X display for the tests of the X11 classes which do not need a server.
+It has a keyboard mapping, a modifier mapping and a pointer, and logs the
+requests which change the state of the server.
+'''
+
+import os
+
+from Xlib import X, XK
+
+XK.load_keysym_group('xkb')
+
+def keysyms(*names):
+    """Returns the keysyms of a row of the keyboard mapping, from their names."""
+    return [XK.string_to_keysym(name) if name else 0 for name in names]
+
+
+class Event(object):
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class Info(object):
+    def __init__(self, min_keycode, max_keycode):
+        self.min_keycode = min_keycode
+        self.max_keycode = max_keycode
+
+
+class Protocol(object):
+    """Stands for the protocol display, display.display."""
+    def __init__(self, info):
+        self.info = info
+        #The events already read from the connection
+        self.event_queue = []
+
+
+def fake_input(display, event_type, detail=0, x=0, y=0):
+    """Stands for Xlib.ext.xtest.fake_input, logging the event."""
+    if event_type == X.MotionNotify:
+        display.log.append((event_type, x, y))
+        display.pointer = (x, y)
+    else:
+        display.log.append((event_type, detail))
+
+
+class Root(object):
+    def __init__(self, display):
+        self.display = display
+
+    def query_pointer(self):
+        self.display.log.append('query_pointer')
+        x, y = self.display.pointer
+        return Event(_data={'root_x': x, 'root_y': y})
+
+    def grab_key(self, keycode, modifiers, owner_events, pointer_mode,
+                 keyboard_mode, onerror=None):
+        self.display.log.append(('grab_key', keycode, modifiers))
+
+    def ungrab_key(self, keycode, modifiers):
+        self.display.log.append(('ungrab_key', keycode, modifiers))
+
+    def grab_keyboard(self, owner_events, pointer_mode, keyboard_mode, time):
+        self.display.log.append(('grab_keyboard', keyboard_mode))
+
+
+class Screen(object):
+    def __init__(self, root, size):
+        self.root = root
+        self.width_in_pixels, self.height_in_pixels = size
+
+
+class FakeDisplay(object):
+    """
+    A connection to a server whose keyboard has the given rows of keysyms, for
+    the keycodes from min_keycode on. modifiers lists the keycodes of each of
+    the 8 modifiers, Shift to Mod5. The screen has the given size, and no
+    extension.
+    """
+    def __init__(self, rows=(), modifiers=(), min_keycode=8, width=4,
+                 size=(1920, 1080)):
+        self.rows = [(list(row) + [0] * width)[:width] for row in rows]
+        self.modifiers = [list(codes) for codes in modifiers]
+        self.modifiers += [[] for i in range(8 - len(self.modifiers))]
+        self.display = Protocol(Info(min_keycode,
+                                     min_keycode + len(rows) - 1))
+        self.log = []
+        self.root = Root(self)
+        self.size = size
+        self.pointer = (0, 0)
+        #Written to when an event is sent, so that the connection selects
+        #as readable
+        self._read, self._write = os.pipe()
+        os.set_blocking(self._read, False)
+
+    def close(self):
+        if self._read is not None:
+            os.close(self._read)
+            os.close(self._write)
+            self._read = self._write = None
+
+    def fileno(self):
+        return self._read
+
+    def flush(self):
+        self.log.append('flush')
+
+    def sync(self):
+        self.log.append('sync')
+
+    def screen(self):
+        return Screen(self.root, self.size)
+
+    def has_extension(self, name):
+        return False
+
+    def ungrab_keyboard(self, time):
+        self.log.append('ungrab_keyboard')
+
+    def allow_events(self, mode, time):
+        self.log.append(('allow_events', mode))
+
+    def pending_events(self):
+        if self._read is not None:
+            try:
+                os.read(self._read, 4096)
+            except BlockingIOError:
+                pass
+        return len(self.display.event_queue)
+
+    def next_event(self):
+        return self.display.event_queue.pop(0)
+
+    def receive(self, event):
+        """Queue an event as if it had been read with a reply."""
+        self.display.event_queue.append(event)
+
+    def send(self, event):
+        """Send an event from the server, waking up a select on the display."""
+        self.display.event_queue.append(event)
+        os.write(self._write, b'\0')
+
+    #The keyboard mapping
+
+    def get_keyboard_mapping(self, first, count):
+        self.log.append(('get_keyboard_mapping', first, count))
+        start = first - self.display.info.min_keycode
+        return [list(row) for row in self.rows[start:start + count]]
+
+    def change_keyboard_mapping(self, first, rows):
+        self.log.append(('change_keyboard_mapping', first,
+                         [row[0] for row in rows]))
+        start = first - self.display.info.min_keycode
+        for offset, row in enumerate(rows):
+            self.rows[start + offset] = list(row)
+        #Every client is told of the change
+        self.receive(Event(type=X.MappingNotify, request=X.MappingKeyboard,
+                           first_keycode=first, count=len(rows)))
+
+    def refresh_keyboard_mapping(self, event):
+        pass
+
+    def keycode_to_keysym(self, keycode, index):
+        start = keycode - self.display.info.min_keycode
+        if not 0 <= start < len(self.rows) or index >= len(self.rows[start]):
+            return 0
+        return self.rows[start][index]
+
+    def keysym_to_keycode(self, keysym):
+        for index in range(len(self.rows[0])):
+            for offset, row in enumerate(self.rows):
+                if keysym and row[index] == keysym:
+                    return self.display.info.min_keycode + offset
+        return 0
+
+    def get_modifier_mapping(self):
+        return self.modifiers
@@ -0,0 +1,55 @@
+'''
+Tests for the queued delivery of listener events. These do not need a
+display.
+
+to start:
+
+    nosetests -v tests/test_delivery.py
+'''
+
+from unittest import TestCase
+import threading
+
+from pymouse.delivery import EventQueue, BLOCK, COALESCE_MOTION
+
+
+class Test(TestCase):
+    def test_drop_oldest(self):
+        queue = EventQueue(2)
+        for i in range(4):
+            queue.put(('move', (i, i)), motion=True)
+        self.assertEqual([('move', (2, 2)), ('move', (3, 3))], queue.drain())
+        self.assertEqual(2, queue.dropped)
+
+    def test_coalesce_motion(self):
+        queue = EventQueue(8, COALESCE_MOTION)
+        queue.put(('move', (0, 0)), motion=True)
+        queue.put(('move', (1, 1)), motion=True)
+        queue.put(('click', (1, 1, 1, True)))
+        queue.put(('move', (2, 2)), motion=True)
+        queue.put(('move', (3, 3)), motion=True)
+        self.assertEqual([('move', (1, 1)), ('click', (1, 1, 1, True)),
+                          ('move', (3, 3))], queue.drain())
+        self.assertEqual(2, queue.coalesced)
+        self.assertEqual(0, queue.dropped)
+
+    def test_block(self):
+        queue = EventQueue(1, BLOCK)
+        queue.put(('move', (0, 0)), motion=True)
+        producer = threading.Thread(target=queue.put,
+                                    args=(('move', (1, 1)),))
+        producer.start()
+        producer.join(0.05)
+        self.assertTrue(producer.is_alive())
+        self.assertEqual([('move', (0, 0))], queue.drain())
+        producer.join(1)
+        self.assertEqual([('move', (1, 1))], queue.drain())
+        self.assertEqual(0, queue.dropped)
+
+    def test_close(self):
+        queue = EventQueue(4)
+        queue.put(('move', (0, 0)), motion=True)
+        queue.close()
+        self.assertFalse(queue.put(('move', (1, 1)), motion=True))
+        self.assertEqual([('move', (0, 0))], queue.drain())
+        self.assertEqual(None, queue.drain())
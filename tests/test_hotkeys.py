@@ -0,0 +1,174 @@
+'''
+Tests for the hotkey matcher of pykeyboard. These do not need a display.
+
+to start:
+
+    nosetests -v tests/test_hotkeys.py
+'''
+
+from unittest import TestCase
+import string
+import threading
+
+from pykeyboard.hotkeys import Hotkeys
+
+SHIFT, LOCK, CONTROL, ALT, NUM_LOCK = 1, 2, 4, 8, 16
+
+
+class Listener(object):
+    """Stands for a keyboard listener, with a keycode for each letter."""
+    modifier_bits = {'Shift': SHIFT, 'Lock': LOCK, 'Control': CONTROL,
+                     'Alt': ALT, 'Num_Lock': NUM_LOCK, 'Super': 0}
+    modifier_keycodes = {'Shift': [50], 'Control': [37]}
+
+    def lookup_character_keycode(self, character):
+        return string.ascii_lowercase.index(character) + 10
+
+
+def keycode(character):
+    return Listener().lookup_character_keycode(character)
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.hotkeys = Hotkeys(Listener())
+        self.fired = []
+
+    def bind(self, hotkey):
+        self.hotkeys.add(hotkey, lambda: self.fired.append(hotkey))
+
+    def type(self, *keys):
+        for character, state in keys:
+            self.hotkeys.feed(keycode(character), state, True)
+            self.hotkeys.feed(keycode(character), state, False)
+
+    def test_chord(self):
+        self.bind('ctrl+shift+k')
+        self.type(('k', CONTROL), ('k', SHIFT))
+        self.assertEqual([], self.fired)
+        self.hotkeys.feed(37, 0, True)  # Control itself
+        self.type(('k', CONTROL | SHIFT))
+        self.assertEqual(['ctrl+shift+k'], self.fired)
+
+    def test_unbound_modifiers(self):
+        self.bind('ctrl+s')
+        #Lock and Num_Lock, which no binding uses, are ignored
+        self.type(('s', CONTROL | LOCK | NUM_LOCK))
+        self.assertEqual(['ctrl+s'], self.fired)
+
+    def test_other_modifiers(self):
+        #Whatever the modifiers of the other bindings, the others must match
+        self.bind('k')
+        self.bind('g g')
+        self.type(('k', CONTROL), ('k', ALT), ('g', SHIFT), ('g', SHIFT))
+        self.assertEqual([], self.fired)
+        self.type(('k', LOCK), ('g', NUM_LOCK), ('g', 0))
+        self.assertEqual(['k', 'g g'], self.fired)
+
+    def test_pointer_buttons(self):
+        #Button1 held while typing
+        self.bind('ctrl+s')
+        self.type(('s', CONTROL | 0x100))
+        self.assertEqual(['ctrl+s'], self.fired)
+
+    def test_sequences(self):
+        self.bind('g g')
+        self.bind('ctrl+x ctrl+s')
+        self.type(('g', 0), ('x', 0), ('g', 0), ('g', 0))
+        self.assertEqual(['g g'], self.fired)
+        self.type(('x', CONTROL))
+        self.hotkeys.feed(37, CONTROL, True)
+        self.type(('s', CONTROL))
+        self.assertEqual(['g g', 'ctrl+x ctrl+s'], self.fired)
+
+    def test_restart(self):
+        self.bind('a b')
+        self.type(('a', 0), ('a', 0), ('b', 0))
+        self.assertEqual(['a b'], self.fired)
+
+    def test_matched(self):
+        self.bind('ctrl+x ctrl+s')
+        hotkeys = self.hotkeys
+        hotkeys.feed(keycode('x'), CONTROL, True)
+        self.assertTrue(hotkeys.matched)
+        hotkeys.feed(37, CONTROL, True)  # Control itself
+        self.assertIsNone(hotkeys.matched)
+        hotkeys.feed(keycode('x'), CONTROL, False)
+        self.assertIsNone(hotkeys.matched)
+        hotkeys.feed(keycode('a'), 0, True)
+        self.assertIs(False, hotkeys.matched)
+
+    def test_prefix(self):
+        self.bind('g')
+        self.bind('g g')
+        self.type(('g', 0), ('g', 0))
+        self.assertEqual(['g', 'g g'], self.fired)
+
+    def test_timeout(self):
+        self.hotkeys.timeout = 0
+        self.bind('a b')
+        self.type(('a', 0))
+        self.hotkeys._last -= 1
+        self.type(('b', 0))
+        self.assertEqual([], self.fired)
+
+    def test_remove(self):
+        self.bind('ctrl+a')
+        self.bind('ctrl+b')
+        self.hotkeys.remove('ctrl+a')
+        self.type(('a', CONTROL), ('b', CONTROL))
+        self.assertEqual(['ctrl+b'], self.fired)
+
+    def test_many(self):
+        letters = string.ascii_lowercase
+        for a in letters:
+            for b in letters:
+                for c in letters[:4]:
+                    self.bind('{0} alt+{1} {2}'.format(a, b, c))
+        self.type(('q', 0), ('r', ALT), ('d', 0))
+        self.assertEqual(['q alt+r d'], self.fired)
+
+    def test_errors(self):
+        self.assertRaises(ValueError, self.hotkeys.parse, 'super+a')
+        self.assertRaises(ValueError, self.hotkeys.parse, 'hyper+a')
+        self.assertRaises(ValueError, self.hotkeys.parse, ' ')
+        self.assertEqual([(99, CONTROL)], self.hotkeys.parse('ctrl+99'))
+
+    def test_swapped_trie(self):
+        self.bind('a b')
+        root = self.hotkeys.compile()[0]
+        self.bind('c')
+        #The trie in use is left as it was, a new one is compiled
+        self.assertEqual([(keycode('a'), 0)], list(root.children))
+        self.type(('c', 0))
+        self.assertEqual(['c'], self.fired)
+
+    def test_threads(self):
+        self.bind('a')
+        done = threading.Event()
+
+        def rebind():
+            while not done.is_set():
+                self.hotkeys.add('b', self.fired.append)
+                self.hotkeys.remove('b')
+        thread = threading.Thread(target=rebind)
+        thread.start()
+        try:
+            for i in range(2000):
+                self.type(('a', 0))
+        finally:
+            done.set()
+            thread.join()
+        self.assertEqual(['a'] * 2000, self.fired)
+
+    def test_deadline(self):
+        self.bind('a b')
+        self.assertIsNone(self.hotkeys.deadline)
+        self.type(('a', 0))
+        #No time limit
+        self.assertIsNone(self.hotkeys.deadline)
+        self.hotkeys.timeout = 5
+        self.type(('a', 0))
+        self.assertAlmostEqual(self.hotkeys._last + 5, self.hotkeys.deadline)
+        self.type(('b', 0))
+        self.assertIsNone(self.hotkeys.deadline)
@@ -0,0 +1,101 @@
+'''
+Tests for the InputEvent tuples given to the listeners whose records attribute
+is True. These do not need a display.
+
+to start:
+
+    nosetests -v tests/test_input_event.py
+'''
+
+from unittest import TestCase
+import asyncio
+
+from pymouse.base import InputEvent
+from pymouse.session import (MOTION, BUTTON_PRESS, BUTTON_RELEASE, KEY_PRESS,
+                             KEY_RELEASE)
+from pymouse.x11 import AsyncPyMouseEvent
+from pykeyboard.x11 import AsyncPyKeyboardEvent
+
+
+def event(event_type, time=1000, received=1.0, detail=1, character=None):
+    return InputEvent(time, received, event_type, 10, 20, detail, 0,
+                      character, 0x100)
+
+
+class Test(TestCase):
+    def test_immutable(self):
+        pressed = event(BUTTON_PRESS)
+        self.assertRaises(AttributeError, setattr, pressed, 'x', 0)
+        self.assertRaises(AttributeError, setattr, pressed, 'other', 0)
+        self.assertFalse(hasattr(pressed, '__dict__'))
+
+    def test_press(self):
+        self.assertEqual([False, True, False, True, False],
+                         [event(event_type).press for event_type in
+                          (MOTION, BUTTON_PRESS, BUTTON_RELEASE, KEY_PRESS,
+                           KEY_RELEASE)])
+
+    def test_order(self):
+        #By server time, even if received in another order
+        events = [event(MOTION, 1002, 1.0), event(KEY_PRESS, 1000, 3.0),
+                  event(BUTTON_PRESS, 1001, 2.0)]
+        self.assertEqual([1000, 1001, 1002],
+                         [each.time for each in sorted(events)])
+
+
+class Clicks(AsyncPyMouseEvent):
+    """Queues the events given to _record, without a display."""
+    records = True
+
+    def __init__(self):
+        self._async_init()
+
+
+class TestNextClick(TestCase):
+    def test_records(self):
+        released = event(BUTTON_RELEASE, detail=3)
+        pressed = event(BUTTON_PRESS, detail=3)
+
+        async def clicks():
+            listener = Clicks()
+            listener._events = asyncio.Queue()
+            for recorded in (event(BUTTON_PRESS), released, pressed):
+                listener._record('click', recorded)
+            listener._record('click', released)
+            return (await listener.next_click(button=3),
+                    await listener.next_click(button=3, press=False))
+        self.assertEqual(((pressed,), (released,)), asyncio.run(clicks()))
+
+
+class Keys(AsyncPyKeyboardEvent):
+    """Queues the events given to tap, without a display."""
+    records = True
+
+    def __init__(self):
+        self._async_init()
+
+
+class TestNextKey(TestCase):
+    def test_records(self):
+        pressed = event(KEY_PRESS, detail=38, character='a')
+        released = event(KEY_RELEASE, detail=38, character='a')
+
+        async def keys():
+            listener = Keys()
+            listener._events = asyncio.Queue()
+            for recorded in (event(KEY_PRESS, detail=39, character='s'),
+                             released, pressed, released):
+                listener.tap(recorded)
+            return (await listener.next_key('a'),
+                    await listener.next_key('a', press=False))
+        self.assertEqual(((pressed,), (released,)), asyncio.run(keys()))
+
+    def test_arguments(self):
+        async def keys():
+            listener = Keys()
+            listener.records = False
+            listener._events = asyncio.Queue()
+            listener.tap(39, 's', True)
+            listener.tap(38, 'a', True)
+            return await listener.next_key('a')
+        self.assertEqual((38, 'a', True), asyncio.run(keys()))
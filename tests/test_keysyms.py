@@ -0,0 +1,47 @@
+'''
+Tests for the keysym translation tables of pykeyboard. These do not need a
+display.
+
+to start:
+
+    nosetests -v tests/test_keysyms.py
+'''
+
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+
+from pykeyboard import x11_keysyms as x11
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.cache_dir = x11.KEYSYM_CACHE_DIR
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        x11.KEYSYM_CACHE_DIR = self.cache_dir
+        shutil.rmtree(self.directory)
+
+    def test_shared(self):
+        keysym_to_string, string_to_keysym = x11.translation_dicts()
+        self.assertIs(keysym_to_string, x11.translation_dicts()[0])
+        self.assertEqual(0xff1b, string_to_keysym['Escape'])
+        self.assertEqual('a', keysym_to_string[0x61])
+        self.assertEqual('Greek_alpha', keysym_to_string[0x7e1])
+        with self.assertRaises(TypeError):
+            string_to_keysym['a'] = 0
+
+    def test_groups(self):
+        groups = x11.KEYSYM_GROUPS + ('cyrillic',)
+        string_to_keysym = x11.translation_dicts(groups)[1]
+        self.assertEqual(0x6c1, string_to_keysym['Cyrillic_a'])
+        self.assertNotIn('Cyrillic_a', x11.translation_dicts()[1])
+
+    def test_cache_dir(self):
+        x11.KEYSYM_CACHE_DIR = self.directory
+        groups = ('hebrew',)
+        built = x11._load_tables(groups)
+        self.assertEqual(1, len(os.listdir(self.directory)))
+        self.assertEqual(built, x11._load_tables(groups))
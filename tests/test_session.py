@@ -0,0 +1,273 @@
+'''
+Tests for the session file format, and for the recording and replay of
+sessions with stub listeners and controllers. These do not need a display.
+
+to start:
+
+    nosetests -v tests/test_session.py
+'''
+
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+import time
+
+import pykeyboard
+import pymouse
+from pymouse import session
+
+
+def write_session(path, count):
+    writer = session.SessionWriter(path)
+    for i in range(count):
+        writer.write(session.MOTION, 0, i % 800, i % 600)
+    writer.close()
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.puis')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        writer = session.SessionWriter(self.path)
+        for i in range(session.CHUNK + 10):
+            writer.write(session.MOTION, 0, i % 800, -i % 600)
+        writer.write(session.KEY_PRESS, 38, state=1)
+        writer.close()
+        records = list(session.iter_records(self.path))
+        self.assertEqual(session.CHUNK + 11, len(records))
+        self.assertEqual((session.MOTION, 0, 1, 599), records[1][1:5])
+        self.assertEqual((session.KEY_PRESS, 38, 0, 0, 1), records[-1][1:])
+        timestamps = [record[0] for record in records]
+        self.assertEqual(sorted(timestamps), timestamps)
+
+    def test_not_a_session(self):
+        with open(self.path, 'wb') as writefile:
+            writefile.write(b'\0' * 64)
+        self.assertRaises(ValueError, list, session.iter_records(self.path))
+
+    def check_find(self, path):
+        with session.SessionFile(path) as recorded:
+            timestamps = [record[0] for record in recorded.records()]
+            for target in timestamps[::97] + [timestamps[-1] + 1, -1]:
+                expected = len([t for t in timestamps if t < target])
+                self.assertEqual(expected, recorded.find(target / 1000000.0))
+            start, end = timestamps[500] / 1e6, timestamps[3000] / 1e6
+            found = recorded.between(start, end)
+            self.assertEqual(recorded.find(end) - recorded.find(start),
+                             len(found) if session.numpy is not None else
+                             len(found) // session.RECORD.size)
+            del found
+
+    def test_find(self):
+        write_session(self.path, 5 * session.INDEX_STRIDE + 3)
+        self.check_find(self.path)
+
+    def test_find_unindexed(self):
+        write_session(self.path, 5 * session.INDEX_STRIDE + 3)
+        with open(self.path, 'r+b') as rewrite:
+            header = session.HEADER.unpack(rewrite.read(session.HEADER.size))
+            rewrite.seek(0)
+            rewrite.write(session.HEADER.pack(*header[:4] + (0, 0)))
+            rewrite.truncate(session.HEADER.size +
+                             header[4] * session.RECORD.size)
+        self.check_find(self.path)
+
+
+def write_records(path, records):
+    """Write a version 2 session file of the given records, unindexed."""
+    with open(path, 'wb') as writefile:
+        writefile.write(session.HEADER.pack(session.MAGIC, session.VERSION,
+                                            session.RECORD.size, 0.0, 0, 0))
+        for record in records:
+            writefile.write(session.RECORD.pack(*record))
+
+
+class Controller(object):
+    """Stands for both PyMouse and PyKeyboard, logging the calls made."""
+    def __init__(self):
+        self.log = []
+        self.times = []
+
+    def _call(self, *call):
+        self.log.append(call)
+        self.times.append(time.monotonic())
+
+    def batch(self, sync=True):
+        controller = self
+
+        class Batch(object):
+            def __enter__(self):
+                controller.log.append('batch')
+
+            def __exit__(self, *exc_info):
+                controller.log.append('sync' if sync else 'flush')
+        return Batch()
+
+    def move(self, x, y):
+        self._call('move', x, y)
+
+    def press(self, x, y, button):
+        self._call('press', x, y, button)
+
+    def release(self, x, y, button):
+        self._call('release', x, y, button)
+
+    def press_key(self, keycode):
+        self._call('press_key', keycode)
+
+    def release_key(self, keycode):
+        self._call('release_key', keycode)
+
+
+RECORDS = [(0, session.MOTION, 0, 10, 20, 0),
+           (0, session.BUTTON_PRESS, 1, 10, 20, 0),
+           (20000, session.BUTTON_RELEASE, 1, 10, 20, 0),
+           (20000, session.KEY_PRESS, 38, 0, 0, 1),
+           (40000, session.KEY_RELEASE, 38, 0, 0, 0)]
+
+
+class TestPlayer(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.puis')
+        write_records(self.path, RECORDS)
+        self.controller = Controller()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_fast(self):
+        controller = self.controller
+        session.SessionPlayer(self.path, controller, controller,
+                              speed=None).play()
+        #Batched on both devices, with a single sync
+        self.assertEqual(['batch', 'batch',
+                          ('move', 10, 20),
+                          ('press', 10, 20, 1),
+                          ('release', 10, 20, 1),
+                          ('press_key', 38),
+                          ('release_key', 38),
+                          'flush', 'sync'], controller.log)
+
+    def test_timing(self):
+        controller = self.controller
+        session.SessionPlayer(self.path, controller, controller).play()
+        #The events due together are sent in one batch
+        self.assertEqual(['batch', 'batch', 'move', 'press', 'flush', 'sync',
+                          'batch', 'batch', 'release', 'press_key', 'flush',
+                          'sync',
+                          'batch', 'batch', 'release_key', 'flush', 'sync'],
+                         [entry if isinstance(entry, str) else entry[0]
+                          for entry in controller.log])
+        times = controller.times
+        self.assertGreaterEqual(times[2] - times[0], 0.02)
+        self.assertGreaterEqual(times[4] - times[0], 0.04)
+        self.assertLess(times[4] - times[0], 0.5)
+
+    def test_speed(self):
+        controller = self.controller
+        session.SessionPlayer(self.path, controller, controller,
+                              speed=2).play()
+        times = controller.times
+        self.assertGreaterEqual(times[4] - times[0], 0.02)
+        self.assertLess(times[4] - times[0], 0.04)
+
+    def test_part(self):
+        controller = self.controller
+        session.SessionPlayer(self.path, controller, controller).play(
+            start=0.01, end=0.03)
+        #Due immediately
+        self.assertLess(controller.times[-1] - controller.times[0], 0.01)
+        self.assertEqual([('release', 10, 20, 1), ('press_key', 38)],
+                         [entry for entry in controller.log
+                          if not isinstance(entry, str)])
+
+    def test_keyboard_only(self):
+        controller = self.controller
+        session.SessionPlayer(self.path, keyboard=controller,
+                              speed=None).play()
+        #Synced by the keyboard, without a mouse
+        self.assertEqual(['batch', ('press_key', 38), ('release_key', 38),
+                          'sync'], controller.log)
+
+
+class Listener(object):
+    """Stands for PyMouseEvent and PyKeyboardEvent."""
+    def __init__(self, **listener_args):
+        self.listener_args = listener_args
+        self.started = self.stopped = False
+
+    def start(self):
+        self.started = True
+
+    def stop(self):
+        self.stopped = True
+
+    def _tap(self, event, received=None):
+        self.tap(event.detail, None, event.press)
+
+
+class Event(object):
+    def __init__(self, detail, press, state):
+        self.detail = detail
+        self.press = press
+        self.state = state
+
+
+class TestRecorder(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.puis')
+        classes = pymouse.PyMouseEvent, pykeyboard.PyKeyboardEvent
+        pymouse.PyMouseEvent = pykeyboard.PyKeyboardEvent = Listener
+
+        def restore():
+            pymouse.PyMouseEvent, pykeyboard.PyKeyboardEvent = classes
+        self.addCleanup(restore)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_record(self):
+        recorder = session.SessionRecorder(self.path, display=':0')
+        mouse, keyboard = recorder.listeners
+        self.assertEqual({'display': ':0'}, mouse.listener_args)
+        recorder.start()
+        self.assertTrue(mouse.started and keyboard.started)
+        mouse.move(10, 20)
+        mouse.click(10, 20, 1, True)
+        keyboard._tap(Event(38, True, 1))
+        keyboard._tap(Event(38, False, 0))
+        mouse.click(10, 20, 1, False)
+        recorder.stop()
+        self.assertTrue(mouse.stopped and keyboard.stopped)
+        self.assertEqual([(session.MOTION, 0, 10, 20, 0),
+                          (session.BUTTON_PRESS, 1, 10, 20, 0),
+                          (session.KEY_PRESS, 38, 0, 0, 1),
+                          (session.KEY_RELEASE, 38, 0, 0, 0),
+                          (session.BUTTON_RELEASE, 1, 10, 20, 0)],
+                         [record[1:] for record in
+                          session.iter_records(self.path)])
+
+    def test_listener_args(self):
+        recorder = session.SessionRecorder(
+            self.path, display=':0', mouse_args={'capture_move': True},
+            keyboard_args={'hub': True})
+        mouse, keyboard = recorder.listeners
+        self.assertEqual({'display': ':0', 'capture_move': True},
+                         mouse.listener_args)
+        self.assertEqual({'display': ':0', 'hub': True},
+                         keyboard.listener_args)
+        recorder.stop()
+
+    def test_mouse_only(self):
+        recorder = session.SessionRecorder(self.path, keyboard=False)
+        self.assertEqual(1, len(recorder.listeners))
+        recorder.stop()
+        self.assertEqual([], list(session.iter_records(self.path)))
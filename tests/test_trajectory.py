@@ -0,0 +1,55 @@
+'''
+Tests for the path computations behind PyMouse.move_path, with and without
+NumPy. These do not need a display.
+
+to start:
+
+    nosetests -v tests/test_trajectory.py
+'''
+
+from unittest import TestCase
+
+from pymouse import trajectory
+from pymouse.trajectory import Polyline, Bezier, MinimumJerk
+
+
+class PathTests(object):
+    def test_polyline_vertices(self):
+        self.assertEqual([(0, 0), (4, 4)], Polyline([(0, 0), (4, 4)]).points())
+
+    def test_polyline_resample(self):
+        path = Polyline([(0, 0), (10, 0), (10, 10)])
+        self.assertEqual([(0, 0), (5, 0), (10, 0), (10, 5), (10, 10)],
+                         path.points(5))
+
+    def test_bezier(self):
+        path = Bezier([(0, 0), (50, 100), (100, 0)])
+        self.assertEqual([(0, 0), (25, 38), (50, 50), (75, 38), (100, 0)],
+                         path.points(5))
+
+    def test_minimum_jerk(self):
+        points = MinimumJerk((0, 0), (100, 50)).points(5)
+        self.assertEqual([(0, 0), (10, 5), (50, 25), (90, 45), (100, 50)],
+                         points)
+
+    def test_plan(self):
+        points, period = trajectory.plan([(0, 0), (100, 0)], duration=1,
+                                         rate=10)
+        self.assertEqual(11, len(points))
+        self.assertEqual((100, 0), points[-1])
+        self.assertAlmostEqual(0.1, period)
+
+
+class TestPython(PathTests, TestCase):
+    def setUp(self):
+        self.numpy = trajectory.numpy
+        trajectory.numpy = None
+
+    def tearDown(self):
+        trajectory.numpy = self.numpy
+
+
+class TestNumpy(PathTests, TestCase):
+    def setUp(self):
+        if trajectory.numpy is None:
+            self.skipTest('NumPy is not installed')
@@ -0,0 +1,81 @@
+'''
+Tests for the asyncio support of the X11 listeners, with a fake display.
+
+to start:
+
+    nosetests -v tests/test_x11_async.py
+'''
+
+from unittest import TestCase
+
+from pymouse.x11_async import AsyncRecordListener
+
+
+class FakeDisplay(object):
+    """Logs the requests, and refuses them once closed."""
+    def __init__(self, log, listener=None):
+        self.log = log
+        self.listener = listener
+        self.closed = False
+
+    def _request(self, name):
+        if self.closed:
+            raise IOError('display closed')
+        self.log.append(name)
+
+    def fileno(self):
+        return 7
+
+    def flush(self):
+        self._request('flush')
+
+    def record_disable_context(self, ctx):
+        self._request('disable')
+
+    def record_free_context(self, ctx):
+        self._request('free')
+
+    def close(self):
+        self._request('close')
+        self.closed = True
+
+    def pending_events(self):
+        #Parses a reply, then goes on reading from the connection
+        self._request('read')
+        self.listener.handler(None)
+        self._request('read more')
+
+
+class FakeLoop(object):
+    def remove_reader(self, fd):
+        pass
+
+
+class Listener(AsyncRecordListener):
+    def __init__(self, log):
+        self.display = FakeDisplay(log)
+        self.display2 = FakeDisplay(log, self)
+        self.ctx = 1
+        self.state = True
+        self._async_init()
+        self._loop = FakeLoop()
+
+    def handler(self, reply):
+        self.stop()
+
+
+class Test(TestCase):
+    def test_stop_from_handler(self):
+        log = []
+        listener = Listener(log)
+        listener._readable()
+        self.assertEqual(['read', 'disable', 'flush', 'read more', 'free',
+                          'close'], log)
+        self.assertFalse(listener.state)
+
+    def test_stop(self):
+        log = []
+        listener = Listener(log)
+        listener.stop()
+        listener.stop()
+        self.assertEqual(['disable', 'flush', 'free', 'close'], log)
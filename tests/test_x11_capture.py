@@ -0,0 +1,140 @@
+'''
+Tests for the shared memory event ring of the X11 capture process, and for
+the capture process with a stub in place of the recording. These do not need
+a display.
+
+to start:
+
+    nosetests -v tests/test_x11_capture.py
+'''
+
+from unittest import TestCase
+import os
+import time
+
+from Xlib import X
+
+from pymouse.x11_capture import CaptureProcess, EventRing
+from pymouse.x11_record import decode_events, _core
+
+
+def pack(detail):
+    return _core.pack(X.MotionNotify, detail, 1, 1000, 0x100, 0x100, 0,
+                      detail, 0, detail, 0, 0, 1)
+
+
+def details(records):
+    data, times = records
+    return [event.detail for event in decode_events(data)]
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.ring = EventRing(4)
+        self.addCleanup(self.ring.unlink)
+        self.addCleanup(self.ring.close)
+
+    def test_put_get(self):
+        self.assertEqual((b'', ()), self.ring.get())
+        self.ring.put(pack(1) + pack(2), 10.5)
+        self.ring.put(pack(3), 11.5)
+        self.assertEqual([1, 2, 3], details(self.ring.get()))
+        self.assertEqual((b'', ()), self.ring.get())
+
+    def test_times(self):
+        self.ring.put(pack(1) + pack(2), 10.5)
+        self.ring.put(pack(3), 11.5)
+        self.assertEqual((10.5, 10.5, 11.5), self.ring.get()[1])
+
+    def test_wrap_around(self):
+        for detail in range(1, 10, 3):
+            self.ring.put(pack(detail) + pack(detail + 1) + pack(detail + 2),
+                          float(detail))
+            records = self.ring.get()
+            self.assertEqual([detail, detail + 1, detail + 2],
+                             details(records))
+            self.assertEqual((float(detail),) * 3, records[1])
+
+    def test_full(self):
+        self.ring.put(b''.join(pack(detail) for detail in range(6)), 1.0)
+        self.ring.put(pack(6), 2.0)
+        self.assertEqual(3, self.ring.dropped)
+        records = self.ring.get()
+        self.assertEqual([0, 1, 2, 3], details(records))
+        self.assertEqual((1.0,) * 4, records[1])
+
+    def test_open_by_name(self):
+        producer = EventRing(name=self.ring.name)
+        self.assertEqual(4, producer.capacity)
+        producer.put(pack(7), 7.0)
+        producer.close()
+        self.assertEqual((pack(7), (7.0,)), self.ring.get())
+
+
+def capture_stub(name, types, ring_name, notify, control):
+    """
+    Stands for the recording in the child process: puts a record for each
+    event type, with the type as detail, then waits to be stopped.
+    """
+    ring = EventRing(name=ring_name)
+    ring.put(b''.join(pack(event_type) for event_type in types),
+             time.monotonic())
+    os.write(notify.fileno(), b'\0')
+    #Readable once the listening process has closed its end
+    control.poll(None)
+    ring.close()
+    notify.close()
+
+
+class StubCapture(CaptureProcess):
+    _target = staticmethod(capture_stub)
+
+
+class TestProcess(TestCase):
+    def test_capture(self):
+        capture = StubCapture()
+        capture.start((X.KeyRelease, X.KeyPress))
+        received = []
+        for events in capture:
+            received += [event.detail for event in events]
+            capture.stop()
+        self.assertEqual([X.KeyPress, X.KeyRelease], received)
+        self.assertEqual(0, capture.dropped)
+        self.assertIsNone(capture._process)
+
+    def test_chunk_times(self):
+        #Stamped by the child, on the same clock
+        started = time.monotonic()
+        capture = StubCapture()
+        capture.start((X.KeyPress, X.KeyRelease))
+        capture.stop()
+        chunks = list(capture.chunks())
+        self.assertEqual(1, len(chunks))
+        data, times = chunks[0]
+        self.assertEqual(2, len(times))
+        self.assertTrue(started <= times[0] == times[1] <= time.monotonic())
+
+    def test_stop_first(self):
+        #Stopped before the child has even started, the iteration still
+        #ends, after the events the child recorded
+        capture = StubCapture()
+        capture.start((X.KeyPress,))
+        capture.stop()
+        self.assertEqual([[X.KeyPress]],
+                         [[event.detail for event in events]
+                          for events in capture])
+
+    def test_dropped(self):
+        capture = StubCapture(capacity=1)
+        capture.start((X.KeyPress, X.KeyRelease))
+        capture.stop()
+        self.assertEqual([[X.KeyPress]],
+                         [[event.detail for event in events]
+                          for events in capture])
+        self.assertEqual(1, capture.dropped)
+
+    def test_stopped(self):
+        capture = StubCapture()
+        capture.stop()
+        capture.start((X.KeyPress,))
+        self.assertEqual([], list(capture))
@@ -0,0 +1,171 @@
+'''
+Tests for the decoding of key events by PyKeyboardEvent on X11, with a fake
+display.
+
+to start:
+
+    nosetests -v tests/test_x11_decode.py
+'''
+
+from unittest import TestCase
+import gc
+import os
+import weakref
+
+from fake_xdisplay import Event, FakeDisplay, keysyms
+
+from Xlib import X
+
+from pymouse import x11_display
+from pymouse.x11_display import process_events
+from pykeyboard.x11 import PyKeyboardEvent
+
+SHIFT, LOCK, CONTROL, MOD2, MOD5 = 1, 2, 4, 16, 128
+
+ROWS = [keysyms('Shift_L'),  # 8
+        keysyms('Caps_Lock'),
+        keysyms('Mode_switch'),
+        keysyms('a', 'A', 'adiaeresis', 'Adiaeresis'),
+        keysyms('1', 'exclam'),
+        keysyms('Num_Lock'),  # 13
+        keysyms('KP_Home', 'KP_7'),
+        [0x10020ac]]  # The Unicode keysym of the euro sign
+
+#Shift, Lock, Control, Mod1 to Mod5
+MODIFIERS = [[8], [9], [], [], [13], [], [], [10]]
+
+#(keycode, state, character)
+DECODED = [
+    (11, 0, 'a'),
+    (11, SHIFT, 'A'),
+    (11, LOCK, 'A'),
+    (11, SHIFT | LOCK, 'a'),
+    (11, CONTROL, 'a'),
+    (11, MOD5, 'adiaeresis'),
+    (11, MOD5 | SHIFT, 'Adiaeresis'),
+    (12, 0, '1'),
+    (12, SHIFT, '!'),
+    (12, LOCK, '1'),
+    (14, 0, 'KP_Home'),
+    (14, MOD2, 'KP_7'),
+    (14, MOD2 | SHIFT, 'KP_Home'),
+    (15, 0, '€'),
+    (8, 0, 'Shift_L'),
+    (8, SHIFT | LOCK | MOD5, 'Shift_L'),
+    ]
+
+
+class Listener(PyKeyboardEvent):
+    def __init__(self, display):
+        PyKeyboardEvent.__init__(self, display, hub=True)
+        self.taps = []
+
+    def tap(self, keycode, character, press):
+        self.taps.append((keycode, character, press))
+
+
+class DecodeTest(TestCase):
+    modifiers = MODIFIERS
+
+    def setUp(self):
+        self.display = FakeDisplay(ROWS, self.modifiers)
+        self.addCleanup(self.display.close)
+        display_class = x11_display.Display
+        x11_display.Display = lambda name: self.display
+
+        def restore():
+            x11_display.Display = display_class
+        self.addCleanup(restore)
+        #A display name of its own, as the registry may still hold the
+        #display of an earlier test
+        self.listener = Listener(':' + self.id())
+
+    def decoded(self, keycode, state):
+        listener = self.listener
+        return listener._chars[listener._state_offsets[state] + keycode]
+
+
+class TestDecode(DecodeTest):
+    def test_decode_table(self):
+        for keycode, state, character in DECODED:
+            self.assertEqual(character, self.decoded(keycode, state),
+                             (keycode, state))
+
+    def test_decode(self):
+        #The table holds what _decode returns for each class of state
+        decode = self.listener._decode
+        self.assertEqual('A', decode(11, True, False, False, False))
+        self.assertEqual('A', decode(11, False, True, False, False))
+        self.assertEqual('Adiaeresis', decode(11, True, False, False, True))
+        self.assertEqual('KP_7', decode(14, False, False, True, False))
+
+    def test_state_offsets(self):
+        offsets = self.listener._state_offsets
+        self.assertEqual(256, len(offsets))
+        #Shift, Caps_Lock, Num_Lock and Mode_switch each make a class; the
+        #other modifiers do not change the characters
+        self.assertEqual(0, offsets[CONTROL])
+        self.assertEqual(0, offsets[CONTROL | 8 | 64])
+        self.assertEqual([256, 512, 1024, 2048],
+                         [offsets[SHIFT], offsets[LOCK], offsets[MOD2],
+                          offsets[MOD5]])
+        self.assertEqual(256 + 2048, offsets[SHIFT | MOD5 | CONTROL])
+
+    def test_tap(self):
+        listener = self.listener
+        listener._tap(Event(detail=11, type=X.KeyPress, state=SHIFT))
+        listener._tap(Event(detail=11, type=X.KeyRelease, state=SHIFT))
+        self.assertEqual([(11, 'A', True), (11, 'A', False)], listener.taps)
+        self.assertEqual(SHIFT, listener.modifier_state)
+
+    def test_mapping_changed(self):
+        listener = self.listener
+        self.display.rows[3] = keysyms('b', 'B', 0, 0)
+        self.display.receive(Event(type=X.MappingNotify,
+                                   request=X.MappingKeyboard,
+                                   first_keycode=11, count=1))
+        process_events(self.display)
+        self.assertTrue(listener._chars is None)
+        #Rebuilt at the next event
+        listener._tap(Event(detail=11, type=X.KeyPress, state=0))
+        self.assertEqual((11, 'b', True), listener.taps[-1])
+        self.assertEqual('B', self.decoded(11, SHIFT))
+
+
+class TestReleased(TestCase):
+    def test_released_with_display(self):
+        display = FakeDisplay(ROWS, MODIFIERS)
+        self.addCleanup(display.close)
+        display_class = x11_display.Display
+        x11_display.Display = lambda name: display
+
+        def restore():
+            x11_display.Display = display_class
+        self.addCleanup(restore)
+        #The MappingNotify handlers do not keep the listeners alive
+        name = ':' + self.id()
+        key = os.getpid(), name
+        listeners = [Listener(name) for i in range(5)]
+        references = [weakref.ref(listener) for listener in listeners]
+        self.assertEqual(5, x11_display._registry[key][1])
+        del listeners
+        gc.collect()
+        self.assertEqual([None] * 5, [reference() for reference in references])
+        #The last one gave back the shared connection
+        self.assertNotIn(key, x11_display._registry)
+
+
+class TestShiftLock(DecodeTest):
+    #Lock bound to Shift_Lock instead of Caps_Lock
+    modifiers = [[8], [16]] + MODIFIERS[2:]
+
+    def setUp(self):
+        ROWS.append(keysyms('Shift_Lock'))  # 16
+        self.addCleanup(ROWS.pop)
+        DecodeTest.setUp(self)
+
+    def test_shift_lock(self):
+        self.assertEqual('Shift_Lock', self.listener.lock_meaning)
+        #Shift_Lock acts as Shift, on every key
+        self.assertEqual('A', self.decoded(11, LOCK))
+        self.assertEqual('!', self.decoded(12, LOCK))
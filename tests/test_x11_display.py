@@ -0,0 +1,100 @@
+'''
+Tests for the event handling of the shared X connections, with a fake
+display.
+
+to start:
+
+    nosetests -v tests/test_x11_display.py
+'''
+
+from unittest import TestCase
+import gc
+import os
+import weakref
+
+from pymouse.x11_display import add_event_handler, process_events
+
+
+class Event(object):
+    def __init__(self, type):
+        self.type = type
+
+
+class Protocol(object):
+    def __init__(self):
+        self.event_queue = []
+
+
+class FakeDisplay(object):
+    """A connection whose socket is a pipe, which counts its reads."""
+    def __init__(self):
+        self.display = Protocol()
+        self._read, self._write = os.pipe()
+        self.reads = 0
+
+    def close(self):
+        os.close(self._read)
+        os.close(self._write)
+
+    def fileno(self):
+        return self._read
+
+    def receive(self, event):
+        self.sent = event
+        os.write(self._write, b'\0')
+
+    def pending_events(self):
+        #Reading also flushes the queued requests
+        self.reads += 1
+        os.read(self._read, 1)
+        self.display.event_queue.append(self.sent)
+        return len(self.display.event_queue)
+
+    def next_event(self):
+        return self.display.event_queue.pop(0)
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.display = FakeDisplay()
+        self.addCleanup(self.display.close)
+        self.handled = []
+        add_event_handler(self.display, 5, self.handled.append)
+
+    def test_nothing_arrived(self):
+        process_events(self.display)
+        self.assertEqual(0, self.display.reads)
+
+    def test_arrived(self):
+        event = Event(5)
+        self.display.receive(event)
+        process_events(self.display)
+        self.assertEqual([event], self.handled)
+        self.assertEqual(1, self.display.reads)
+
+    def test_already_read(self):
+        #Read along with the reply to some request
+        event = Event(5)
+        self.display.display.event_queue.append(event)
+        process_events(self.display)
+        self.assertEqual([event], self.handled)
+        self.assertEqual(0, self.display.reads)
+
+    def test_bound_method_held_weakly(self):
+        class Handler(object):
+            def handle(self, event):
+                handled.append(event)
+        handled = []
+        handler = Handler()
+        reference = weakref.ref(handler)
+        add_event_handler(self.display, 6, handler.handle)
+        event = Event(6)
+        self.display.display.event_queue.append(event)
+        process_events(self.display)
+        self.assertEqual([event], handled)
+        del handler
+        gc.collect()
+        self.assertIsNone(reference())
+        self.display.display.event_queue.append(Event(6))
+        process_events(self.display)
+        self.assertEqual([event], handled)
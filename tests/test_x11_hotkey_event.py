@@ -0,0 +1,164 @@
+'''
+Tests for PyKeyboardHotkeyEvent on X11, with a fake display.
+
+to start:
+
+    nosetests -v tests/test_x11_hotkey_event.py
+'''
+
+from unittest import TestCase
+import time
+
+from fake_xdisplay import Event, FakeDisplay, keysyms
+
+from Xlib import X
+
+from pymouse import x11_display
+from pykeyboard.x11 import PyKeyboardHotkeyEvent
+
+CONTROL, LOCK, MOD2 = X.ControlMask, X.LockMask, X.Mod2Mask
+CONTROL_L, KEY_X, KEY_S, KEY_K, KEY_A = 8, 9, 10, 11, 12
+
+ROWS = [keysyms('Control_L'),
+        keysyms('x', 'X'),
+        keysyms('s', 'S'),
+        keysyms('k', 'K'),
+        keysyms('a', 'A'),
+        keysyms('Num_Lock')]  # 13
+
+#Shift, Lock, Control, Mod1 to Mod5
+MODIFIERS = [[], [], [CONTROL_L], [], [13]]
+
+
+def press(keycode, state=0):
+    return Event(type=X.KeyPress, detail=keycode, state=state)
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.display = FakeDisplay(ROWS, MODIFIERS)
+        self.addCleanup(self.display.close)
+        display_class = x11_display.Display
+        x11_display.Display = lambda name: self.display
+
+        def restore():
+            x11_display.Display = display_class
+        self.addCleanup(restore)
+        #A display name of its own, as the registry may still hold the
+        #display of an earlier test
+        self.listener = PyKeyboardHotkeyEvent(':' + self.id(),
+                                              sequence_timeout=0.2)
+        self.fired = []
+        for hotkey in ('ctrl+k', 'ctrl+x ctrl+s'):
+            self.listener.add_hotkey(
+                hotkey, lambda hotkey=hotkey: self.fired.append(hotkey))
+
+    def start(self):
+        self.listener.start()
+        self.addCleanup(self.listener.join, 1)
+        self.addCleanup(self.listener.stop)
+        self.wait_for(lambda: ('ungrab_key', X.AnyKey, X.AnyModifier) in
+                      self.display.log)
+
+    def wait_for(self, condition, timeout=1.0):
+        end = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), end, 'timed out')
+            time.sleep(0.005)
+
+    def grabbed(self):
+        """True if the keyboard is grabbed, according to the log."""
+        grabbed = False
+        for entry in list(self.display.log):
+            if entry == ('grab_keyboard', X.GrabModeSync):
+                grabbed = True
+            elif entry in ('ungrab_keyboard',
+                           ('allow_events', X.ReplayKeyboard)):
+                grabbed = False
+        return grabbed
+
+    def test_grab_set(self):
+        self.listener._grab_keys(self.display.root)
+        grabs = set(entry[1:] for entry in self.display.log
+                    if entry[0] == 'grab_key')
+        #The first step of each hotkey, in every state of the locks
+        expected = set()
+        for keycode in (KEY_K, KEY_X):
+            for lock in (0, LOCK, MOD2, LOCK | MOD2):
+                expected.add((keycode, CONTROL | lock))
+        self.assertEqual(expected, grabs)
+        self.assertEqual([], self.listener.failed_grabs)
+
+    def test_chord(self):
+        self.start()
+        self.display.send(press(KEY_K, CONTROL | MOD2))
+        self.wait_for(lambda: self.fired)
+        self.assertEqual(['ctrl+k'], self.fired)
+        self.assertFalse(self.grabbed())
+        self.assertNotIn('ungrab_keyboard', self.display.log)
+
+    def test_sequence(self):
+        self.start()
+        self.display.send(press(KEY_X, CONTROL))
+        self.wait_for(self.grabbed)
+        self.display.send(press(KEY_S, CONTROL))
+        self.wait_for(lambda: self.fired)
+        self.assertEqual(['ctrl+x ctrl+s'], self.fired)
+        self.wait_for(lambda: not self.grabbed())
+        #The step was taken, not replayed
+        self.assertNotIn(('allow_events', X.ReplayKeyboard), self.display.log)
+
+    def test_released_during_sequence(self):
+        self.start()
+        self.display.send(press(KEY_X, CONTROL))
+        self.wait_for(self.grabbed)
+        released = len([entry for entry in self.display.log
+                        if entry == ('allow_events', X.SyncKeyboard)])
+        #The release is taken, and the next key event let through
+        self.display.send(Event(type=X.KeyRelease, detail=KEY_X,
+                                state=CONTROL))
+        self.wait_for(lambda: self.display.log.count(
+            ('allow_events', X.SyncKeyboard)) > released)
+        self.assertTrue(self.grabbed())
+
+    def test_abandoned(self):
+        self.start()
+        self.display.send(press(KEY_X, CONTROL))
+        self.wait_for(self.grabbed)
+        started = time.monotonic()
+        #No hotkey goes on with a, the keyboard is given back at once and
+        #the key press replayed to the focused window
+        self.display.send(press(KEY_A))
+        self.wait_for(lambda: not self.grabbed())
+        self.assertLess(time.monotonic() - started, 0.1)
+        self.assertIn(('allow_events', X.ReplayKeyboard), self.display.log)
+        self.assertNotIn('ungrab_keyboard', self.display.log)
+        self.assertEqual([], self.fired)
+
+    def test_sequence_timeout(self):
+        self.start()
+        started = time.monotonic()
+        self.display.send(press(KEY_X, CONTROL))
+        self.wait_for(self.grabbed)
+        #Given back when the time is up, without any other event
+        self.wait_for(lambda: not self.grabbed())
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.display.send(press(KEY_S, CONTROL))
+        time.sleep(0.05)
+        self.assertEqual([], self.fired)
+
+    def test_stop(self):
+        self.start()
+        started = time.monotonic()
+        self.listener.stop()
+        self.listener.join(1)
+        self.assertFalse(self.listener.is_alive())
+        self.assertLess(time.monotonic() - started, 0.1)
+        #display2, the same fake here, is closed
+        self.assertIsNone(self.display.fileno())
+
+    def test_regrab(self):
+        self.start()
+        self.listener.add_hotkey('ctrl+a', lambda: None)
+        self.wait_for(lambda: ('grab_key', KEY_A, CONTROL) in
+                      self.display.log)
@@ -0,0 +1,96 @@
+'''
+Tests for the shared RECORD hub of a display, with fake displays.
+
+to start:
+
+    nosetests -v tests/test_x11_hub.py
+'''
+
+from unittest import TestCase
+import threading
+
+from Xlib import X
+
+from pymouse import x11_hub
+from pymouse.x11_hub import RecordHub
+
+
+class FakeDisplay(object):
+    """Both connections of a hub: the shared one and the recording one."""
+    def __init__(self):
+        self.disabled = threading.Event()
+        self.enabled = threading.Event()
+        #Called on the hub's thread once the recording is enabled
+        self.on_enable = None
+
+    def record_create_context(self, datum_flags, clients, ranges):
+        return 'ctx'
+
+    def record_enable_context(self, ctx, handler):
+        self.enabled.set()
+        if self.on_enable is not None:
+            self.on_enable()
+        self.disabled.wait()
+
+    def record_disable_context(self, ctx):
+        self.disabled.set()
+
+    def record_register_clients(self, ctx, flags, clients, ranges):
+        pass
+
+    def record_free_context(self, ctx):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.display = FakeDisplay()
+        get_display = x11_hub.get_display
+        x11_hub.get_display = lambda name, shared=True: self.display
+
+        def restore():
+            x11_hub.get_display = get_display
+        self.addCleanup(restore)
+        self.hub = RecordHub(':hub-test')
+
+    def callback(self, event, received):
+        pass
+
+    def test_unsubscribe_joins(self):
+        self.hub.subscribe(self.callback, (X.KeyPress,))
+        thread = self.hub._thread
+        self.assertTrue(self.display.enabled.wait(1))
+        self.hub.unsubscribe(self.callback)
+        #The recording has ended by the time unsubscribe returns
+        self.assertFalse(thread.is_alive())
+        self.assertIsNone(self.hub._thread)
+
+    def test_unsubscribe_from_callback(self):
+        unsubscribed = threading.Event()
+        threads = []
+
+        def unsubscribe():
+            threads.append(threading.current_thread())
+            self.hub.unsubscribe(self.callback)
+            unsubscribed.set()
+        self.display.on_enable = unsubscribe
+        self.hub.subscribe(self.callback, (X.KeyPress,))
+        #The hub's thread does not wait for itself
+        self.assertTrue(unsubscribed.wait(1))
+        threads[0].join(1)
+        self.assertFalse(threads[0].is_alive())
+
+    def test_other_subscribers(self):
+        other = lambda event, received: None
+        self.hub.subscribe(self.callback, (X.KeyPress,))
+        self.hub.subscribe(other, (X.ButtonPress,))
+        self.hub.unsubscribe(self.callback)
+        self.assertTrue(self.hub._thread.is_alive())
+        self.hub.unsubscribe(other)
+        self.assertIsNone(self.hub._thread)
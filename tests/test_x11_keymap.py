@@ -0,0 +1,214 @@
+'''
+Tests for the key plans of PyKeyboard on X11, with a fake display.
+
+to start:
+
+    nosetests -v tests/test_x11_keymap.py
+'''
+
+from unittest import TestCase
+import gc
+import weakref
+
+from fake_xdisplay import Event, FakeDisplay, keysyms
+
+from Xlib import X
+
+from pymouse import x11_display
+from pykeyboard import x11, x11_keymap
+from pykeyboard.x11_keymap import KeyPlan, Keymap, keymap
+
+SHIFT, MODE_SWITCH, LEVEL3 = 8, 11, 12
+SPARE = (14, 15)
+
+ROWS = [keysyms('Shift_L'),  # 8
+        keysyms('a', 'A'),
+        keysyms('b', 'B'),
+        keysyms('Mode_switch'),  # 11
+        keysyms('ISO_Level3_Shift'),  # 12
+        keysyms('c', 'C', 'ccedilla', 'Ccedilla', 'eacute'),
+        [],  # 14, spare
+        [],  # 15, spare
+        keysyms('Return'),
+        keysyms('1', 'exclam'),
+        keysyms('B')]  # 18
+
+
+def fake_display():
+    return FakeDisplay(ROWS, [[SHIFT]], width=6)
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.display = fake_display()
+        self.addCleanup(self.display.close)
+        self.keymap = keymap(self.display)
+
+    def test_levels(self):
+        plan = self.keymap.plan
+        self.assertEqual(KeyPlan(9, (), 0), plan('a'))
+        self.assertEqual(KeyPlan(9, (SHIFT,), 1), plan('A'))
+        self.assertEqual(KeyPlan(17, (SHIFT,), 1), plan('!'))
+        self.assertEqual(KeyPlan(13, (MODE_SWITCH,), 2), plan('\xe7'))
+        self.assertEqual(KeyPlan(13, (MODE_SWITCH, SHIFT), 3), plan('\xc7'))
+        self.assertEqual(KeyPlan(13, (LEVEL3,), 4), plan('\xe9'))
+
+    def test_lowest_level(self):
+        #Without Shift on keycode 18, rather than with it on 10
+        self.assertEqual(KeyPlan(18, (), 0), self.keymap.plan('B'))
+
+    def test_names_and_keycodes(self):
+        plan = self.keymap.plan
+        self.assertEqual(KeyPlan(16, (), 0), plan('Return'))
+        self.assertEqual(KeyPlan(16, (), 0), plan('\n'))
+        self.assertEqual(KeyPlan(42, (), 0), plan(42))
+        self.assertEqual(0, plan('F35').keycode)
+
+    def test_one_mapping_request(self):
+        for character in 'abcABC1!':
+            self.keymap.plan(character)
+        self.assertEqual(1, len([entry for entry in self.display.log
+                                 if entry[0] == 'get_keyboard_mapping']))
+
+    def test_released_with_display(self):
+        display = fake_display()
+        keymap(display).plans()
+        self.assertIn(display, x11_keymap._keymaps)
+        #The entry goes with the display
+        entry = weakref.ref(x11_keymap._keymaps[display])
+        reference = weakref.ref(display)
+        display.close()
+        del display
+        gc.collect()
+        self.assertIsNone(reference())
+        self.assertIsNone(entry())
+
+
+#A keyboard with two spare keycodes, 10 and 11
+BINDING_ROWS = [keysyms('Shift_L'),
+                keysyms('a', 'A'),
+                [],
+                [],
+                keysyms('Return')]
+U, SZ = keysyms('udiaeresis', 'ssharp')
+#The Unicode keysym, as for any character outside latin1
+EURO = 0x10020ac
+
+
+def mapping_requests(display, name):
+    return [entry for entry in display.log if entry[0] == name]
+
+
+class TestBinding(TestCase):
+    def setUp(self):
+        self.display = FakeDisplay(BINDING_ROWS, [[8]])
+        self.addCleanup(self.display.close)
+        self.keymap = Keymap(self.display)
+
+    def test_bind(self):
+        self.keymap.bind('\xfc\xdf')
+        #The spare keycodes are changed with a single request
+        self.assertEqual([('change_keyboard_mapping', 10, [SZ, U])],
+                         mapping_requests(self.display,
+                                          'change_keyboard_mapping'))
+        self.assertEqual(KeyPlan(11, (), 0), self.keymap.plan('\xfc'))
+        self.assertEqual(KeyPlan(10, (), 0), self.keymap.plan('\xdf'))
+        self.assertNotIn('sync', self.display.log)
+
+    def test_eviction_order(self):
+        self.keymap.bind('\xfc\xdf')
+        self.keymap.bind('\xfc')
+        del self.display.log[:]
+        self.keymap.bind('\u20ac')
+        #The least recently used character makes room, once the server has
+        #processed the key events sent for it
+        self.assertEqual(['sync', ('change_keyboard_mapping', 10, [EURO])],
+                         self.display.log)
+        self.assertEqual(KeyPlan(10, (), 0), self.keymap.plan('\u20ac'))
+        self.assertEqual(KeyPlan(11, (), 0), self.keymap.plan('\xfc'))
+
+    def test_first_characters_bound(self):
+        self.keymap.bind('\xfc\xdf\u20ac')
+        plans = self.keymap.plans()
+        self.assertEqual(['\xdf', '\xfc'],
+                         sorted(c for c in '\xfc\xdf\u20ac' if c in plans))
+
+    def test_restore_on_release(self):
+        self.keymap.acquire()
+        self.keymap.acquire()
+        self.keymap.bind('\xfc')
+        self.keymap.release()
+        self.assertEqual([U], self.display.rows[3][:1])
+        self.keymap.release()
+        self.assertEqual(('change_keyboard_mapping', 11, [0]),
+                         mapping_requests(self.display,
+                                          'change_keyboard_mapping')[-1])
+        self.assertEqual('flush', self.display.log[-1])
+        self.assertEqual([0, 0], self.display.rows[3][:2])
+
+    def test_own_mapping_notify_ignored(self):
+        self.keymap.bind('\xfc')
+        self.keymap.plans()
+        self.assertEqual(1, len(mapping_requests(self.display,
+                                                 'get_keyboard_mapping')))
+        self.assertEqual(KeyPlan(11, (), 0), self.keymap.plan('\xfc'))
+
+    def test_foreign_mapping_notify(self):
+        self.keymap.bind('\xfc')
+        self.keymap.plans()
+        self.display.rows[1] = keysyms('b', 'B')
+        self.display.receive(Event(type=X.MappingNotify,
+                                   request=X.MappingKeyboard,
+                                   first_keycode=9, count=1))
+        self.assertEqual(KeyPlan(9, (), 0), self.keymap.plan('b'))
+        self.assertEqual(2, len(mapping_requests(self.display,
+                                                 'get_keyboard_mapping')))
+        #Still bound after the rebuild
+        self.assertEqual(KeyPlan(11, (), 0), self.keymap.plan('\xfc'))
+
+
+class TestTypeString(TestCase):
+    def setUp(self):
+        self.display = FakeDisplay(BINDING_ROWS, [[8]])
+        self.addCleanup(self.display.close)
+        display_class = x11_display.Display
+        fake_input = x11.fake_input
+        x11_display.Display = lambda name: self.display
+        x11.fake_input = lambda display, type, detail: display.log.append(
+            (type, detail))
+
+        def restore():
+            x11_display.Display = display_class
+            x11.fake_input = fake_input
+        self.addCleanup(restore)
+
+    def test_spare_keycodes_run_out(self):
+        keyboard = x11.PyKeyboard(':keymap-test')
+        keyboard.type_string('\xfc\xdf\u20ac\xfc', window_time=60)
+        log = [entry for entry in self.display.log
+               if entry[0] == 'change_keyboard_mapping' or
+               entry == 'sync' or entry[0] == X.KeyPress]
+        self.assertEqual([('change_keyboard_mapping', 10, [SZ, U]),
+                          (X.KeyPress, 11),
+                          (X.KeyPress, 10),
+                          'sync',
+                          ('change_keyboard_mapping', 10, [EURO]),
+                          (X.KeyPress, 10),
+                          (X.KeyPress, 11),
+                          'sync'], log)
+        #The last user gives the spare keycodes back
+        del keyboard
+        self.assertEqual([[0] * 4] * 2, self.display.rows[2:4])
+
+    def test_batch(self):
+        keyboard = x11.PyKeyboard(':' + self.id())
+        with keyboard.batch():
+            keyboard.press_key(9)
+            keyboard.release_key(9)
+            self.assertNotIn('sync', self.display.log)
+        self.assertEqual([(X.KeyPress, 9), (X.KeyRelease, 9), 'sync'],
+                         [entry for entry in self.display.log
+                          if entry == 'sync' or entry[0] in (X.KeyPress,
+                                                             X.KeyRelease)])
+        keyboard.press_key(9)
+        self.assertEqual('sync', self.display.log[-1])
@@ -0,0 +1,121 @@
+'''
+Tests for the monitor layout of an X display, with a fake display.
+
+to start:
+
+    nosetests -v tests/test_x11_monitors.py
+'''
+
+from unittest import TestCase
+import gc
+import os
+import weakref
+
+from pymouse import x11_monitors
+from pymouse.x11_monitors import MonitorLayout, monitor_layout
+
+
+class Version(object):
+    def __init__(self, major, minor):
+        self.major_version = major
+        self.minor_version = minor
+
+
+class Extension(object):
+    first_event = 89
+
+
+class Screen(object):
+    width_in_pixels = 1920
+    height_in_pixels = 1080
+
+    def __init__(self, root):
+        self.root = root
+
+
+class Root(object):
+    def xrandr_select_input(self, mask):
+        pass
+
+    def xrandr_get_monitors(self):
+        raise AssertionError('RandR 1.5 request sent')
+
+
+class ScreenInfo(object):
+    def __init__(self, x, width):
+        self.x = x
+        self.y = 0
+        self.width = width
+        self.height = 1080
+
+
+class Protocol(object):
+    def __init__(self):
+        self.event_queue = []
+
+
+class FakeDisplay(object):
+    """A server with RandR 1.4 and two Xinerama screens."""
+    def __init__(self):
+        self.root = Root()
+        self.display = Protocol()
+        self._read, self._write = os.pipe()
+
+    def close(self):
+        os.close(self._read)
+        os.close(self._write)
+
+    def fileno(self):
+        return self._read
+
+    def has_extension(self, name):
+        return name in ('RANDR', 'XINERAMA')
+
+    def query_extension(self, name):
+        return Extension()
+
+    def xrandr_query_version(self):
+        return Version(1, 4)
+
+    def xinerama_is_active(self):
+        return True
+
+    def xinerama_query_screens(self):
+        class Reply(object):
+            screens = [ScreenInfo(0, 1920), ScreenInfo(1920, 1280)]
+        return Reply()
+
+    def screen(self):
+        return Screen(self.root)
+
+    def flush(self):
+        pass
+
+
+class Test(TestCase):
+    def test_randr_before_monitors(self):
+        display = FakeDisplay()
+        self.addCleanup(display.close)
+        layout = MonitorLayout(display)
+        monitors = layout._query()
+        self.assertEqual([(0, 1920, True), (1920, 1280, False)],
+                         [(m.x, m.width, m.primary) for m in monitors])
+
+    def test_check_events(self):
+        display = FakeDisplay()
+        self.addCleanup(display.close)
+        monitors = monitor_layout(display).monitors()
+        self.assertEqual(2, len(monitors))
+
+    def test_cache_released(self):
+        display = FakeDisplay()
+        monitor_layout(display).monitors(check=False)
+        self.assertIn(display, x11_monitors._layouts)
+        #The entry goes with the display
+        entry = weakref.ref(x11_monitors._layouts[display])
+        reference = weakref.ref(display)
+        display.close()
+        del display
+        gc.collect()
+        self.assertIsNone(reference())
+        self.assertIsNone(entry())
@@ -0,0 +1,202 @@
+'''
+Tests for PyMouse on X11, with a fake display.
+
+to start:
+
+    nosetests -v tests/test_x11_mouse.py
+'''
+
+from unittest import TestCase
+import gc
+
+from fake_xdisplay import FakeDisplay, fake_input
+
+from Xlib import X
+
+from pymouse import x11, x11_display
+from pymouse.x11 import PointerTracker
+
+positions = [(0, 5), (10, 20), (-10, -20), (2222, 2222)]
+
+
+def sends(display):
+    """The flushes and syncs of the display's log."""
+    return [entry for entry in display.log if entry in ('flush', 'sync')]
+
+
+class FakeDisplayTest(TestCase):
+    """Makes PyMouse open a fake display."""
+    def setUp(self):
+        self.display = FakeDisplay(size=(100, 200))
+        self.addCleanup(self.display.close)
+        display_class = x11_display.Display
+        xtest_fake_input = x11.fake_input
+        x11_display.Display = lambda name: self.display
+        x11.fake_input = fake_input
+
+        def restore():
+            x11_display.Display = display_class
+            x11.fake_input = xtest_fake_input
+        self.addCleanup(restore)
+
+
+class TestBatch(FakeDisplayTest):
+    def test_batch(self):
+        mouse = x11.PyMouse(':mouse-test')
+        with mouse.batch():
+            for p in positions:
+                mouse.move(*p)
+            mouse.click(*positions[0])
+            #Nothing sent yet, nor any round trip made
+            self.assertEqual([], sends(self.display))
+            self.assertNotIn('query_pointer', self.display.log)
+        self.assertEqual(['sync'], sends(self.display))
+        self.assertEqual([(X.MotionNotify, x, y) for x, y in positions],
+                         self.display.log[:len(positions)])
+
+    def test_nested(self):
+        mouse = x11.PyMouse(':mouse-test')
+        with mouse.batch(sync=False):
+            with mouse.batch():
+                mouse.move(1, 1)
+            self.assertEqual([], sends(self.display))
+            mouse.move(2, 2)
+        self.assertEqual(['flush'], sends(self.display))
+
+    def test_unbatched(self):
+        mouse = x11.PyMouse(':mouse-test')
+        for p in positions:
+            mouse.move(*p)
+        self.assertEqual(['sync'] * len(positions), sends(self.display))
+
+
+class Listener(object):
+    """Stands for the RECORD listener of a PointerTracker."""
+    def __init__(self, tracker, display=None):
+        self.stopped = None
+
+    def start(self):
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+
+class TestPointerTracker(TestCase):
+    def setUp(self):
+        pointer_listener = x11._PointerListener
+        x11._PointerListener = Listener
+
+        def restore():
+            x11._PointerListener = pointer_listener
+        self.addCleanup(restore)
+        self.tracker = PointerTracker()
+
+    def test_injected(self):
+        self.assertIsNone(self.tracker.position())
+        self.tracker.injected(1, 2)
+        self.assertEqual((1, 2), self.tracker.position())
+
+    def test_stale(self):
+        self.tracker.injected(1, 2)
+        self.tracker.max_age = -1
+        self.assertIsNone(self.tracker.position())
+
+    def test_observed(self):
+        self.tracker.observed(3, 4)
+        self.assertEqual((3, 4), self.tracker.position())
+
+    def test_late_events(self):
+        tracker = self.tracker
+        tracker.injected(1, 1)
+        tracker.injected(2, 2)
+        #The echo of the first motion, and a motion processed before ours,
+        #do not roll the position back
+        tracker.observed(1, 1)
+        self.assertEqual((2, 2), tracker.position())
+        tracker.observed(5, 5)
+        self.assertEqual((2, 2), tracker.position())
+        #Once all the motions are echoed, the others count again
+        tracker.observed(2, 2)
+        tracker.observed(7, 7)
+        self.assertEqual((7, 7), tracker.position())
+
+    def test_queried(self):
+        self.tracker.injected(1, 1)
+        self.tracker.queried(6, 6)
+        self.tracker.observed(8, 8)
+        self.assertEqual((8, 8), self.tracker.position())
+
+    def test_without_listener(self):
+        tracker = PointerTracker(listen=False)
+        tracker.injected(1, 1)
+        tracker.observed(9, 9)
+        self.assertEqual((9, 9), tracker.position())
+
+    def test_stop(self):
+        listener = self.tracker.listener
+        self.assertFalse(listener.stopped)
+        self.tracker.stop()
+        self.assertTrue(listener.stopped)
+        self.assertIsNone(self.tracker.listener)
+
+
+class TestTrackedMove(FakeDisplayTest):
+    def test_tracked_move(self):
+        mouse = x11.PyMouse(':mouse-test',
+                            tracker=PointerTracker(listen=False))
+        for p in positions:
+            mouse.move(*p)
+            #Kept on the screen, as the server would
+            self.assertEqual(mouse.clamp(*p), mouse.position())
+        #Only the first move asks the server where the pointer is
+        self.assertEqual(1, self.display.log.count('query_pointer'))
+
+    def test_redundant_move(self):
+        mouse = x11.PyMouse(':mouse-test',
+                            tracker=PointerTracker(listen=False))
+        mouse.move(10, 10)
+        mouse.move(10, 10)
+        self.assertEqual([(X.MotionNotify, 10, 10)],
+                         [entry for entry in self.display.log
+                          if entry[0] == X.MotionNotify])
+
+    def test_batched_stale(self):
+        mouse = x11.PyMouse(':mouse-test',
+                            tracker=PointerTracker(listen=False))
+        with mouse.batch():
+            mouse.move(10, 10)
+            mouse.tracker.max_age = -1
+            mouse.move(20, 20)
+            #No query flushing the batch, the motions are queued
+            self.assertNotIn('query_pointer', self.display.log)
+            self.assertEqual([], sends(self.display))
+        self.assertEqual([(X.MotionNotify, 10, 10), (X.MotionNotify, 20, 20)],
+                         [entry for entry in self.display.log
+                          if entry[0] == X.MotionNotify])
+
+
+class TestOwnTracker(FakeDisplayTest):
+    def setUp(self):
+        FakeDisplayTest.setUp(self)
+        pointer_listener = x11._PointerListener
+        x11._PointerListener = Listener
+
+        def restore():
+            x11._PointerListener = pointer_listener
+        self.addCleanup(restore)
+
+    def test_stopped_with_mouse(self):
+        mouse = x11.PyMouse(':mouse-test', tracker=True)
+        listener = mouse.tracker.listener
+        self.assertFalse(listener.stopped)
+        del mouse
+        gc.collect()
+        self.assertTrue(listener.stopped)
+
+    def test_shared_left_running(self):
+        tracker = PointerTracker()
+        mouse = x11.PyMouse(':mouse-test', tracker=tracker)
+        del mouse
+        gc.collect()
+        self.assertFalse(tracker.listener.stopped)
@@ -0,0 +1,68 @@
+'''
+Tests for decoding RECORD reply data. These do not need a display.
+
+to start:
+
+    nosetests -v tests/test_x11_record.py
+'''
+
+from unittest import TestCase
+
+from Xlib import X
+from Xlib.protocol import event
+
+from pymouse import x11_record
+from pymouse.x11_record import decode_events, event_batch, record_ranges, _core
+
+
+class ProtocolDisplay(object):
+    event_classes = event.event_class
+
+    def get_resource_class(self, class_name, default=None):
+        return default
+
+
+def pack(etype, detail, x, y, state=0):
+    return _core.pack(etype, detail, 1, 1000, 0x100, 0x100, 0, x, y, x, y,
+                      state, 1)
+
+
+class Test(TestCase):
+    def test_empty(self):
+        self.assertEqual([], decode_events(b''))
+
+    def test_core_events(self):
+        data = pack(X.ButtonPress, 1, 10, 20) + pack(X.MotionNotify, 0, -5, 7)
+        events = decode_events(data)
+        self.assertEqual([(X.ButtonPress, 1, 10, 20), (X.MotionNotify, 0, -5, 7)],
+                         [(e.type, e.detail, e.root_x, e.root_y) for e in events])
+
+    def test_unknown_event(self):
+        focus_in = bytes([X.FocusIn, 0]) + b'\0' * 30
+        data = pack(X.KeyPress, 38, 0, 0, state=1) + focus_in + \
+            pack(X.KeyRelease, 38, 0, 0)
+        events = decode_events(memoryview(data), ProtocolDisplay())
+        self.assertEqual([X.KeyPress, X.FocusIn, X.KeyRelease],
+                         [e.type for e in events])
+        self.assertEqual(1, events[0].state)
+
+    def test_record_ranges(self):
+        ranges = record_ranges([X.MotionNotify, X.KeyPress, X.ButtonPress,
+                                X.KeyRelease])
+        self.assertEqual([(X.KeyPress, X.ButtonPress),
+                          (X.MotionNotify, X.MotionNotify)],
+                         [r['device_events'] for r in ranges])
+        self.assertEqual([], record_ranges([]))
+
+    def test_event_batch(self):
+        focus_in = bytes([X.FocusIn, 0]) + b'\0' * 30
+        data = pack(X.ButtonPress, 1, 10, 20) + focus_in + \
+            pack(X.MotionNotify, 0, -5, 7)
+        batch = event_batch(data, decode_events(data, ProtocolDisplay()))
+        if x11_record.numpy is not None:
+            self.assertEqual([X.ButtonPress, X.MotionNotify],
+                             batch['type'].tolist())
+            self.assertEqual([10, -5], batch['root_x'].tolist())
+        else:
+            self.assertEqual([(X.ButtonPress, 10), (X.MotionNotify, -5)],
+                             [(e.type, e.root_x) for e in batch])